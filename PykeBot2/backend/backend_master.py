@@ -7,10 +7,16 @@ When finished sets the payload field of the query with data object.
 
 import logging
 import asyncio
+from dataclasses import dataclass, field
+import itertools
+import time
+from typing import Callable, Dict, Hashable, List, Set, Tuple
+import aiohttp
 from PykeBot2.models.data_models import (
     Error,
     Message,
     Payload,
+    Progress,
     Team,
     TeamListList,
     TeamList,
@@ -18,7 +24,13 @@ from PykeBot2.models.data_models import (
 from PykeBot2.models.query import Query
 from PykeBot2.models.errors import TokenLoadingError
 from PykeBot2.utils import token_loader
+from PykeBot2.backend.worker_pool import WorkerPool
+from PykeBot2.backend.single_flight import SingleFlight
+from PykeBot2.backend.result_cache import ResultCache
+from PykeBot2.backend.rank_store import RankStore
+from PykeBot2.backend.progress import StalkProgress, format_duration, report_progress
 from PykeBot2.backend.stalker import op_gg_rank, prime_league, battlefy
+from PykeBot2.backend.stalker.streaming import StalkUpdate, collect_stream
 from PykeBot2.backend.stalker import (
     toornament_api,
     riot_api_rank,
@@ -41,6 +53,16 @@ from PykeBot2.models.lookup_tables import (
     dont_use_api_flag_lookup,
     used_toornament_api_flag_lookup,
     used_riot_api_flag_lookup,
+    backend_max_concurrent_queries,
+    backend_lane_limits,
+    fresh_flag_lookup,
+    result_cache_max_bytes,
+    result_cache_ttl_per_platform,
+    result_cache_default_ttl,
+    partial_flag_lookup,
+    streamed_flag_lookup,
+    query_timeout,
+    interactive_priority,
 )
 
 logger = logging.getLogger("pb_logger")
@@ -66,119 +88,567 @@ website_type_to_summoners_inn_stalker = {
 
 website_type_to_battlefy_stalker = {"tournament": battlefy.stalk_battlefy_tournament}
 
+"""
+Streaming versions of stalkers, their partial results are sent to the user while the stalk is running.
+"""
+stalker_to_streaming_stalker = {
+    prime_league.stalk_prime_league_season: prime_league.stream_prime_league_season,
+    toornament.stalk_toornament_tournament: toornament.stream_toornament_tournament,
+    battlefy.stalk_battlefy_tournament: battlefy.stream_battlefy_tournament,
+}
+
+"""
+Short names of the supported websites, also used as worker pool lanes.
+"""
+prime_league_str = "prime_league"
+toornament_str = "toornament"
+summoners_inn_str = "summoners_inn"
+battlefy_str = "battlefy"
+
+"""
+Stalkers that are expensive enough to get their own worker pool lane instead of the lane of their website.
+"""
+stalker_to_heavy_lane = {
+    prime_league.stalk_prime_league_season: "prime_league_season",
+}
+
+"""
+Worker pool lanes for the rank stalkers.
+"""
+op_gg_lane = "op_gg"
+riot_api_lane = "riot_api"
+
+"""
+Identifies the progress message of each query, so the frontend can edit it in place.
+"""
+progress_keys = itertools.count()
+
+
+@dataclass
+class RunningStalk:
+    """
+    :description: State of a running stalk that is shared with every query waiting for it.
+    """
+
+    progress: StalkProgress = field(default_factory=StalkProgress)
+    # monotonic times of the stages of the stalk, e.g. stalk_end, copied to every waiting query
+    stage_times: Dict[str, float] = field(default_factory=dict)
+    # every waiting query receives the partial results
+    partial_listeners: List[Callable[[Payload], None]] = field(default_factory=list)
+
+
+@dataclass
+class BackendResources:
+    """
+    :description: Shared objects used by every query handled by the backend.
+    """
+
+    pool: WorkerPool
+    session: aiohttp.ClientSession = None
+    rank_store: RankStore = None
+    in_flight: SingleFlight = field(default_factory=SingleFlight)
+    running_stalks: Dict[Hashable, RunningStalk] = field(default_factory=dict)
+    # the task handling each running query, used to cancel them
+    active_queries: Dict[asyncio.Task, Query] = field(default_factory=dict)
+    # tasks cancelled on request of the user, other cancellations come from the shutdown of the backend
+    cancel_requested: Set[asyncio.Task] = field(default_factory=set)
+    cache: ResultCache = field(
+        default_factory=lambda: ResultCache(
+            result_cache_max_bytes,
+            result_cache_ttl_per_platform,
+            result_cache_default_ttl,
+        )
+    )
 
-async def backend_loop(forward_queue: asyncio.Queue, backend_queue: asyncio.Queue):
+
+async def backend_loop(
+    forward_queue: asyncio.Queue,
+    backend_queue: asyncio.Queue,
+    session: aiohttp.ClientSession = None,
+    rank_store: RankStore = None,
+    max_workers: int = backend_max_concurrent_queries,
+    lane_limits: Dict[str, int] = None,
+):
     """
     :description: Main Coroutine for the backend. Responsible for calling stalker functions.
+    Every query is handled as its own task in a worker pool, so a slow stalk does not block other queries.
+    Each stalk query gets a deadline of query_timeout seconds unless it already carries one.
     :param forward_queue: The Queue which is handled by the forwarder of the main event loop.
     :type forward_queue: asyncio.Queue
     :param backend_queue: The Queue that is handled by this Coroutine.
     :type backend_queue: asyncio.Queue
+    :param session: The process wide http session that is handed to every stalker.
+    If None is given, every stalker creates its own session.
+    :type session: aiohttp.ClientSession
+    :param rank_store: The persistent rank store used by the rank stalkers, if None every rank is stalked.
+    :type rank_store: RankStore
+    :param max_workers: The maximum number of queries that are handled at the same time.
+    :type max_workers: int
+    :param lane_limits: Maps each stalker family (website or rank stalker) to the maximum number of its queries
+    handled at the same time, standard is backend_lane_limits.
+    :type lane_limits: Dict[str, int]
     :return: None
     :rtype: None
     """
-    while True:
-        query = await backend_queue.get()
-
-        # check next_step to perform
-        if query.next_step == "stalk":
-            stalker = determine_stalker(query)
-            logger.debug(f"Using stalker function {stalker.__name__}")
+    if lane_limits is None:
+        lane_limits = backend_lane_limits
+    resources = BackendResources(
+        WorkerPool(max_workers, lane_limits), session, rank_store
+    )
+    try:
+        while True:
+            query = await backend_queue.get()
+
+            # check next_step to perform
+            if query.next_step == "stalk":
+                if query.deadline is None:
+                    query.deadline = asyncio.get_running_loop().time() + query_timeout
+                resources.pool.submit(
+                    handle_query(query, forward_queue, backend_queue, resources),
+                    name=f"stalk {query.raw_command}",
+                )
 
-            if stalker is None:
-                # if stalker is none an error has occurred during stalker determination and saved to query
+            elif query.next_step == "cancel":
+                cancel_queries(query, resources)
                 forward_queue.put_nowait(query)
                 backend_queue.task_done()
-                continue
-
-            # check flags
-            ranks = False
-            if len(with_ranks_flag_lookup.intersection(query.flags)) >= 1:
-                ranks = True
-
-            # extra case for prime league season with ranks
-            # in this case a message should inform the user that this might take a moment
-            if stalker is prime_league.stalk_prime_league_season and ranks:
-                extra_message = Message(
-                    "Running prime league season stalk with ranks might take a while, also output "
-                    "only as file."
-                )
-                extra_query = Query(
-                    query.context_type,
-                    "frontend",
-                    "format",
-                    discord_channel=query.discord_channel,
-                    payload=extra_message,
-                )
-                forward_queue.put_nowait(extra_query)
-                query.update_query(query.forward_to, query.next_step, flags="file")
-
-            logger.debug(f"Starting stalk for query: {query.raw_command}")
-            try:
-                payload = await stalker(query.data)
-            # TODO add better error handling based on exception raised
-            except Exception as e:
-                error_message = (
-                    f"While stalking a {type(e)} occurred. Original query: {query}"
+
+            # new backend tasks should be added here
+            else:
+                logger.error(
+                    f"Invalid control flow in backend master for query {str(query)}, discarding query."
                 )
-                logger.exception(error_message)
-                create_error(query, error_message)
-                forward_queue.put_nowait(query)
+                del query
                 backend_queue.task_done()
-                continue
-            logger.debug(f"Finished stalking for query: {query.raw_command}")
-
-            # rank stalking is the slowest part and for mid to large sized tournaments it takes some time
-            if isinstance(payload, TeamList):
-                if len(payload.teams) > 30 and ranks:
-                    extra_message = Message(
-                        f"Rank stalk for {len(payload.teams)} teams might take a moment, please "
-                        f"wait."
-                    )
-                    extra_query = Query(
-                        query.context_type,
-                        "frontend",
-                        "format",
-                        discord_channel=query.discord_channel,
-                        payload=extra_message,
-                    )
-                    forward_queue.put_nowait(extra_query)
-
-            if ranks:
-                logger.debug(f"Starting rank stalk for query: {query.raw_command}")
-                # try loading a Riot Api Token
-                found_riot_token = False
-                try:
-                    token_loader.load_token("RiotToken")
-                    found_riot_token = True
-                except TokenLoadingError as e:
-                    logger.info("Failed to load RiotToken, using op.gg instead.")
-                if (
-                    found_riot_token
-                    and len(query.flags.intersection(dont_use_api_flag_lookup)) == 0
-                ):
-                    await call_rank_stalker(payload, use_api=True)
-                    query.flags.add(*used_riot_api_flag_lookup)
-                else:
-                    await call_rank_stalker(payload)
-                logger.debug(f"Finished rank stalk for query: {query.raw_command}")
-
-            # adds data to db
-            # TODO don't forget to add data
-
-            query.update_query("frontend", "format", payload=payload)
-
-            # forward query
-            forward_queue.put_nowait(query)
-
-        # new backend tasks should be added here
+    finally:
+        await resources.pool.shutdown()
+
+
+async def handle_query(
+    query: Query,
+    forward_queue: asyncio.Queue,
+    backend_queue: asyncio.Queue,
+    resources: BackendResources,
+):
+    """
+    :description: Runs a single stalk query and forwards it afterwards. Errors are saved to the query as Error payload.
+    A query that passes its deadline is stopped with an Error, a query cancelled by the user is dropped silently,
+    as the cancel command is answered on its own.
+    Marks the query as done in the backend queue once it was forwarded.
+    :param query: The handled Query.
+    :type query: Query
+    :param forward_queue: The Queue which is handled by the forwarder of the main event loop.
+    :type forward_queue: asyncio.Queue
+    :param backend_queue: The Queue the query was taken from.
+    :type backend_queue: asyncio.Queue
+    :param resources: The shared worker pool, http session, in flight stalks and result cache of the backend.
+    :type resources: BackendResources
+    :return: None
+    :rtype: None
+    """
+    task = asyncio.current_task()
+    resources.active_queries[task] = query
+    timeout = None
+    if query.deadline is not None:
+        timeout = max(query.deadline - asyncio.get_running_loop().time(), 0)
+    try:
+        await asyncio.wait_for(stalk_query(query, forward_queue, resources), timeout)
+    except asyncio.CancelledError:
+        backend_queue.task_done()
+        if task in resources.cancel_requested:
+            logger.info(f"Cancelled query on request: {query.raw_command}")
+            return
+        raise
+    except asyncio.TimeoutError:
+        error_message = (
+            f"Stopped the stalk as it did not finish within {format_duration(timeout)}. "
+            f"Original query: {query}"
+        )
+        logger.warning(error_message)
+        create_error(query, error_message)
+    except Exception as e:
+        error_message = f"While handling a {type(e)} occurred. Original query: {query}"
+        logger.exception(error_message)
+        create_error(query, error_message)
+    finally:
+        resources.active_queries.pop(task, None)
+        resources.cancel_requested.discard(task)
+
+    forward_queue.put_nowait(query)
+    backend_queue.task_done()
+
+
+def cancel_queries(query: Query, resources: BackendResources):
+    """
+    :description: Cancels every running stalk query that was sent in the same context as the given cancel query,
+    e.g. the same discord channel. The cancellation reaches the worker pool slot, the rate limiter waits,
+    the requests and, if no other query waits for the same stalk, the stalk itself including its browser session.
+    Saves a Message with the number of cancelled queries as payload.
+    :param query: The cancel query.
+    :type query: Query
+    :param resources: The shared worker pool, http session, in flight stalks and result cache of the backend.
+    :type resources: BackendResources
+    :return: None
+    :rtype: None
+    """
+    cancelled = 0
+    for task, running_query in list(resources.active_queries.items()):
+        if task.done() or task in resources.cancel_requested:
+            continue
+        if (
+            running_query.context_type != query.context_type
+            or running_query.discord_channel != query.discord_channel
+        ):
+            continue
+        resources.cancel_requested.add(task)
+        task.cancel()
+        cancelled += 1
+
+    if cancelled == 0:
+        content = "There is no running stalk to cancel."
+    elif cancelled == 1:
+        content = "Cancelled 1 running stalk."
+    else:
+        content = f"Cancelled {cancelled} running stalks."
+    logger.info(f"{content} Original query: {query}")
+    query.update_query("frontend", "format", payload=Message(content))
+
+
+async def stalk_query(
+    query: Query, forward_queue: asyncio.Queue, resources: BackendResources
+):
+    """
+    :description: Determines the stalker for the query, calls it and adds ranks if requested.
+    Recent results are served from the result cache unless the fresh flag is set.
+    Queries with the same canonical url and flags as a stalk that is already running join that stalk
+    instead of starting their own.
+    Partial results of streaming stalkers are sent to every waiting query as soon as they are ready.
+    A stalk that takes a while is reported in a single progress message per query, which is updated periodically.
+    Afterwards the query holds the payload or an Error and is ready to be forwarded to the frontend.
+    :param query: The handled Query.
+    :type query: Query
+    :param forward_queue: Used for sending additional status messages to the user.
+    :type forward_queue: asyncio.Queue
+    :param resources: The shared worker pool, http session, in flight stalks and result cache of the backend.
+    :type resources: BackendResources
+    :return: None
+    :rtype: None
+    """
+    query.mark("stalk_start")
+    stalker = determine_stalker(query)
+
+    if stalker is None:
+        # if stalker is none an error has occurred during stalker determination and saved to query
+        return
+
+    logger.debug(f"Using stalker function {stalker.__name__}")
+
+    # check flags
+    ranks = False
+    if len(with_ranks_flag_lookup.intersection(query.flags)) >= 1:
+        ranks = True
+    use_api = len(dont_use_api_flag_lookup.intersection(query.flags)) == 0
+    fresh = len(fresh_flag_lookup.intersection(query.flags)) >= 1
+
+    # extra case for prime league season with ranks
+    # in this case a message should inform the user that this might take a moment
+    if stalker is prime_league.stalk_prime_league_season and ranks:
+        send_message(
+            query,
+            forward_queue,
+            "Running prime league season stalk with ranks might take a while, groups are shown "
+            "as soon as they are found, the ranked output follows only as file.",
+        )
+        query.update_query(
+            query.forward_to, query.next_step, data=query.data, flags={"file"}
+        )
+
+    key = (canonicalize_url(query.data), ranks, use_api)
+
+    if not fresh:
+        cached = resources.cache.get(key)
+        if cached is not None:
+            logger.debug(f"Using cached result for query: {query.raw_command}")
+            payload, result_flags = cached
+            query.update_query(
+                "frontend", "format", flags=result_flags, payload=payload
+            )
+            return
+
+    url = query.data
+
+    running = resources.running_stalks.setdefault(key, RunningStalk())
+
+    def on_partial(partial: Payload):
+        for listener in list(running.partial_listeners):
+            listener(partial)
+
+    async def stalk_and_cache():
+        result = await run_stalk(
+            stalker,
+            url,
+            ranks,
+            use_api,
+            resources,
+            running.progress,
+            on_partial,
+            query.priority,
+            running.stage_times,
+        )
+        resources.cache.put(key, determine_website(url), *result)
+        return result
+
+    streamed = False
+
+    def deliver_partial(partial: Payload):
+        nonlocal streamed
+        if isinstance(partial, TeamList) and len(partial.teams) == 0:
+            return
+        if isinstance(partial, TeamListList) and len(partial.team_lists) == 0:
+            return
+        streamed = True
+        send_partial(query, forward_queue, partial)
+
+    running.partial_listeners.append(deliver_partial)
+
+    progress_key = next(progress_keys)
+
+    stopped = False
+    failed = False
+
+    def deliver_progress(content: str, finished: bool):
+        if finished and (stopped or failed):
+            content = running.progress.render(
+                finished=True, stopped=stopped, failed=failed
+            )
+        send_progress(query, forward_queue, content, progress_key, finished)
+
+    reporter = asyncio.ensure_future(report_progress(running.progress, deliver_progress))
+
+    logger.debug(f"Starting stalk for query: {query.raw_command}")
+    try:
+        payload, result_flags = await resources.in_flight.run(key, stalk_and_cache)
+    # TODO add better error handling based on exception raised
+    except Exception as e:
+        failed = True
+        error_message = f"While stalking a {type(e)} occurred. Original query: {query}"
+        logger.exception(error_message)
+        create_error(query, error_message)
+        return
+    except asyncio.CancelledError:
+        # cancelled by the user or the deadline of the query
+        stopped = True
+        raise
+    finally:
+        reporter.cancel()
+        await asyncio.gather(reporter, return_exceptions=True)
+        running.partial_listeners.remove(deliver_partial)
+        if (
+            len(running.partial_listeners) == 0
+            and resources.running_stalks.get(key) is running
+        ):
+            del resources.running_stalks[key]
+    logger.debug(f"Finished stalking for query: {query.raw_command}")
+    for stage, at in running.stage_times.items():
+        query.mark(stage, at)
+
+    if streamed:
+        result_flags = result_flags | streamed_flag_lookup
+    query.update_query("frontend", "format", flags=result_flags, payload=payload)
+
+
+async def run_stalk(
+    stalker,
+    url: str,
+    ranks: bool,
+    use_api: bool,
+    resources: BackendResources,
+    progress: StalkProgress = None,
+    on_partial: Callable[[Payload], None] = None,
+    priority: int = interactive_priority,
+    stage_times: Dict[str, float] = None,
+) -> Tuple[Payload, Set[str]]:
+    """
+    :description: Calls the stalker on the url and adds ranks if requested.
+    If the stalker has a streaming version, it is used instead and its partial results are handed to on_partial.
+    The result may be shared by multiple queries, so it must not depend on anything but the arguments.
+    :param stalker: The stalker function determined for the url.
+    :type stalker: function (coroutine)
+    :param url: The already fixed url to stalk.
+    :type url: str
+    :param ranks: Whether ranks should be added to the players.
+    :type ranks: bool
+    :param use_api: Whether the Riot api may be used for ranks, if a token is available.
+    :type use_api: bool
+    :param resources: The shared worker pool and http session of the backend.
+    :type resources: BackendResources
+    :param progress: When given, counts the finished teams and players.
+    :type progress: StalkProgress
+    :param on_partial: Called with every partial result of a streaming stalker.
+    :type on_partial: Callable[[Payload], None]
+    :param priority: The priority class used for the worker pool slots, the one of the query starting the stalk.
+    :type priority: int
+    :param stage_times: When given, receives the monotonic times of stalk_end, rank_start and rank_end.
+    :type stage_times: Dict[str, float]
+    :return: The stalked payload and the flags that need to be added to every query receiving it.
+    :rtype: Tuple[Payload, Set[str]]
+    """
+    lane = stalker_to_heavy_lane.get(stalker, determine_website(url))
+
+    if progress is None:
+        progress = StalkProgress()
+
+    streaming_stalker = stalker_to_streaming_stalker.get(stalker)
+
+    def on_update(update: StalkUpdate):
+        progress.update_stalk(update)
+        if on_partial is not None:
+            on_partial(update.partial)
+
+    async with resources.pool.slot(lane, priority):
+        if streaming_stalker is None:
+            payload = await stalker(url, session=resources.session)
         else:
-            logger.error(
-                f"Invalid control flow in backend master for query {str(query)}, discarding query."
+            payload = await collect_stream(
+                streaming_stalker(url, session=resources.session), on_update
             )
-            del query
+    progress.finish_stalk(payload)
+    if stage_times is None:
+        stage_times = {}
+    stage_times["stalk_end"] = time.monotonic()
+
+    result_flags = set()
+
+    if ranks:
+        logger.debug(f"Starting rank stalk for {url}")
+        stage_times["rank_start"] = time.monotonic()
+        # try loading a Riot Api Token
+        found_riot_token = False
+        try:
+            token_loader.load_token("RiotToken")
+            found_riot_token = True
+        except TokenLoadingError as e:
+            logger.info("Failed to load RiotToken, using op.gg instead.")
+        if found_riot_token and use_api:
+            async with resources.pool.slot(riot_api_lane, priority):
+                await call_rank_stalker(
+                    payload,
+                    use_api=True,
+                    session=resources.session,
+                    rank_store=resources.rank_store,
+                    progress=progress,
+                )
+            result_flags.update(used_riot_api_flag_lookup)
+        else:
+            async with resources.pool.slot(op_gg_lane, priority):
+                await call_rank_stalker(
+                    payload,
+                    session=resources.session,
+                    rank_store=resources.rank_store,
+                    progress=progress,
+                )
+        stage_times["rank_end"] = time.monotonic()
+        logger.debug(f"Finished rank stalk for {url}")
 
-        backend_queue.task_done()
+    return payload, result_flags
+
+
+def send_message(query: Query, forward_queue: asyncio.Queue, content: str):
+    """
+    :description: Sends an additional Message to the context of the given query, e.g. to inform the user that
+    a stalk takes a moment.
+    :param query: The handled Query, its context is used for the new message.
+    :type query: Query
+    :param forward_queue: The Queue which is handled by the forwarder of the main event loop.
+    :type forward_queue: asyncio.Queue
+    :param content: The message to send.
+    :type content: str
+    :return: None
+    :rtype: None
+    """
+    extra_query = Query(
+        query.context_type,
+        "frontend",
+        "format",
+        discord_channel=query.discord_channel,
+        payload=Message(content),
+    )
+    forward_queue.put_nowait(extra_query)
+
+
+def send_progress(
+    query: Query, forward_queue: asyncio.Queue, content: str, key: int, finished: bool
+):
+    """
+    :description: Sends the progress of a running stalk to the context of the given query.
+    All progress of a query shares its key, so the interface can edit a single message instead of sending new ones.
+    :param query: The handled Query, its context is used for the new query.
+    :type query: Query
+    :param forward_queue: The Queue which is handled by the forwarder of the main event loop.
+    :type forward_queue: asyncio.Queue
+    :param content: The rendered progress.
+    :type content: str
+    :param key: Identifies the progress message of the query.
+    :type key: int
+    :param finished: Whether this is the last progress of the query.
+    :type finished: bool
+    :return: None
+    :rtype: None
+    """
+    progress_query = Query(
+        query.context_type,
+        "frontend",
+        "format",
+        discord_channel=query.discord_channel,
+        payload=Progress(content, key, finished),
+    )
+    forward_queue.put_nowait(progress_query)
+
+
+def send_partial(query: Query, forward_queue: asyncio.Queue, partial: Payload):
+    """
+    :description: Sends a partial result of a running stalk to the context of the given query.
+    Partial results are never sent as file and are shown without ranks, as those are added to the complete result.
+    They keep the priority of the query, so they do not hold up cheaper queries.
+    :param query: The handled Query, its context is used for the new query.
+    :type query: Query
+    :param forward_queue: The Queue which is handled by the forwarder of the main event loop.
+    :type forward_queue: asyncio.Queue
+    :param partial: The partial result, e.g. the TeamList of a finished group.
+    :type partial: Payload
+    :return: None
+    :rtype: None
+    """
+    partial_query = Query(
+        query.context_type,
+        "frontend",
+        "format",
+        raw_command=query.raw_command,
+        discord_channel=query.discord_channel,
+        flags=set(partial_flag_lookup),
+        payload=partial,
+        priority=query.priority,
+    )
+    forward_queue.put_nowait(partial_query)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    :description: Normalizes a url so that different spellings of the same page are equal,
+    by dropping fragments, trailing slashes and the case of scheme and host.
+    :param url: The url after it was fixed by determine stalker.
+    :type url: str
+    :return: The canonical url.
+    :rtype: str
+    """
+    url = url.strip().split("#")[0].rstrip("/")
+    if "://" in url:
+        scheme, rest = url.split("://", 1)
+        host, _, path = rest.partition("/")
+        url = f"{scheme.lower()}://{host.lower()}"
+        if path:
+            url += "/" + path
+    return url
 
 
 def create_error(query: Query, content: str):
@@ -196,6 +666,25 @@ def create_error(query: Query, content: str):
     query.update_query("frontend", "format", payload=error)
 
 
+def determine_website(url: str):
+    """
+    :description: Checks the url for the base url of each supported website.
+    :param url: The url given for stalking.
+    :type url: str
+    :return: The short name of the website, e.g. prime_league, or None if no website matched.
+    :rtype: str
+    """
+    if prime_league_base_url in url:
+        return prime_league_str
+    elif toornament_base_url in url:
+        return toornament_str
+    elif summoners_inn_base_url in url:
+        return summoners_inn_str
+    elif battlefy_base_url in url:
+        return battlefy_str
+    return None
+
+
 def determine_stalker(query: Query):
     """
     :description: Checks the url for keywords to determine the correct stalker.
@@ -204,23 +693,11 @@ def determine_stalker(query: Query):
     :return: The stalker function fitting the url.
     :rtype: function (coroutine)
     """
-    prime_league_str = "prime_league"
-    toornament_str = "toornament"
-    summoners_inn_str = "summoners_inn"
-    battlefy_str = "battlefy"
     url = query.data
-    website = None
+    website = determine_website(url)
     website_type = None
 
-    if prime_league_base_url in url:
-        website = prime_league_str
-    elif toornament_base_url in url:
-        website = toornament_str
-    elif summoners_inn_base_url in url:
-        website = summoners_inn_str
-    elif battlefy_base_url in url:
-        website = battlefy_str
-    else:
+    if website is None:
         error_message = f"Invalid url for query {str(query)}, url {url} could not be matched with a stalker."
         logger.error(error_message)
         create_error(query, error_message)
@@ -310,13 +787,25 @@ def determine_stalker(query: Query):
         return website_type_to_battlefy_stalker.get(website_type)
 
 
-async def call_rank_stalker(payload: Payload, use_api=False):
+async def call_rank_stalker(
+    payload: Payload,
+    use_api=False,
+    session: aiohttp.ClientSession = None,
+    rank_store: RankStore = None,
+    progress: StalkProgress = None,
+):
     """
     :description: Checks the payload type and calls the correct rank stalker.
     :param payload: The Payload object returned from stalking. Submitting Error, Message or Player will cause an error.
     :type payload: Payload
     :param use_api: If set to true, will try to use the Riot api to fetch ranks instead of op.gg.
     :type use_api: Bool
+    :param session: The shared http session, if None the rank stalker creates its own.
+    :type session: aiohttp.ClientSession
+    :param rank_store: The persistent rank store, consulted before stalking a player.
+    :type rank_store: RankStore
+    :param progress: When given, counts the finished players of team lists.
+    :type progress: StalkProgress
     :return: None
     :rtype: None
     """
@@ -326,19 +815,25 @@ async def call_rank_stalker(payload: Payload, use_api=False):
         api_token = token_loader.load_token("RiotToken")
     if isinstance(payload, TeamListList):
         if use_api:
-            await riot_api_rank.add_team_list_list_ranks(payload, api_token)
+            await riot_api_rank.add_team_list_list_ranks(
+                payload, api_token, session, rank_store, progress
+            )
         else:
-            await op_gg_rank.add_team_list_list_ranks(payload)
+            await op_gg_rank.add_team_list_list_ranks(
+                payload, session, rank_store, progress
+            )
     elif isinstance(payload, TeamList):
         if use_api:
-            await riot_api_rank.add_team_list_ranks(payload, api_token)
+            await riot_api_rank.add_team_list_ranks(
+                payload, api_token, session, rank_store, progress
+            )
         else:
-            await op_gg_rank.add_team_list_ranks(payload)
+            await op_gg_rank.add_team_list_ranks(payload, session, rank_store, progress)
     elif isinstance(payload, Team):
         if use_api:
-            await riot_api_rank.add_team_ranks(payload, api_token)
+            await riot_api_rank.add_team_ranks(payload, api_token, session, rank_store)
         else:
-            await op_gg_rank.add_team_ranks(payload)
+            await op_gg_rank.add_team_ranks(payload, session, rank_store)
     else:
         logger.error(
             f"Failed to identify payload for rank addition, payload is for some reason of type {type(payload)}"
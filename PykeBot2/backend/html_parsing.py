@@ -0,0 +1,47 @@
+"""
+Offers the html parsing used by all stalkers.
+lxml is used when it is installed, as it parses pages many times faster than the pure python html.parser,
+which stays the fallback. Stalkers that only need a few elements of a page pass a SoupStrainer,
+so only those elements are turned into a tree.
+
+:author: Jonathan Decker
+"""
+
+import logging
+import bs4
+
+logger = logging.getLogger("pb_logger")
+
+try:
+    import lxml  # noqa: F401
+
+    parser_features = "lxml"
+except ImportError:
+    parser_features = "html.parser"
+    logger.info("lxml is not installed, falling back to html.parser")
+
+
+def parse_html(
+    page: str, parse_only: bs4.SoupStrainer = None, features: str = None
+) -> bs4.BeautifulSoup:
+    """
+    :description: Parses a page with the fastest available parser.
+    :param page: The html of the page.
+    :type page: str
+    :param parse_only: When given, only matching elements and their children are parsed.
+    :type parse_only: bs4.SoupStrainer
+    :param features: Forces a parser, standard is lxml if installed, else html.parser.
+    :type features: str
+    :return: The parsed page.
+    :rtype: bs4.BeautifulSoup
+    """
+    if features is None:
+        features = parser_features
+    return bs4.BeautifulSoup(page, features=features, parse_only=parse_only)
+
+
+"""
+Strainers for the elements the stalkers need from their pages.
+"""
+links_only = bs4.SoupStrainer("a", href=True)
+title_only = bs4.SoupStrainer("title")
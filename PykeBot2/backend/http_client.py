@@ -0,0 +1,180 @@
+"""
+Offers the long lived aiohttp session shared by all stalkers.
+The session keeps connections alive, caches DNS lookups, limits connections per host
+and uses a single SSL context for all requests. Every session reports its requests to the http telemetry.
+Further offers fetch and fetch text for page requests that are repeated on temporary failures.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import logging
+import ssl
+from typing import Tuple
+import aiohttp
+import certifi
+from PykeBot2.backend.http_telemetry import telemetry
+from PykeBot2.models.errors import ServerErrorResponseError
+from PykeBot2.models.lookup_tables import (
+    http_connection_limit,
+    http_connection_limit_per_host,
+    http_dns_cache_ttl,
+    http_keepalive_timeout,
+    http_retries,
+    http_retry_backoff,
+)
+
+logger = logging.getLogger("pb_logger")
+
+"""
+SSL context reused by every request, creating one is expensive as it loads the certificate bundle.
+"""
+ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+
+def create_session(
+    limit: int = http_connection_limit,
+    limit_per_host: int = http_connection_limit_per_host,
+) -> aiohttp.ClientSession:
+    """
+    :description: Creates a new ClientSession with keep-alive, DNS cache, connection limits and the shared SSL context.
+    The timings of its requests are collected by the http telemetry.
+    Must be called from within a running event loop.
+    :param limit: Maximum number of open connections over all hosts.
+    :type limit: int
+    :param limit_per_host: Maximum number of open connections to the same host.
+    :type limit_per_host: int
+    :return: A new ClientSession, the caller is responsible for closing it.
+    :rtype: aiohttp.ClientSession
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=http_dns_cache_ttl,
+        keepalive_timeout=http_keepalive_timeout,
+        ssl=ssl_context,
+    )
+    return aiohttp.ClientSession(
+        connector=connector, trace_configs=[telemetry.trace_config()]
+    )
+
+
+async def open_session() -> aiohttp.ClientSession:
+    """
+    :description: Coroutine version of create session, used to create the process wide session at startup
+    before the event loop runs forever.
+    :return: A new ClientSession, the caller is responsible for closing it.
+    :rtype: aiohttp.ClientSession
+    """
+    session = create_session()
+    logger.info("Opened shared http session")
+    return session
+
+
+async def close_session(session: aiohttp.ClientSession):
+    """
+    :description: Closes the given session and all of its connections.
+    Writes the http telemetry collected so far to the log.
+    :param session: The session to close.
+    :type session: aiohttp.ClientSession
+    :return: None
+    :rtype: None
+    """
+    if session.closed:
+        return
+    await session.close()
+    logger.info("Closed shared http session")
+    logger.info(f"Http telemetry per host:\n{telemetry.summary()}")
+
+
+"""
+Status codes that signal a temporary failure, requests answered with them are repeated.
+"""
+retryable_statuses = {429, 500, 502, 503, 504}
+
+
+def retry_delay(response: aiohttp.ClientResponse, backoff: float) -> float:
+    """
+    :description: Determines how long to wait before repeating a request answered with a retryable status.
+    A 429 response is repeated once its Retry-After header allows it, if given in seconds.
+    :param response: The response with a retryable status.
+    :type response: aiohttp.ClientResponse
+    :param backoff: Seconds waited if the response does not say otherwise.
+    :type backoff: float
+    :return: The seconds to wait.
+    :rtype: float
+    """
+    if response.status == 429:
+        try:
+            return max(float(response.headers["Retry-After"]), backoff)
+        except (KeyError, ValueError):
+            pass
+    return backoff
+
+
+async def fetch(
+    session: aiohttp.ClientSession,
+    url: str,
+    retries: int = http_retries,
+    backoff: float = http_retry_backoff,
+) -> Tuple[int, str]:
+    """
+    :description: Requests the url and returns the status and page text. Connection errors, timeouts and retryable
+    status codes are repeated up to retries times, waiting backoff seconds before the first repetition and doubling
+    it every time. On 429 the wait is at least the Retry-After of the response.
+    :raises ServerErrorResponseError: If the last repetition is still answered with a retryable status.
+    :param session: The session used for the request.
+    :type session: aiohttp.ClientSession
+    :param url: The url of the page.
+    :type url: str
+    :param retries: How often a failed request is repeated.
+    :type retries: int
+    :param backoff: Seconds waited before the first repetition.
+    :type backoff: float
+    :return: Tuple of status and page text of the first response with a status that is not retryable.
+    :rtype: Tuple[int, str]
+    """
+    attempt = 0
+    while True:
+        delay = backoff * 2 ** attempt
+        try:
+            async with session.get(url) as response:
+                if response.status not in retryable_statuses:
+                    return response.status, await response.text()
+                if attempt >= retries:
+                    logger.error(
+                        f"Request for {url} answered with {response.status} after {retries} retries."
+                    )
+                    raise ServerErrorResponseError
+                logger.debug(f"Request for {url} answered with {response.status}, retrying")
+                delay = retry_delay(response, delay)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt >= retries:
+                raise
+            logger.debug(f"Request for {url} failed with {type(e)}, retrying")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def fetch_text(
+    session: aiohttp.ClientSession,
+    url: str,
+    retries: int = http_retries,
+    backoff: float = http_retry_backoff,
+) -> str:
+    """
+    :description: Same as fetch, but only returns the page text.
+    :raises ServerErrorResponseError: If the last repetition is still answered with a retryable status.
+    :param session: The session used for the request.
+    :type session: aiohttp.ClientSession
+    :param url: The url of the page.
+    :type url: str
+    :param retries: How often a failed request is repeated.
+    :type retries: int
+    :param backoff: Seconds waited before the first repetition.
+    :type backoff: float
+    :return: The page text of the first response with a status that is not retryable.
+    :rtype: str
+    """
+    _, text = await fetch(session, url, retries, backoff)
+    return text
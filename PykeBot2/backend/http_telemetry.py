@@ -0,0 +1,230 @@
+"""
+Offers per host telemetry of every request made by the stalkers, built on the TraceConfig of aiohttp.
+Each request is split into the phases queue (waiting for a connection slot), dns, connect (TCP and TLS handshake,
+aiohttp does not report them apart), ttfb (from sending the request until the response headers arrived)
+and transfer (until the body was read). Further the status codes, errors, body bytes and the share of requests
+that reused a kept alive connection are counted per host.
+The numbers are exported with the query metrics, can be read at runtime with snapshot
+and are written to the log when the shared session is closed.
+
+:author: Jonathan Decker
+"""
+
+import logging
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+import aiohttp
+from PykeBot2.models.lookup_tables import http_telemetry_buckets
+from PykeBot2.utils.metrics import Counter, Histogram, Metric
+
+logger = logging.getLogger("pb_logger")
+
+"""
+Phases of a request, in order.
+"""
+request_phases = ("queue", "dns", "connect", "ttfb", "transfer", "total")
+
+
+class HttpTelemetry:
+    """
+    :description: Collects the telemetry of all sessions it is attached to, see trace_config.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        :description: Creates the telemetry without any requests.
+        :param clock: Returns the current time in seconds, replaceable for testing.
+        :type clock: Callable[[], float]
+        """
+        self.clock = clock
+        self.phase_seconds = Histogram(
+            "pykebot_http_phase_seconds",
+            "Seconds spent in each phase of a http request by host.",
+            ("host", "phase"),
+            http_telemetry_buckets,
+        )
+        self.responses = Counter(
+            "pykebot_http_responses_total",
+            "Http responses by host and status code.",
+            ("host", "status"),
+        )
+        self.errors = Counter(
+            "pykebot_http_errors_total",
+            "Http requests that failed without a response by host and exception.",
+            ("host", "error"),
+        )
+        self.response_bytes = Counter(
+            "pykebot_http_response_bytes_total",
+            "Bytes of http response bodies by host.",
+            ("host",),
+        )
+        self.connections = Counter(
+            "pykebot_http_connections_total",
+            "Connections used by http requests by host, either new or reused.",
+            ("host", "kind"),
+        )
+
+    def metrics(self) -> List[Metric]:
+        """
+        :description: The metrics of the telemetry, to be registered with the exporter.
+        :rtype: List[Metric]
+        """
+        return [
+            self.phase_seconds,
+            self.responses,
+            self.errors,
+            self.response_bytes,
+            self.connections,
+        ]
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        :description: Creates a TraceConfig that reports every request of a session to this telemetry.
+        :return: The TraceConfig, to be passed as trace_configs to a ClientSession.
+        :rtype: aiohttp.TraceConfig
+        """
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace_config.on_connection_create_start.append(self._on_connect_start)
+        trace_config.on_connection_create_end.append(self._on_connect_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+        trace_config.on_request_headers_sent.append(self._on_headers_sent)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    def hosts(self) -> List[str]:
+        """
+        :description: Every host that was requested so far.
+        :rtype: List[str]
+        """
+        hosts = {key[0] for key in self.connections.values}
+        hosts.update(key[0] for key in self.responses.values)
+        hosts.update(key[0] for key in self.errors.values)
+        return sorted(hosts)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        :description: Summarizes the telemetry of every host, can be called at any time.
+        :return: Maps each host to its requests, errors, bytes, connection reuse ratio
+        and the p50 and p95 of every phase in seconds, e.g. ttfb_p95.
+        :rtype: Dict[str, Dict[str, float]]
+        """
+        snapshot = {}
+        for host in self.hosts():
+            responses = sum(
+                count for key, count in self.responses.values.items() if key[0] == host
+            )
+            errors = sum(
+                count for key, count in self.errors.values.items() if key[0] == host
+            )
+            new = self.connections.get(host=host, kind="new")
+            reused = self.connections.get(host=host, kind="reused")
+            stats = {
+                "requests": responses + errors,
+                "errors": errors,
+                "bytes": self.response_bytes.get(host=host),
+                "reuse_ratio": reused / (new + reused) if new + reused > 0 else 0.0,
+            }
+            for phase in request_phases:
+                if self.phase_seconds.count(host=host, phase=phase) == 0:
+                    continue
+                for q in (0.5, 0.95):
+                    stats[f"{phase}_p{round(q * 100)}"] = self.phase_seconds.quantile(
+                        q, host=host, phase=phase
+                    )
+            snapshot[host] = stats
+        return snapshot
+
+    def summary(self) -> str:
+        """
+        :description: Renders the snapshot as one line per host, used for the log.
+        :rtype: str
+        """
+        lines = []
+        for host, stats in self.snapshot().items():
+            line = (
+                f"{host}: {stats['requests']} requests, {stats['errors']} errors, "
+                f"{stats['bytes'] / 1024:.0f} KiB, {stats['reuse_ratio']:.0%} reused connections"
+            )
+            for phase in request_phases:
+                if f"{phase}_p50" in stats:
+                    p50, p95 = stats[f"{phase}_p50"], stats[f"{phase}_p95"]
+                    line += f", {phase} p50 <= {p50}s p95 <= {p95}s"
+            lines.append(line)
+        if len(lines) == 0:
+            return "No http requests were made."
+        return "\n".join(lines)
+
+    def _observe(self, ctx: SimpleNamespace, phase: str, seconds: float):
+        self.phase_seconds.observe(max(seconds, 0.0), host=ctx.host, phase=phase)
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.host = params.url.host or "unknown"
+        ctx.start = self.clock()
+        ctx.sent = ctx.start
+        ctx.dns = 0.0
+
+    async def _on_queued_start(self, session, ctx, params):
+        ctx.queued = self.clock()
+
+    async def _on_queued_end(self, session, ctx, params):
+        self._observe(ctx, "queue", self.clock() - ctx.queued)
+
+    async def _on_dns_start(self, session, ctx, params):
+        ctx.dns_start = self.clock()
+
+    async def _on_dns_end(self, session, ctx, params):
+        ctx.dns = self.clock() - ctx.dns_start
+        self._observe(ctx, "dns", ctx.dns)
+
+    async def _on_connect_start(self, session, ctx, params):
+        ctx.connect_start = self.clock()
+        ctx.dns = 0.0
+
+    async def _on_connect_end(self, session, ctx, params):
+        # the dns lookup happens while the connection is created
+        self._observe(ctx, "connect", self.clock() - ctx.connect_start - ctx.dns)
+        self.connections.inc(host=ctx.host, kind="new")
+
+    async def _on_connection_reused(self, session, ctx, params):
+        self.connections.inc(host=ctx.host, kind="reused")
+
+    async def _on_headers_sent(self, session, ctx, params):
+        # sent again for every redirect, so ttfb covers the last request
+        ctx.sent = self.clock()
+
+    async def _on_request_end(self, session, ctx, params):
+        now = self.clock()
+        self._observe(ctx, "ttfb", now - ctx.sent)
+        self.responses.inc(host=ctx.host, status=str(params.response.status))
+        ctx.headers_received = now
+
+        response = params.response
+        connection = response.connection
+        if connection is None:
+            # the body was already read completely
+            self._on_body_read(ctx, response)
+        else:
+            # the connection is released once the body was read or the response is closed
+            connection.add_callback(lambda: self._on_body_read(ctx, response))
+
+    def _on_body_read(self, ctx: SimpleNamespace, response: aiohttp.ClientResponse):
+        now = self.clock()
+        self._observe(ctx, "transfer", now - ctx.headers_received)
+        self._observe(ctx, "total", now - ctx.start)
+        self.response_bytes.inc(response.content.total_bytes, host=ctx.host)
+
+    async def _on_request_exception(self, session, ctx, params):
+        self.errors.inc(host=ctx.host, error=type(params.exception).__name__)
+
+
+"""
+Telemetry shared by every session created with http_client.create_session.
+"""
+telemetry = HttpTelemetry()
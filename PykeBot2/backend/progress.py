@@ -0,0 +1,305 @@
+"""
+Offers progress tracking for long stalks.
+A StalkProgress counts finished teams and players of a stalk, measures the request rate over a sliding window
+and estimates the remaining time from the observed rate and the rate limit of the active rate limiter.
+report_progress periodically renders it, so a single progress message per query can be edited in place.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+from PykeBot2.backend.stalker.streaming import StalkUpdate
+from PykeBot2.models.data_models import Payload, Team, TeamList, TeamListList
+from PykeBot2.models.lookup_tables import (
+    progress_first_update_delay,
+    progress_rate_window,
+    progress_update_interval,
+)
+
+logger = logging.getLogger("pb_logger")
+
+
+def count_teams(payload: Payload) -> int:
+    """
+    :description: Counts the teams of a stalk result.
+    :param payload: A Team, TeamList or TeamListList.
+    :type payload: Payload
+    :return: The number of teams, 0 for other payloads.
+    :rtype: int
+    """
+    if isinstance(payload, TeamListList):
+        return sum(len(team_list.teams) for team_list in payload.team_lists)
+    if isinstance(payload, TeamList):
+        return len(payload.teams)
+    if isinstance(payload, Team):
+        return 1
+    return 0
+
+
+def format_duration(seconds: float) -> str:
+    """
+    :description: Formats a duration for the progress message, e.g. 1m 20s.
+    :param seconds: The duration.
+    :type seconds: float
+    :return: The formatted duration.
+    :rtype: str
+    """
+    seconds = int(round(seconds))
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    if minutes > 0:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+
+class StalkProgress:
+    """
+    :description: Progress of a single stalk, shared by every query waiting for it.
+    A stalk first finds its teams and afterwards, if requested, stalks the ranks of their players.
+    While teams are found, the team total is extrapolated from the parts a streaming stalker reports,
+    e.g. from the finished groups of a season.
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        rate_window: float = progress_rate_window,
+    ):
+        """
+        :description: Creates the progress of a stalk that just started.
+        :param clock: Returns the current time in seconds, replaceable for testing.
+        :type clock: Callable[[], float]
+        :param rate_window: Seconds over which the rates are measured.
+        :type rate_window: float
+        """
+        self.clock = clock
+        self.rate_window = rate_window
+        self.start_time = clock()
+        self.teams_done = 0
+        self.teams_total: Optional[int] = None
+        self.parts_done = 0
+        self.parts_total: Optional[int] = None
+        self.players_done = 0
+        self.players_total: Optional[int] = None
+        # players per second allowed by the active rate limiter, None if there is none
+        self.player_rate_limit: Optional[float] = None
+        self.requests = 0
+        self.request_counter: Optional[Callable[[], int]] = None
+        self.request_counter_start = 0
+        # (time, requests, parts done, players done), the oldest sample is the start of the window
+        self.samples: Deque[Tuple[float, int, int, int]] = deque()
+        self._sample()
+
+    def update_stalk(self, update: StalkUpdate):
+        """
+        :description: Counts the teams of an update of a streaming stalker, each team needed about one page request.
+        :param update: The update.
+        :type update: StalkUpdate
+        :return: None
+        :rtype: None
+        """
+        self.requests += count_teams(update.partial)
+        self.teams_done = count_teams(update.result)
+        if update.done is not None:
+            self.parts_done = update.done
+            self.parts_total = update.total
+        if self.parts_total is not None and self.parts_done > 0:
+            self.teams_total = round(
+                self.teams_done * self.parts_total / self.parts_done
+            )
+        self._sample()
+
+    def finish_stalk(self, payload: Payload):
+        """
+        :description: Takes the teams of the complete stalk result.
+        :param payload: The stalk result.
+        :type payload: Payload
+        :return: None
+        :rtype: None
+        """
+        self.teams_done = count_teams(payload)
+        self.teams_total = self.teams_done
+        self.parts_done = self.parts_total or 0
+        self._sample()
+
+    def start_players(
+        self,
+        total: int,
+        request_counter: Callable[[], int] = None,
+        player_rate_limit: float = None,
+    ):
+        """
+        :description: Starts the rank stalk of total players.
+        :param total: The number of players.
+        :type total: int
+        :param request_counter: Returns the number of requests made so far, e.g. by the rate limiter.
+        If None, every finished player counts as one request.
+        :type request_counter: Callable[[], int]
+        :param player_rate_limit: Players per second allowed by the active rate limiter.
+        :type player_rate_limit: float
+        :return: None
+        :rtype: None
+        """
+        self.players_done = 0
+        self.players_total = total
+        self.request_counter = request_counter
+        if request_counter is not None:
+            self.request_counter_start = request_counter()
+        if player_rate_limit is not None and math.isinf(player_rate_limit):
+            player_rate_limit = None
+        self.player_rate_limit = player_rate_limit
+        self._sample()
+
+    def player_finished(self):
+        """
+        :description: Counts a player whose rank was added.
+        :return: None
+        :rtype: None
+        """
+        self.players_done += 1
+        if self.request_counter is None:
+            self.requests += 1
+        self._sample()
+
+    def request_count(self) -> int:
+        """
+        :description: The number of requests made by the stalk so far.
+        :rtype: int
+        """
+        count = self.requests
+        if self.request_counter is not None:
+            count += self.request_counter() - self.request_counter_start
+        return count
+
+    def rates(self) -> Tuple[float, float, float]:
+        """
+        :description: Measures the rates over the last rate_window seconds.
+        :return: Requests, parts and players per second.
+        :rtype: Tuple[float, float, float]
+        """
+        self._sample()
+        now, requests, parts, players = self.samples[-1]
+        start, start_requests, start_parts, start_players = self.samples[0]
+        elapsed = now - start
+        if elapsed <= 0:
+            return 0.0, 0.0, 0.0
+        return (
+            (requests - start_requests) / elapsed,
+            (parts - start_parts) / elapsed,
+            (players - start_players) / elapsed,
+        )
+
+    def eta(self) -> Optional[float]:
+        """
+        :description: Estimates the seconds left in the current phase. The rank stalk can not be faster
+        than the active rate limiter allows, even if the observed rate was higher so far.
+        :return: The estimated seconds, None if nothing can be estimated yet.
+        :rtype: float
+        """
+        _, parts_rate, players_rate = self.rates()
+        if self.players_total is not None:
+            remaining = self.players_total - self.players_done
+            rate = players_rate
+            if self.player_rate_limit is not None and rate > 0:
+                rate = min(rate, self.player_rate_limit)
+            elif self.player_rate_limit is not None:
+                rate = self.player_rate_limit
+        elif self.parts_total is not None:
+            remaining = self.parts_total - self.parts_done
+            rate = parts_rate
+        else:
+            return None
+        if remaining <= 0:
+            return 0.0
+        if rate <= 0:
+            return None
+        return remaining / rate
+
+    def render(
+        self, finished: bool = False, stopped: bool = False, failed: bool = False
+    ) -> str:
+        """
+        :description: Renders the progress message.
+        :param finished: Whether the stalk is over, the rates and the estimate are left out in that case.
+        :type finished: bool
+        :param stopped: Whether the finished stalk was cancelled or timed out instead of completing.
+        :type stopped: bool
+        :param failed: Whether the finished stalk ended with an error instead of completing.
+        :type failed: bool
+        :return: The progress message.
+        :rtype: str
+        """
+        duration = format_duration(self.clock() - self.start_time)
+        if finished and failed:
+            out = f"Failed after {duration}: "
+        elif finished and stopped:
+            out = f"Stopped after {duration}: "
+        elif finished:
+            out = f"Finished in {duration}: "
+        else:
+            out = "Stalking: "
+        teams = f"teams {self.teams_done}"
+        if self.teams_total is not None:
+            teams += f"/{self.teams_total}"
+        parts = [teams]
+        if self.players_total is not None:
+            parts.append(f"players {self.players_done}/{self.players_total}")
+        if not finished:
+            requests_rate, _, _ = self.rates()
+            parts.append(f"{requests_rate:.1f} requests/s")
+            eta = self.eta()
+            if eta is not None:
+                parts.append(f"about {format_duration(eta)} left")
+        return out + ", ".join(parts)
+
+    def __str__(self):
+        return self.render()
+
+    def _sample(self):
+        now = self.clock()
+        self.samples.append(
+            (now, self.request_count(), self.parts_done, self.players_done)
+        )
+        # keep the last sample before the window as its start
+        while len(self.samples) > 2 and self.samples[1][0] <= now - self.rate_window:
+            self.samples.popleft()
+
+
+async def report_progress(
+    progress: StalkProgress,
+    report: Callable[[str, bool], None],
+    first_delay: float = progress_first_update_delay,
+    interval: float = progress_update_interval,
+):
+    """
+    :description: Reports the progress every interval seconds until cancelled, starting after first_delay,
+    so quick stalks are never reported. When cancelled after a report, a last report marks the progress finished.
+    :param progress: The progress of the stalk.
+    :type progress: StalkProgress
+    :param report: Called with the rendered progress and whether it is the last report.
+    :type report: Callable[[str, bool], None]
+    :param first_delay: Seconds before the first report.
+    :type first_delay: float
+    :param interval: Seconds between reports, throttles the edits of the progress message.
+    :type interval: float
+    :return: None
+    :rtype: None
+    """
+    reported = False
+    try:
+        await asyncio.sleep(first_delay)
+        while True:
+            report(str(progress), False)
+            reported = True
+            await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        if reported:
+            report(progress.render(finished=True), True)
+        raise
@@ -0,0 +1,259 @@
+"""
+Offers a persistent SQLite store for player ranks, so ranks seen recently do not need to be stalked again.
+Further the store caches Riot summoner ids, which practically never change.
+All database access runs on a single worker thread, which keeps the store safe to use from many coroutines.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import logging
+import pathlib
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from PykeBot2.models.lookup_tables import (
+    rank_store_directory,
+    rank_store_file_name,
+    rank_store_max_age,
+)
+
+logger = logging.getLogger("pb_logger")
+
+
+def normalize_summoner_name(summoner_name: str) -> str:
+    """
+    :description: Normalizes a summoner name the same way op.gg and the Riot api do, ignoring spaces and case.
+    :param summoner_name: The summoner name as found on the tournament page.
+    :type summoner_name: str
+    :return: The normalized summoner name.
+    :rtype: str
+    """
+    return "".join(summoner_name.split()).lower()
+
+
+class RankStore:
+    """
+    :description: Stores rank string, League Points and fetch time per normalized summoner name and region.
+    Ranks older than max_age are treated as missing.
+    Summoner ids are kept until they are deleted, which should happen once the Riot api no longer knows them.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        max_age: float = rank_store_max_age,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        :description: Creates the store, the database is only opened by open.
+        :param path: Path to the SQLite database file, use ":memory:" for a temporary store.
+        :type path: pathlib.Path
+        :param max_age: Seconds after which a stored rank is no longer used.
+        :type max_age: float
+        :param clock: Returns the current unix time, replaceable for testing.
+        :type clock: Callable[[], float]
+        """
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rank_store"
+        )
+        self.connection: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def open(self):
+        """
+        :description: Opens the database and creates the tables if needed.
+        :return: None
+        :rtype: None
+        """
+        await self._run(self._open)
+        logger.info(f"Opened rank store {self.path}")
+
+    def _open(self):
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS player_ranks ("
+            "summoner_name TEXT NOT NULL, "
+            "region TEXT NOT NULL, "
+            "rank_string TEXT NOT NULL, "
+            "lp INTEGER NOT NULL, "
+            "fetched_at REAL NOT NULL, "
+            "PRIMARY KEY (summoner_name, region))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS summoner_ids ("
+            "summoner_name TEXT NOT NULL, "
+            "region TEXT NOT NULL, "
+            "summoner_id TEXT NOT NULL, "
+            "PRIMARY KEY (summoner_name, region))"
+        )
+        self.connection.commit()
+
+    async def get_rank(
+        self, summoner_name: str, region: str = "euw"
+    ) -> Optional[Tuple[str, int]]:
+        """
+        :description: Looks up a stored rank that is not older than max_age.
+        :param summoner_name: Summoner name of the player, normalized by the store.
+        :type summoner_name: str
+        :param region: Region of the account.
+        :type region: str
+        :return: Tuple of rank string and League Points, or None if no fresh rank is stored.
+        :rtype: Optional[Tuple[str, int]]
+        """
+        return await self._run(
+            self._get_rank, normalize_summoner_name(summoner_name), region
+        )
+
+    def _get_rank(self, summoner_name: str, region: str):
+        row = self.connection.execute(
+            "SELECT rank_string, lp FROM player_ranks "
+            "WHERE summoner_name = ? AND region = ? AND fetched_at >= ?",
+            (summoner_name, region, self.clock() - self.max_age),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1]
+
+    async def put_rank(
+        self, summoner_name: str, rank_string: str, lp: int = -1, region: str = "euw"
+    ):
+        """
+        :description: Stores the rank of a player with the current time, replacing an older entry.
+        :param summoner_name: Summoner name of the player, normalized by the store.
+        :type summoner_name: str
+        :param rank_string: The rank as returned by the rank stalker.
+        :type rank_string: str
+        :param lp: League Points or -1 if unknown.
+        :type lp: int
+        :param region: Region of the account.
+        :type region: str
+        :return: None
+        :rtype: None
+        """
+        await self._run(
+            self._put_rank,
+            normalize_summoner_name(summoner_name),
+            region,
+            rank_string,
+            lp,
+        )
+
+    def _put_rank(self, summoner_name: str, region: str, rank_string: str, lp: int):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO player_ranks "
+            "(summoner_name, region, rank_string, lp, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (summoner_name, region, rank_string, lp, self.clock()),
+        )
+        self.connection.commit()
+
+    async def get_summoner_id(
+        self, summoner_name: str, region: str = "euw"
+    ) -> Optional[str]:
+        """
+        :description: Looks up the cached Riot summoner id of a player.
+        :param summoner_name: Summoner name of the player, normalized by the store.
+        :type summoner_name: str
+        :param region: Region of the account.
+        :type region: str
+        :return: The summoner id or None if it is not cached.
+        :rtype: Optional[str]
+        """
+        return await self._run(
+            self._get_summoner_id, normalize_summoner_name(summoner_name), region
+        )
+
+    def _get_summoner_id(self, summoner_name: str, region: str):
+        row = self.connection.execute(
+            "SELECT summoner_id FROM summoner_ids WHERE summoner_name = ? AND region = ?",
+            (summoner_name, region),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    async def put_summoner_id(
+        self, summoner_name: str, summoner_id: str, region: str = "euw"
+    ):
+        """
+        :description: Caches the Riot summoner id of a player.
+        :param summoner_name: Summoner name of the player, normalized by the store.
+        :type summoner_name: str
+        :param summoner_id: The encrypted summoner id returned by the Riot api.
+        :type summoner_id: str
+        :param region: Region of the account.
+        :type region: str
+        :return: None
+        :rtype: None
+        """
+        await self._run(
+            self._put_summoner_id,
+            normalize_summoner_name(summoner_name),
+            region,
+            summoner_id,
+        )
+
+    def _put_summoner_id(self, summoner_name: str, region: str, summoner_id: str):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO summoner_ids (summoner_name, region, summoner_id) VALUES (?, ?, ?)",
+            (summoner_name, region, summoner_id),
+        )
+        self.connection.commit()
+
+    async def delete_summoner_id(self, summoner_name: str, region: str = "euw"):
+        """
+        :description: Removes the cached summoner id of a player, used when the Riot api answers it with 404.
+        :param summoner_name: Summoner name of the player, normalized by the store.
+        :type summoner_name: str
+        :param region: Region of the account.
+        :type region: str
+        :return: None
+        :rtype: None
+        """
+        await self._run(
+            self._delete_summoner_id, normalize_summoner_name(summoner_name), region
+        )
+
+    def _delete_summoner_id(self, summoner_name: str, region: str):
+        self.connection.execute(
+            "DELETE FROM summoner_ids WHERE summoner_name = ? AND region = ?",
+            (summoner_name, region),
+        )
+        self.connection.commit()
+
+    async def close(self):
+        """
+        :description: Closes the database and stops the worker thread.
+        :return: None
+        :rtype: None
+        """
+        if self.connection is not None:
+            await self._run(self.connection.close)
+            self.connection = None
+            logger.info(f"Closed rank store {self.path}")
+        self.executor.shutdown(wait=True)
+
+
+async def open_rank_store(path: pathlib.Path = None) -> RankStore:
+    """
+    :description: Creates and opens the rank store used by the bot.
+    :param path: Path to the database file, standard is rank_store_file_name in the rank_store_directory
+    of the current working directory, which is created if missing.
+    :type path: pathlib.Path
+    :return: The opened rank store.
+    :rtype: RankStore
+    """
+    if path is None:
+        directory = pathlib.Path.cwd() / rank_store_directory
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / rank_store_file_name
+    rank_store = RankStore(path)
+    await rank_store.open()
+    return rank_store
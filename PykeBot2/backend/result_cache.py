@@ -0,0 +1,163 @@
+"""
+Offers an in memory cache for stalk results with a time to live per platform
+and least recently used eviction under a memory budget.
+
+:author: Jonathan Decker
+"""
+
+import logging
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Optional, Set, Tuple
+from PykeBot2.models.data_models import Payload, Player, Team, TeamList, TeamListList
+
+logger = logging.getLogger("pb_logger")
+
+
+@dataclass
+class CacheEntry:
+    """
+    :description: A single cached stalk result.
+    """
+
+    payload: Payload
+    flags: Set[str]
+    expires_at: float
+    size: int
+
+
+class ResultCache:
+    """
+    :description: Maps stalk keys to finished payloads. Entries expire after the time to live of their platform,
+    when the estimated size of all entries exceeds max_bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_per_platform: Dict[str, float],
+        default_ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :description: Creates an empty cache.
+        :param max_bytes: Memory budget for all cached payloads, estimated with estimate_payload_size.
+        :type max_bytes: int
+        :param ttl_per_platform: Maps platform short names to the seconds a result stays valid.
+        :type ttl_per_platform: Dict[str, float]
+        :param default_ttl: Seconds a result stays valid for platforms not in ttl_per_platform.
+        :type default_ttl: float
+        :param clock: Returns the current time in seconds, replaceable for testing.
+        :type clock: Callable[[], float]
+        """
+        self.max_bytes = max_bytes
+        self.ttl_per_platform = ttl_per_platform
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Payload, Set[str]]]:
+        """
+        :description: Looks up a cached result and marks it as recently used.
+        :param key: The stalk key.
+        :type key: Hashable
+        :return: The cached payload and its flags, or None if nothing valid is cached.
+        :rtype: Optional[Tuple[Payload, Set[str]]]
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= self.clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry.payload, set(entry.flags)
+
+    def put(self, key: Hashable, platform: str, payload: Payload, flags: Set[str]):
+        """
+        :description: Caches a result and evicts least recently used entries until the memory budget is met.
+        Results larger than the whole budget are not cached.
+        :param key: The stalk key.
+        :type key: Hashable
+        :param platform: Short name of the platform the result came from, selects the time to live.
+        :type platform: str
+        :param payload: The finished payload.
+        :type payload: Payload
+        :param flags: Flags that need to be added to queries receiving the payload.
+        :type flags: Set[str]
+        :return: None
+        :rtype: None
+        """
+        size = estimate_payload_size(payload)
+        if size > self.max_bytes:
+            logger.debug(f"Not caching result for {key}, {size} bytes exceed the budget")
+            return
+        if key in self.entries:
+            self._remove(key)
+        ttl = self.ttl_per_platform.get(platform, self.default_ttl)
+        self.entries[key] = CacheEntry(payload, set(flags), self.clock() + ttl, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            logger.debug(f"Evicting cached result for {oldest_key}")
+            self._remove(oldest_key)
+
+    def _remove(self, key: Hashable):
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+
+    def clear(self):
+        """
+        :description: Removes all entries.
+        :return: None
+        :rtype: None
+        """
+        self.entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def estimate_payload_size(payload: Payload) -> int:
+    """
+    :description: Estimates the memory used by a payload by summing up the sizes of its objects and strings.
+    :param payload: A Player, Team, TeamList or TeamListList.
+    :type payload: Payload
+    :return: The estimated size in bytes.
+    :rtype: int
+    """
+    if isinstance(payload, TeamListList):
+        return sys.getsizeof(payload) + sum(
+            estimate_payload_size(team_list) for team_list in payload.team_lists
+        )
+    if isinstance(payload, TeamList):
+        return (
+            sys.getsizeof(payload)
+            + sys.getsizeof(payload.name)
+            + sum(estimate_payload_size(team) for team in payload.teams)
+        )
+    if isinstance(payload, Team):
+        return (
+            sys.getsizeof(payload)
+            + sys.getsizeof(payload.name)
+            + sys.getsizeof(payload.multi_link)
+            + sum(estimate_payload_size(player) for player in payload.players)
+        )
+    if isinstance(payload, Player):
+        # players only have a rank after rank stalking
+        return (
+            sys.getsizeof(payload)
+            + sys.getsizeof(payload.summoner_name)
+            + sys.getsizeof(payload.opgg)
+            + sys.getsizeof(getattr(payload, "rank", None))
+        )
+    return sys.getsizeof(payload)
@@ -0,0 +1,75 @@
+"""
+Offers single-flight coalescing, identical work that is already running is joined instead of started again.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger("pb_logger")
+
+
+class SingleFlight:
+    """
+    :description: Keeps track of running work by key. The first caller for a key starts the work,
+    every further caller with the same key waits for the same task and receives the same result or exception.
+    The key is forgotten once the work finished, so later callers start fresh work.
+    The callers of every task are counted, so the work is cancelled once no caller waits for it anymore.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+        self.waiters: Dict[asyncio.Task, int] = {}
+
+    async def run(
+        self, key: Hashable, work_factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        :description: Runs the work for the given key or joins the work already running for it.
+        Cancelling a caller only cancels the shared work if no other caller waits for it.
+        :param key: Identifies the work, must be hashable.
+        :type key: Hashable
+        :param work_factory: Called without arguments to create the awaitable, only if no work is running for the key.
+        :type work_factory: Callable[[], Awaitable[Any]]
+        :return: The result of the shared work.
+        :rtype: Any
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work_factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.debug(f"Joining work already in flight for {key}")
+
+        self.waiters[task] = self.waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.waiters[task] == 1 and not task.done():
+                logger.debug(f"Cancelling work for {key}, as no caller waits for it")
+                task.cancel()
+            raise
+        finally:
+            self.waiters[task] -= 1
+            if self.waiters[task] == 0:
+                del self.waiters[task]
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # mark the exception as retrieved, the waiting callers receive it through the shield
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """
+        :description: Checks whether work for the given key is currently running.
+        :param key: Identifies the work.
+        :type key: Hashable
+        :return: True if work for the key is running.
+        :rtype: bool
+        """
+        return key in self.calls
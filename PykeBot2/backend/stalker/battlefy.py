@@ -5,24 +5,59 @@ Uses undocumented Battlefy API to scrape tournament participants.
 """
 
 import logging
+from typing import AsyncIterator
 import aiohttp
-from PykeBot2.models.data_models import TeamList, Team, Player
-import bs4
-import json
+from PykeBot2.models.data_models import Team, Player
+from PykeBot2.backend import http_client
+from PykeBot2.backend.stalker.streaming import StalkUpdate, TeamBatcher, collect_stream
+from PykeBot2.models.lookup_tables import json_stream_chunk_size, stream_team_batch_size
+from PykeBot2.utils.json_stream import iter_json_array
 
 # from backend.stalker.op_gg_rank import calc_average_and_max_team_rank
 
 logger = logging.getLogger("pb_logger")
 
 
-async def stalk_battlefy_tournament(battlefy_url: str):
+async def stalk_battlefy_tournament(
+    battlefy_url: str, session: aiohttp.ClientSession = None
+):
     """
     Uses undocumented Battlefy API to scrape tournament participants.
     :param battlefy_url: A valid url to a battlefy tournament.
     :type battlefy_url: str
+    :param session: A session that can be reused, if none is given, a new one will be created
+    :type session: aiohttp.ClientSession
     :return: a TeamList object containing all Teams and Players of the given tournament.
     :rtype: TeamList
     """
+    return await collect_stream(stream_battlefy_tournament(battlefy_url, session))
+
+
+async def stream_battlefy_tournament(
+    battlefy_url: str,
+    session: aiohttp.ClientSession = None,
+    batch_size: int = stream_team_batch_size,
+) -> AsyncIterator[StalkUpdate]:
+    """
+    Streaming version of stalk battlefy tournament, yields an update whenever batch_size teams were decoded
+    and a last one at the end of the response.
+    :param battlefy_url: A valid url to a battlefy tournament.
+    :type battlefy_url: str
+    :param session: A session that can be reused, if none is given, a new one will be created
+    :type session: aiohttp.ClientSession
+    :param batch_size: Number of teams per update.
+    :type batch_size: int
+    :return: updates with a TeamList of the newly decoded teams as partial and of all decoded teams as result.
+    :rtype: AsyncIterator[StalkUpdate]
+    """
+
+    if session is None:
+        async with http_client.create_session() as session:
+            async for update in stream_battlefy_tournament(
+                battlefy_url, session, batch_size
+            ):
+                yield update
+        return
 
     # extract tournament id from url
     battlefy_url_split = battlefy_url.split("/")
@@ -34,38 +69,42 @@ async def stalk_battlefy_tournament(battlefy_url: str):
         f"https://dtmwra1jsgyb0.cloudfront.net/tournaments/{tournament_id}/teams?"
     )
 
-    # make the request
-    async with aiohttp.ClientSession() as session:
-        async with session.get(tournament_api_url) as response:
-            page = await response.text()
-
-    # parse the data to create Team and Player Objects
-    soup = bs4.BeautifulSoup(page, features="html.parser")
-
-    json_data = json.loads(soup.text)
-
-    # print(json.dumps(json_data, indent=4, separators=(". ", " = ")))
-
-    teams = []
-
-    for team in json_data:
-        team_name = team["name"]
-        players = []
-        for player in team["players"]:
-            player_name = player["inGameName"]
-            player_obj = Player(player_name)
-            # ranks are often not up to date so just normal rank addition for now
-            # try to add rank if player stats are available
-            # player_stats = player.get("stats", None)
-            # if player_stats is not None:
-            #    player_rank_str = player_stats["tier"] + " " + player_stats["rank"]
-            #    player_rank = Rank(rank_string=player_rank_str)
-            #    player_obj.rank = player_rank
-            players.append(player_obj)
-        new_team = Team(team_name, players)
-        # calc_average_and_max_team_rank(new_team)
-        teams.append(new_team)
-
-    team_list = TeamList(battlefy_url_split[4], teams)
-
-    return team_list
+    # decode the teams while they arrive, so only one team at a time is held as raw data
+    batcher = TeamBatcher(battlefy_url_split[4], batch_size=batch_size)
+    async with session.get(tournament_api_url) as response:
+        index = 0
+        async for team in iter_json_array(
+            response.content.iter_chunked(json_stream_chunk_size)
+        ):
+            update = batcher.add(index, create_team(team))
+            index += 1
+            if update is not None:
+                yield update
+
+    yield batcher.flush()
+
+
+def create_team(team: dict) -> Team:
+    """
+    :description: Creates a Team obj from a team of the Battlefy teams endpoint.
+    :param team: A decoded team with name and players.
+    :type team: dict
+    :return: The team with its players.
+    :rtype: Team
+    """
+    team_name = team["name"]
+    players = []
+    for player in team["players"]:
+        player_name = player["inGameName"]
+        player_obj = Player(player_name)
+        # ranks are often not up to date so just normal rank addition for now
+        # try to add rank if player stats are available
+        # player_stats = player.get("stats", None)
+        # if player_stats is not None:
+        #    player_rank_str = player_stats["tier"] + " " + player_stats["rank"]
+        #    player_rank = Rank(rank_string=player_rank_str)
+        #    player_obj.rank = player_rank
+        players.append(player_obj)
+    new_team = Team(team_name, players)
+    # calc_average_and_max_team_rank(new_team)
+    return new_team
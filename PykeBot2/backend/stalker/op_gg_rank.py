@@ -9,7 +9,14 @@ import asyncio
 import logging
 import bs4
 import aiohttp
+from typing import List
 from PykeBot2.models.data_models import Player, Rank, Team, TeamList, TeamListList
+from PykeBot2.backend import http_client
+from PykeBot2.backend.html_parsing import parse_html
+from PykeBot2.backend.progress import StalkProgress
+from PykeBot2.backend.rank_store import RankStore
+from PykeBot2.backend.worker_pool import map_bounded
+from PykeBot2.models.lookup_tables import op_gg_rank_concurrency
 
 logger = logging.getLogger("pb_logger")
 
@@ -22,11 +29,12 @@ async def stalk_player_op_gg(sum_name: str, session: aiohttp.ClientSession = Non
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession
     :return: A string representation of the Rank, should be used to create a Rank obj.
+    Unranked players are reported as unranked, a failed lookup as Unknown.
     :rtype: str
     """
 
     if session is None:
-        async with aiohttp.ClientSession() as session:
+        async with http_client.create_session() as session:
             return await stalk_player_op_gg(sum_name, session)
 
     # For now lookups are region locked for euw
@@ -34,9 +42,12 @@ async def stalk_player_op_gg(sum_name: str, session: aiohttp.ClientSession = Non
     url = base_url + sum_name.replace(" ", "+")
 
     async with session.get(url) as response:
+        if response.status != 200:
+            logger.error(f"Stalking {url} resulted in status {response.status}")
+            return "Unknown"
         page = await response.text()
 
-    soup = bs4.BeautifulSoup(page, features="html.parser")
+    soup = parse_html(page, parse_only=bs4.SoupStrainer("div", class_="TierRank"))
 
     # to remove leading and trailing /n and /t
     elo = soup.find("div", class_="TierRank")
@@ -46,92 +57,165 @@ async def stalk_player_op_gg(sum_name: str, session: aiohttp.ClientSession = Non
         return "Unknown"
 
 
-async def add_player_rank(player: Player, session: aiohttp.ClientSession = None):
+async def add_player_rank(
+    player: Player,
+    session: aiohttp.ClientSession = None,
+    rank_store: RankStore = None,
+):
     """
     :description: Calls stalk player op gg using the summoner name of the given Player and adds a Rank obj to the Player.
     :param player: A Player obj with a summoner name.
     :type player: Player
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
     :return: None
     :rtype: None
     """
+    if rank_store is not None:
+        stored = await rank_store.get_rank(player.summoner_name)
+        if stored is not None:
+            rank_string, lp = stored
+            player.rank = Rank(rank_string=rank_string, lp=lp)
+            return
+
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            return await add_player_rank(player, session)
+        async with http_client.create_session() as session:
+            return await add_player_rank(player, session, rank_store)
 
-    player.rank = Rank(
-        rank_string=await stalk_player_op_gg(player.summoner_name, session)
-    )
+    rank_string = await stalk_player_op_gg(player.summoner_name, session)
+    player.rank = Rank(rank_string=rank_string)
+
+    # known ranks and unranked players are stored, an unknown rank is a failed lookup
+    if rank_store is not None and player.rank.rank_int >= 0:
+        await rank_store.put_rank(player.summoner_name, rank_string)
     return
 
 
-async def add_team_ranks(team: Team, session: aiohttp.ClientSession = None):
+async def add_team_ranks(
+    team: Team, session: aiohttp.ClientSession = None, rank_store: RankStore = None
+):
     """
     :description: Calls add player rank for each player of the given team. Also sets the average and max team rank.
     :param team: A team with a list of players.
     :type team: Team
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
     :return: None
     :rtype: None
     """
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            return await add_team_ranks(team, session)
+        async with http_client.create_session() as session:
+            return await add_team_ranks(team, session, rank_store)
 
-    await asyncio.gather(*(add_player_rank(player, session) for player in team.players))
+    await asyncio.gather(
+        *(add_player_rank(player, session, rank_store) for player in team.players)
+    )
 
     calc_average_and_max_team_rank(team)
     return
 
 
+async def add_teams_ranks(
+    teams: List[Team],
+    session: aiohttp.ClientSession,
+    rank_store: RankStore = None,
+    concurrency: int = op_gg_rank_concurrency,
+    progress: StalkProgress = None,
+):
+    """
+    :description: Stalks the ranks of all players of the given teams through one bounded work queue,
+    so the number of parallel requests does not depend on team boundaries. Afterwards the team ranks are calculated.
+    :param teams: The teams whose players should get ranks.
+    :type teams: List[Team]
+    :param session: The session used for all requests.
+    :type session: aiohttp.ClientSession
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
+    :param concurrency: The maximum number of players stalked at the same time.
+    :type concurrency: int
+    :param progress: When given, counts the finished players.
+    :type progress: StalkProgress
+    :return: None
+    :rtype: None
+    """
+    players = [player for team in teams for player in team.players]
+    if progress is not None:
+        progress.start_players(len(players))
+
+    async def rank_player(player: Player):
+        await add_player_rank(player, session, rank_store)
+        if progress is not None:
+            progress.player_finished()
+
+    await map_bounded(rank_player, players, concurrency)
+
+    for team in teams:
+        calc_average_and_max_team_rank(team)
+    return
+
+
 async def add_team_list_ranks(
-    team_list: TeamList, session: aiohttp.ClientSession = None
+    team_list: TeamList,
+    session: aiohttp.ClientSession = None,
+    rank_store: RankStore = None,
+    progress: StalkProgress = None,
 ):
     """
-    :description: Calls add team ranks for each team in the given team list obj.
+    :description: Adds ranks to all players of the given team list obj and calculates the team ranks.
     :param team_list: A team list with a list of teams.
     :type team_list: TeamList
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
+    :param progress: When given, counts the finished players.
+    :type progress: StalkProgress
     :return: None
     :rtype: None
     """
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            return await add_team_list_ranks(team_list, session)
+        async with http_client.create_session() as session:
+            return await add_team_list_ranks(team_list, session, rank_store, progress)
 
-    # calling gather here causes instability. Due to too many calls?
-    for team in team_list.teams:
-        await add_team_ranks(team, session)
-    # await asyncio.gather(*(add_team_ranks(team, session) for team in team_list.teams))
+    await add_teams_ranks(team_list.teams, session, rank_store, progress=progress)
     return
 
 
 async def add_team_list_list_ranks(
-    team_list_list: TeamListList, session: aiohttp.ClientSession = None
+    team_list_list: TeamListList,
+    session: aiohttp.ClientSession = None,
+    rank_store: RankStore = None,
+    progress: StalkProgress = None,
 ):
     """
-    :description: Calls add team list ranks for each team list in the given team list list obj.
+    :description: Adds ranks to all players of the given team list list obj and calculates the team ranks.
     :param team_list_list: A team list list with a list of team lists.
     :type team_list_list: TeamListList
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
+    :param progress: When given, counts the finished players.
+    :type progress: StalkProgress
     :return: None
     :rtype: None
     """
     if session is None:
-        # custom connector to limit parallel connection pool, to avoid crashes
-        conn = aiohttp.TCPConnector(limit=20)
-        async with aiohttp.ClientSession(connector=conn) as session:
-            return await add_team_list_list_ranks(team_list_list, session)
-
-    # calling gather here causes instability. Due to too many calls?
-    for team_list in team_list_list.team_lists:
-        await add_team_list_ranks(team_list, session)
-    # await asyncio.gather(*(add_team_list_ranks(team_list, session) for team_list in team_list_list.team_lists))
-
+        async with http_client.create_session() as session:
+            return await add_team_list_list_ranks(
+                team_list_list, session, rank_store, progress
+            )
+
+    await add_teams_ranks(
+        [team for team_list in team_list_list.team_lists for team in team_list.teams],
+        session,
+        rank_store,
+        progress=progress,
+    )
     return
 
 
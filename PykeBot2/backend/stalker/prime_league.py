@@ -6,31 +6,206 @@ Handles scraping of the prime league page.
 import asyncio
 import logging
 import time
+import urllib.parse
 import aiohttp
 import bs4
+from typing import AsyncIterator, List
 from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.webdriver import WebDriver
 from selenium.common.exceptions import NoSuchElementException
 from PykeBot2.models.data_models import TeamList, Team, Player, TeamListList
+from PykeBot2.models.errors import ServerErrorResponseError
 from selenium.common.exceptions import ElementClickInterceptedException
 from PykeBot2 import gecko_manager
+from PykeBot2.backend import http_client
+from PykeBot2.backend.html_parsing import links_only, parse_html
+from PykeBot2.backend.stalker.streaming import StalkUpdate, collect_stream
+from PykeBot2.backend.worker_pool import iter_bounded
+from PykeBot2.models.lookup_tables import prime_league_group_concurrency
 
 logger = logging.getLogger("pb_logger")
 
+# pages that are only read for a few elements are parsed partially
+swiss_tables_only = bs4.SoupStrainer("table", class_="table table-fixed-single")
+team_page_only = bs4.SoupStrainer(["title", "ul"])
 
-async def stalk_prime_league_season(prime_league_season_link: str, headless=True):
+
+async def stalk_prime_league_season(
+    prime_league_season_link: str,
+    session: aiohttp.ClientSession = None,
+    headless=True,
+):
     """
-    :description: Uses Selenium to open the link and gather all group links from it,
+    :description: Gathers all group links of the season over http, using Selenium only as a fallback,
     further calls stalk prime league group on all groups.
     :param prime_league_season_link: A valid link to a prime league season.
     :type prime_league_season_link: str
+    :param session: When a session already exits, it should be reused as much as possible for better performance.
+    :type session: aiohttp.ClientSession
     :param headless: Whether the browser should be headless or not. Use head for debugging purposes.
     :type headless: bool
     :return: TeamListList object containing all gathered information.
     :rtype: TeamListList
     """
+    return await collect_stream(
+        stream_prime_league_season(prime_league_season_link, session, headless)
+    )
+
+
+async def stream_prime_league_season(
+    prime_league_season_link: str,
+    session: aiohttp.ClientSession = None,
+    headless=True,
+) -> AsyncIterator[StalkUpdate]:
+    """
+    :description: Streaming version of stalk prime league season, yields an update for every finished group.
+    :param prime_league_season_link: A valid link to a prime league season.
+    :type prime_league_season_link: str
+    :param session: When a session already exits, it should be reused as much as possible for better performance.
+    :type session: aiohttp.ClientSession
+    :param headless: Whether the browser should be headless or not. Use head for debugging purposes.
+    :type headless: bool
+    :return: Async iterator over updates with the TeamList of the finished group as partial
+    and a TeamListList of all finished groups as result.
+    :rtype: AsyncIterator[StalkUpdate]
+    """
+
+    if session is None:
+        async with http_client.create_session() as session:
+            async for update in stream_prime_league_season(
+                prime_league_season_link, session, headless
+            ):
+                yield update
+        return
+
+    group_links = []
+    try:
+        group_links = await discover_group_links_http(prime_league_season_link, session)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ServerErrorResponseError) as e:
+        logger.debug(f"Http discovery of {prime_league_season_link} failed with {type(e)}")
+
+    if len(group_links) == 0:
+        logger.debug(f"Falling back to the browser for {prime_league_season_link}")
+        page_source = await gecko_manager.run_in_browser(
+            load_prime_league_season_page, prime_league_season_link, headless=headless
+        )
+        group_links = find_group_links(page_source)
+
+    async for update in stream_prime_league_groups(group_links, session):
+        yield update
+
+
+def find_group_stage_container(soup: bs4.BeautifulSoup):
+    """
+    :description: Finds the Gruppenphase section of a season page.
+    :param soup: The parsed season page.
+    :type soup: bs4.BeautifulSoup
+    :return: The section or None if the page has none.
+    :rtype: bs4.element.Tag
+    """
+    box_container = soup.find_all("section", class_="boxed-section")
+    gruppenphase = "Gruppenphase"
+
+    group_stage_container = None
+    for box in box_container:
+        title = box.find_all("h2")
+        if len(title) > 0:
+            if gruppenphase in title[0].text:
+                group_stage_container = box
+    return group_stage_container
+
+
+def find_group_links(page: str) -> List[str]:
+    """
+    :description: Extracts the group links from the Gruppenphase section of a season page.
+    :param page: The html of the season page.
+    :type page: str
+    :return: The unique group links in page order, empty if the section was not found.
+    :rtype: List[str]
+    """
+    soup = parse_html(page)
+    group_stage_container = find_group_stage_container(soup)
+    if group_stage_container is None:
+        return []
+
+    # extract all group-links
+    group_links = [
+        link["href"] for link in group_stage_container.find_all("a", href=True)
+    ]
+
+    group_links = list(dict.fromkeys(group_links))
+
+    return list(filter(filter_group_links, group_links))
+
+
+async def discover_group_links_http(
+    prime_league_season_link: str, session: aiohttp.ClientSession
+) -> List[str]:
+    """
+    :description: Finds the group links of a season without a browser.
+    The Gruppenphase section is rendered on the server with one content-subsection per division.
+    Divisions whose groups are not part of the season page are loaded from the links in their subsection,
+    all of them concurrently.
+    :param prime_league_season_link: A valid link to a prime league season.
+    :type prime_league_season_link: str
+    :param session: The session used for all requests.
+    :type session: aiohttp.ClientSession
+    :return: The group links, empty if a division could not be resolved, so the browser is needed.
+    :rtype: List[str]
+    """
+    page = await http_client.fetch_text(session, prime_league_season_link)
+    soup = parse_html(page)
+    group_stage_container = find_group_stage_container(soup)
+    if group_stage_container is None:
+        return []
+
+    subsections = group_stage_container.find_all("div", class_="content-subsection")
+    if len(subsections) == 0:
+        subsections = [group_stage_container]
+
+    group_links = []
+    division_links = []
+    for subsection in subsections:
+        links = list(
+            dict.fromkeys(link["href"] for link in subsection.find_all("a", href=True))
+        )
+        subsection_group_links = [link for link in links if filter_group_links(link)]
+        if len(subsection_group_links) > 0:
+            group_links.extend(subsection_group_links)
+        elif len(links) > 0:
+            # the groups of this division are only listed on the division page
+            division_links.extend(links)
+        else:
+            # a collapsed division that is filled by javascript
+            return []
+
+    if len(division_links) > 0:
+        division_pages = await asyncio.gather(
+            *(http_client.fetch_text(session, link) for link in division_links)
+        )
+        for division_page in division_pages:
+            division_soup = parse_html(division_page, parse_only=links_only)
+            links = [link["href"] for link in division_soup.find_all("a", href=True)]
+            division_group_links = [link for link in links if filter_group_links(link)]
+            if len(division_group_links) == 0:
+                # the groups of this division are filled by javascript as well
+                return []
+            group_links.extend(division_group_links)
 
-    driver = gecko_manager.open_session(headless)
+    return list(dict.fromkeys(group_links))
 
+
+def load_prime_league_season_page(driver: WebDriver, prime_league_season_link: str) -> str:
+    """
+    :description: Opens the season page and expands the group stage containers.
+    Blocks while the browser works, so it has to be run through gecko_manager.run_in_browser.
+    :param driver: The webdriver to use.
+    :type driver: WebDriver
+    :param prime_league_season_link: A valid link to a prime league season.
+    :type prime_league_season_link: str
+    :return: The page source after expanding.
+    :rtype: str
+    """
     # TODO add error handling
     driver.get(prime_league_season_link)
 
@@ -57,38 +232,61 @@ async def stalk_prime_league_season(prime_league_season_link: str, headless=True
             div_button.click()
             click_counter -= 1
 
-    soup = bs4.BeautifulSoup(driver.page_source, features="html.parser")
-    box_container = soup.find_all("section", class_="boxed-section")
-    gruppenphase = "Gruppenphase"
-
-    for box in box_container:
-        title = box.find_all("h2")
-        if len(title) > 0:
-            if gruppenphase in title[0].text:
-                group_stage_container = box
-
-    # extract all group-links
-    group_links = [
-        link["href"] for link in group_stage_container.find_all("a", href=True)
-    ]
+    return driver.page_source
 
-    group_links = list(dict.fromkeys(group_links))
 
-    group_links = filter(filter_group_links, group_links)
-
-    # close web session
-    gecko_manager.quit_session(driver)
+async def stalk_prime_league_groups(
+    group_links: List[str],
+    session: aiohttp.ClientSession,
+    concurrency: int = prime_league_group_concurrency,
+) -> TeamListList:
+    """
+    :description: Stalks the given prime league groups concurrently, at most concurrency groups at the same time.
+    The connections per host are further capped by the session, failed page requests are repeated.
+    :param group_links: Valid links to prime league groups.
+    :type group_links: List[str]
+    :param session: The session used for all requests.
+    :type session: aiohttp.ClientSession
+    :param concurrency: The maximum number of groups stalked at the same time.
+    :type concurrency: int
+    :return: TeamListList object containing a TeamList per group in the order of the links.
+    :rtype: TeamListList
+    """
+    return await collect_stream(
+        stream_prime_league_groups(group_links, session, concurrency)
+    )
 
-    # custom connector to limit parallel connection pool, to avoid crashes
-    conn = aiohttp.TCPConnector(limit=20)
-    async with aiohttp.ClientSession(connector=conn) as session:
-        team_lists = []
-        for link in group_links:
-            team_lists.append(await stalk_prime_league_group(link, session))
-        # calling gather here causes instability. Due to too many calls?
-        # team_lists = await asyncio.gather(*(stalk_prime_league_group(link, session) for link in group_links))
 
-    return TeamListList(team_lists)
+async def stream_prime_league_groups(
+    group_links: List[str],
+    session: aiohttp.ClientSession,
+    concurrency: int = prime_league_group_concurrency,
+) -> AsyncIterator[StalkUpdate]:
+    """
+    :description: Streaming version of stalk prime league groups, yields an update as soon as a group finished.
+    :param group_links: Valid links to prime league groups.
+    :type group_links: List[str]
+    :param session: The session used for all requests.
+    :type session: aiohttp.ClientSession
+    :param concurrency: The maximum number of groups stalked at the same time.
+    :type concurrency: int
+    :return: Async iterator over updates with the TeamList of the finished group as partial
+    and a TeamListList of all finished groups in the order of the links as result.
+    :rtype: AsyncIterator[StalkUpdate]
+    """
+    if len(group_links) == 0:
+        yield StalkUpdate(TeamListList([]), TeamListList([]))
+        return
+
+    team_lists = [None] * len(group_links)
+    async for index, team_list in iter_bounded(
+        lambda link: stalk_prime_league_group(link, session), group_links, concurrency
+    ):
+        team_lists[index] = team_list
+        finished = [group for group in team_lists if group is not None]
+        yield StalkUpdate(
+            team_list, TeamListList(finished), len(finished), len(group_links)
+        )
 
 
 def filter_group_links(link):
@@ -125,7 +323,8 @@ async def stalk_prime_league_group(
 ):
     """
     :description: Uses aiohttp requests to stalk a prime league group.
-    Also contains an extra case for the swiss starter group.
+    Also contains an extra case for the swiss starter group, which only needs the browser
+    if its ranking tables are not part of the html.
     :param prime_league_group_link: A valid link to a prime league group.
     :type prime_league_group_link: str
     :param session: When a session already exits, it should be reused as much as possible for better performance.
@@ -137,62 +336,38 @@ async def stalk_prime_league_group(
     """
 
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            return await stalk_prime_league_group(prime_league_group_link, session)
+        async with http_client.create_session() as session:
+            return await stalk_prime_league_group(
+                prime_league_group_link, session, headless
+            )
 
-    async with session.get(prime_league_group_link) as response:
-        # TODO add error handling
-        page = await response.text()
+    page = await http_client.fetch_text(session, prime_league_group_link)
 
     # Select Rangliste Container and find division name
-    soup = bs4.BeautifulSoup(page, features="html.parser")
+    soup = parse_html(page)
     list_container = soup.find(
         "table", class_="table table-ranking"
     )
 
     # extra case for swiss starter since it uses a different table and needs selenium as far as I know
     if list_container is None:
-        driver = gecko_manager.open_session(headless)
-
-        driver.get(prime_league_group_link)
-
-        # wait a moment for the full page to load
-        time.sleep(1)
-
-        # click away cookie banner
-        try:
-            cookie_no_button = driver.find_element(By.XPATH, '//*[@id="uc-btn-deny-banner"]')
-            cookie_no_button.click()
-        except NoSuchElementException as e:
-            # if there is no cookie banner just proceed
-            pass
-
-        # first make sure all tables are loaded by clicking on arrow button until no longer possible
+        team_links = []
         try:
-            next_button = driver.find_element(By.XPATH, '//*[@id="league-swiss-ranking-tab-main"]/div[2]/div[2]/a[3]')
-
-            while next_button.get_attribute("class") == "nav-next":
-                next_button.click()
-
-            # jump back to first page
-            driver.find_element(By.XPATH, '//*[@id="league-swiss-ranking-tab-main"]/div[2]/div[2]/a[1]/i').click()
-        except NoSuchElementException as e:
-            # if there is no next button then all elements must be already loaded
-            pass
-
-        soup = bs4.BeautifulSoup(driver.page_source, features="html.parser")
-
-        gecko_manager.quit_session(driver)
-
-        list_containers = soup.find_all("table", class_="table table-fixed-single")
+            team_links = await stalk_swiss_team_links_http(
+                prime_league_group_link, soup, session
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, ServerErrorResponseError) as e:
+            logger.debug(f"Http swiss stalk of {prime_league_group_link} failed with {type(e)}")
 
-        # extract all team-links
-        team_links = []
-        for list_container in list_containers:
-            team_links.extend(
-                [link["href"] for link in list_container.find_all("a", href=True)]
+        if len(team_links) == 0:
+            logger.debug(f"Falling back to the browser for {prime_league_group_link}")
+            page_source = await gecko_manager.run_in_browser(
+                load_swiss_group_page, prime_league_group_link, headless=headless
             )
 
+            soup = parse_html(page_source)
+            team_links = find_swiss_team_links(soup)
+
     else:
         # extract all team-links
         team_links = [link["href"] for link in list_container.find_all("a", href=True)]
@@ -217,6 +392,142 @@ async def stalk_prime_league_group(
     return TeamList(div_name, filter_teams)
 
 
+def find_swiss_team_links(soup: bs4.BeautifulSoup) -> List[str]:
+    """
+    :description: Extracts the team links from the swiss ranking tables of a page.
+    :param soup: The parsed swiss group page.
+    :type soup: bs4.BeautifulSoup
+    :return: The team links of all tables on the page.
+    :rtype: List[str]
+    """
+    list_containers = soup.find_all("table", class_="table table-fixed-single")
+
+    # extract all team-links
+    team_links = []
+    for list_container in list_containers:
+        team_links.extend(
+            [link["href"] for link in list_container.find_all("a", href=True)]
+        )
+    return team_links
+
+
+def find_swiss_page_urls(soup: bs4.BeautifulSoup, prime_league_group_link: str) -> List[str]:
+    """
+    :description: Reads the page navigation of the swiss ranking and builds the urls of all further pages.
+    The navigation links carry the page number in a page query parameter, the highest number found is the page count.
+    :param soup: The parsed first page of the swiss group.
+    :type soup: bs4.BeautifulSoup
+    :param prime_league_group_link: The link of the swiss group, used to resolve relative links.
+    :type prime_league_group_link: str
+    :return: The urls of the pages 2 to the page count, empty if the ranking has a single page.
+    :rtype: List[str]
+    """
+    ranking = soup.find(id="league-swiss-ranking-tab-main")
+    if ranking is None:
+        return []
+
+    page_count = 1
+    page_link = None
+    for link in ranking.find_all("a", href=True):
+        url = urllib.parse.urljoin(prime_league_group_link, link["href"])
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        try:
+            page = int(query.get("page", [link.get("data-page", "")])[0])
+        except ValueError:
+            continue
+        page_count = max(page_count, page)
+        page_link = url
+
+    if page_link is None:
+        return []
+
+    split = urllib.parse.urlsplit(page_link)
+    query = urllib.parse.parse_qs(split.query)
+    urls = []
+    for page in range(2, page_count + 1):
+        query["page"] = [str(page)]
+        urls.append(
+            urllib.parse.urlunsplit(
+                split._replace(query=urllib.parse.urlencode(query, doseq=True))
+            )
+        )
+    return urls
+
+
+async def stalk_swiss_team_links_http(
+    prime_league_group_link: str,
+    soup: bs4.BeautifulSoup,
+    session: aiohttp.ClientSession,
+) -> List[str]:
+    """
+    :description: Collects the team links of a swiss starter group without a browser.
+    The first page is already loaded, all further ranking pages are requested concurrently.
+    :param prime_league_group_link: A valid link to a prime league swiss starter group.
+    :type prime_league_group_link: str
+    :param soup: The parsed first page of the group.
+    :type soup: bs4.BeautifulSoup
+    :param session: The session used for all requests.
+    :type session: aiohttp.ClientSession
+    :return: The team links of all pages, empty if the ranking tables are not part of the html.
+    :rtype: List[str]
+    """
+    team_links = find_swiss_team_links(soup)
+    if len(team_links) == 0:
+        return []
+
+    pages = await asyncio.gather(
+        *(
+            http_client.fetch_text(session, url)
+            for url in find_swiss_page_urls(soup, prime_league_group_link)
+        )
+    )
+    for page in pages:
+        team_links.extend(
+            find_swiss_team_links(parse_html(page, parse_only=swiss_tables_only))
+        )
+    return team_links
+
+
+def load_swiss_group_page(driver: WebDriver, prime_league_group_link: str) -> str:
+    """
+    :description: Opens the swiss starter group page and loads all of its ranking tables.
+    Blocks while the browser works, so it has to be run through gecko_manager.run_in_browser.
+    :param driver: The webdriver to use.
+    :type driver: WebDriver
+    :param prime_league_group_link: A valid link to a prime league swiss starter group.
+    :type prime_league_group_link: str
+    :return: The page source with all tables loaded.
+    :rtype: str
+    """
+    driver.get(prime_league_group_link)
+
+    # wait a moment for the full page to load
+    time.sleep(1)
+
+    # click away cookie banner
+    try:
+        cookie_no_button = driver.find_element(By.XPATH, '//*[@id="uc-btn-deny-banner"]')
+        cookie_no_button.click()
+    except NoSuchElementException as e:
+        # if there is no cookie banner just proceed
+        pass
+
+    # first make sure all tables are loaded by clicking on arrow button until no longer possible
+    try:
+        next_button = driver.find_element(By.XPATH, '//*[@id="league-swiss-ranking-tab-main"]/div[2]/div[2]/a[3]')
+
+        while next_button.get_attribute("class") == "nav-next":
+            next_button.click()
+
+        # jump back to first page
+        driver.find_element(By.XPATH, '//*[@id="league-swiss-ranking-tab-main"]/div[2]/div[2]/a[1]/i').click()
+    except NoSuchElementException as e:
+        # if there is no next button then all elements must be already loaded
+        pass
+
+    return driver.page_source
+
+
 async def stalk_prime_league_team(
     prime_league_team_link: str, session: aiohttp.ClientSession = None
 ):
@@ -231,22 +542,19 @@ async def stalk_prime_league_team(
     """
 
     if session is None:
-        async with aiohttp.ClientSession() as session:
+        async with http_client.create_session() as session:
             return await stalk_prime_league_team(prime_league_team_link, session)
 
-    async with session.get(prime_league_team_link) as response:
-        # TODO add error handling
-        page = await response.text()
+    page = await http_client.fetch_text(session, prime_league_team_link)
 
     # Select Teammitglieder Container and find team name
-    soup = bs4.BeautifulSoup(page, features="html.parser")
+    soup = parse_html(page, parse_only=team_page_only)
     player_container = soup.find("ul", class_="content-portrait-grid-l")
 
     # check if the team was deleted
     if player_container is None:
         return None
 
-    team_container = soup.find("div", class_="content-portrait-head")
     # behind the team name is always " « League Teams « Prime League", which needs to be removed
     # this solution will fail if a team uses « in their name
     team_name = soup.title.text.split("«")[0].strip()
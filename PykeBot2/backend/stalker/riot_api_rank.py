@@ -6,73 +6,151 @@ Uses the riot api to fetch the ranks of players
 
 import asyncio
 import logging
-import ssl
-
+import weakref
 import aiohttp
-import time
 import json
-import certifi
+from typing import List
 from PykeBot2.models.data_models import Player, Rank, Team, TeamList, TeamListList
+from PykeBot2.backend import http_client
+from PykeBot2.backend.progress import StalkProgress
+from PykeBot2.backend.rank_store import RankStore
+from PykeBot2.backend.worker_pool import map_bounded
+from PykeBot2.models.lookup_tables import http_retries, riot_api_rank_concurrency
+from PykeBot2.backend.stalker.riot_rate_limiter import RateLimiter
 
 logger = logging.getLogger("pb_logger")
 
+# one limiter per session, so all queries sharing a session also share the rate limit
+_rate_limiters = weakref.WeakKeyDictionary()
+
 
-async def stalk_player_riot_api(sum_name: str, api_token: str, session=None) -> (str, int):
+def rate_limited(session: aiohttp.ClientSession) -> RateLimiter:
+    """
+    :description: Returns the rate limiter wrapping the given session, creating it on first use.
+    :param session: A plain session.
+    :type session: aiohttp.ClientSession
+    :return: The rate limiter for the session.
+    :rtype: RateLimiter
+    """
+    limiter = _rate_limiters.get(session)
+    if limiter is None:
+        limiter = RateLimiter(session)
+        _rate_limiters[session] = limiter
+    return limiter
+
+
+async def riot_api_get(
+    session: RateLimiter,
+    url: str,
+    method: str,
+    api_token: str,
+    retries: int = http_retries,
+) -> (int, bytes):
+    """
+    :description: Requests the url within the rate limit of the method.
+    A 429 response has already blocked the limiter until Retry-After passed, so the request is simply repeated,
+    at most retries times.
+    :param session: The rate limited session.
+    :type session: RateLimiter
+    :param url: The Riot api url.
+    :type url: str
+    :param method: The rate limit bucket of the request, summoner or league.
+    :type method: str
+    :param api_token: Valid Riot api token.
+    :type api_token: str
+    :param retries: How often a rate limited request is repeated.
+    :type retries: int
+    :return: Tuple of http status and body, the status is 429 if the last repetition was rate limited as well.
+    :rtype: (int, bytes)
+    """
+    headers = {"X-Riot-Token": api_token}
+    for _ in range(retries + 1):
+        async with await session.get(
+            url, method=method, headers=headers, ssl=http_client.ssl_context
+        ) as r:
+            r_data = await r.read()
+        if r.status != 429:
+            return r.status, r_data
+    logger.error(f"Request for {url} was rate limited {retries + 1} times.")
+    return r.status, r_data
+
+
+async def stalk_player_riot_api(
+    sum_name: str, api_token: str, session=None, rank_store: RankStore = None
+) -> (str, int):
     """
     Uses the riot api to find the soloQ ranking of the given player.
+    The summoner id of the player is cached in the rank store, so known players only need the league request.
+    A cached id that is no longer valid is dropped and looked up again.
     :param sum_name: Summoner name of the player.
     :type sum_name: str
     :param api_token: Valid Riot api token.
     :type api_token: str
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession or RateLimiter
+    :param rank_store: When given, used to cache the summoner id of the player.
+    :type rank_store: RankStore
     :return: Tuple with string representation of the rank of the player and the current lp or -1 if not found.
+    The rank string is unranked for a player without solo queue rank and empty if the lookup failed.
     :rtype: (str, int)
     """
 
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            session = RateLimiter(session)
-            return await stalk_player_riot_api(sum_name, api_token, session)
+        async with http_client.create_session() as session:
+            session = rate_limited(session)
+            return await stalk_player_riot_api(
+                sum_name, api_token, session, rank_store
+            )
+
+    # a plain session has to be wrapped to respect the rate limit
+    if isinstance(session, aiohttp.ClientSession):
+        session = rate_limited(session)
+
+    summoner_id = None
+    if rank_store is not None:
+        summoner_id = await rank_store.get_summoner_id(sum_name)
+    cached_summoner_id = summoner_id is not None
+
+    if summoner_id is None:
+        summoner_resource_url = (
+            f"https://euw1.api.riotgames.com/lol/summoner/v4/summoners/by-name/{sum_name}"
+        )
 
-    summoner_resource_url = (
-        f"https://euw1.api.riotgames.com/lol/summoner/v4/summoners/by-name/{sum_name}"
-    )
+        status, r_data = await riot_api_get(session, summoner_resource_url, "summoner", api_token)
+        if status == 429:
+            return "", -1
+        try:
+            r_json = json.loads(r_data)
+        except json.JSONDecodeError:
+            logger.error(f"Decoding failed for {r_data}")
+            return "", -1
 
-    headers = {"X-Riot-Token": api_token}
+        summoner_id = r_json.get("id", "None")
+        if summoner_id == "None":
+            return "", -1
 
-    sslcontext = ssl.create_default_context(cafile=certifi.where())
+        if rank_store is not None:
+            await rank_store.put_summoner_id(sum_name, summoner_id)
 
-    async with await session.get(summoner_resource_url, headers=headers, ssl=sslcontext) as r:
-        r_json = await r.json()
+    league_resource_url = f"https://euw1.api.riotgames.com/lol/league/v4/entries/by-summoner/{summoner_id}"
 
-    if r.status == 429:
-        logger.debug(
-            f"Rate limit exceeded! {session.request_counter} Requests made in {time.monotonic() - session.start_time} seconds."
-        )
-        await asyncio.sleep(60)
-        return await stalk_player_riot_api(sum_name, api_token, session)
-    summoner_id = r_json.get("id", "None")
-    if summoner_id == "None":
-        return "", -1
+    status, r_data = await riot_api_get(session, league_resource_url, "league", api_token)
+    # the cached summoner id is no longer valid, e.g. the account was transferred, so look it up again
+    if status == 404 and cached_summoner_id:
+        logger.debug(f"Cached summoner id for {sum_name} is no longer valid")
+        await rank_store.delete_summoner_id(sum_name)
+        return await stalk_player_riot_api(sum_name, api_token, session, rank_store)
 
-    league_resource_url = f"https://euw1.api.riotgames.com/lol/league/v4/entries/by-summoner/{summoner_id}"
+    if status != 200:
+        logger.error(f"League lookup for {sum_name} resulted in status {status}")
+        return "", -1
 
-    async with await session.get(league_resource_url, headers=headers, ssl=sslcontext) as r:
-        r_data = await r.read()
     try:
         r_json = json.loads(r_data)
     except json.JSONDecodeError:
         logger.error(f"Decoding failed for {r_data}")
         return "", -1
 
-    if r.status == 429:
-        logger.debug(
-            f"Rate limit exceeded! {session.request_counter} Requests made in {time.monotonic() - session.start_time} seconds."
-        )
-        await asyncio.sleep(60)
-        return await stalk_player_riot_api(sum_name, api_token, session)
-
     if type(r_json) is dict:
         r_json = [r_json]
     elif type(r_json) is None:
@@ -88,12 +166,14 @@ async def stalk_player_riot_api(sum_name: str, api_token: str, session=None) ->
             lp = league["leaguePoints"]
             break
     if tier == "":
-        # logger.debug(f"{sum_name} has no rank. {r_json}")
-        return "", -1
+        # the lookup succeeded, the player has no solo queue rank
+        return "unranked", -1
     return f"{tier} {rank}", lp
 
 
-async def add_player_rank(player: Player, api_token: str, session=None):
+async def add_player_rank(
+    player: Player, api_token: str, session=None, rank_store: RankStore = None
+):
     """
     :description: Calls stalk player riot using the summoner name of the given Player and adds a Rank obj to the Player.
     :param player: A Player obj with a summoner name.
@@ -102,20 +182,41 @@ async def add_player_rank(player: Player, api_token: str, session=None):
     :type api_token: str
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession  or RateLimiter
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
     :return: None
     :rtype: None
     """
+    if rank_store is not None:
+        stored = await rank_store.get_rank(player.summoner_name)
+        if stored is not None:
+            rank_string, lp = stored
+            player.rank = Rank(rank_string=rank_string, lp=lp)
+            return
+
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            session = RateLimiter(session)
-            return await add_player_rank(player, api_token, session)
+        async with http_client.create_session() as session:
+            session = rate_limited(session)
+            return await add_player_rank(player, api_token, session, rank_store)
 
-    rank_string, lp = await stalk_player_riot_api(player.summoner_name, api_token, session)
+    # a plain session has to be wrapped to respect the rate limit
+    if isinstance(session, aiohttp.ClientSession):
+        session = rate_limited(session)
+
+    rank_string, lp = await stalk_player_riot_api(
+        player.summoner_name, api_token, session, rank_store
+    )
     player.rank = Rank(rank_string=rank_string, lp=lp)
+
+    # known ranks and unranked players are stored, an unknown rank is a failed lookup
+    if rank_store is not None and player.rank.rank_int >= 0:
+        await rank_store.put_rank(player.summoner_name, rank_string, lp)
     return
 
 
-async def add_team_ranks(team: Team, api_token: str, session=None):
+async def add_team_ranks(
+    team: Team, api_token: str, session=None, rank_store: RankStore = None
+):
     """
     :description: Calls add player rank for each player of the given team. Also sets the average and max team rank.
     :param team: A team with a list of players.
@@ -124,72 +225,157 @@ async def add_team_ranks(team: Team, api_token: str, session=None):
     :type api_token: str
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession or RateLimiter
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
     :return: None
     :rtype: None
     """
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            session = RateLimiter(session)
-            return await add_team_ranks(team, api_token, session)
+        async with http_client.create_session() as session:
+            session = rate_limited(session)
+            return await add_team_ranks(team, api_token, session, rank_store)
+
+    # a plain session has to be wrapped to respect the rate limit
+    if isinstance(session, aiohttp.ClientSession):
+        session = rate_limited(session)
 
     await asyncio.gather(
-        *(add_player_rank(player, api_token, session) for player in team.players)
+        *(
+            add_player_rank(player, api_token, session, rank_store)
+            for player in team.players
+        )
     )
 
     calc_average_and_max_team_rank(team)
     return
 
 
-async def add_team_list_ranks(team_list: TeamList, api_token: str, session=None):
+async def add_teams_ranks(
+    teams: List[Team],
+    api_token: str,
+    session: RateLimiter,
+    rank_store: RankStore = None,
+    concurrency: int = riot_api_rank_concurrency,
+    progress: StalkProgress = None,
+):
+    """
+    :description: Stalks the ranks of all players of the given teams through one bounded work queue,
+    so the throughput is set by the rate limit and not by team boundaries. Afterwards the team ranks are calculated.
+    :param teams: The teams whose players should get ranks.
+    :type teams: List[Team]
+    :param api_token: Valid Riot api token.
+    :type api_token: str
+    :param session: The rate limited session used for all requests.
+    :type session: RateLimiter
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
+    :param concurrency: The maximum number of players stalked at the same time.
+    :type concurrency: int
+    :param progress: When given, counts the finished players.
+    :type progress: StalkProgress
+    :return: None
+    :rtype: None
+    """
+    players = [player for team in teams for player in team.players]
+    if progress is not None:
+        # every stalked player needs at least a league request
+        progress.start_players(
+            len(players),
+            lambda: session.request_counter,
+            session.sustained_rate("league"),
+        )
+
+    async def rank_player(player: Player):
+        await add_player_rank(player, api_token, session, rank_store)
+        if progress is not None:
+            progress.player_finished()
+
+    await map_bounded(rank_player, players, concurrency)
+
+    for team in teams:
+        calc_average_and_max_team_rank(team)
+    return
+
+
+async def add_team_list_ranks(
+    team_list: TeamList,
+    api_token: str,
+    session=None,
+    rank_store: RankStore = None,
+    progress: StalkProgress = None,
+):
     """
-    :description: Calls add team ranks for each team in the given team list obj.
+    :description: Adds ranks to all players of the given team list obj and calculates the team ranks.
     :param team_list: A team list with a list of teams.
     :type team_list: TeamList
     :param api_token: Valid Riot api token.
     :type api_token: str
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession or RateLimiter
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
+    :param progress: When given, counts the finished players.
+    :type progress: StalkProgress
     :return: None
     :rtype: None
     """
     if session is None:
-        async with aiohttp.ClientSession() as session:
-            session = RateLimiter(session)
-            return await add_team_list_ranks(team_list, api_token, session)
-
-    # calling gather here causes instability. Due to too many calls?
-    for team in team_list.teams:
-        await add_team_ranks(team, api_token, session)
-    # await asyncio.gather(*(add_team_ranks(team, session) for team in team_list.teams))
+        async with http_client.create_session() as session:
+            session = rate_limited(session)
+            return await add_team_list_ranks(
+                team_list, api_token, session, rank_store, progress
+            )
+
+    # a plain session has to be wrapped to respect the rate limit
+    if isinstance(session, aiohttp.ClientSession):
+        session = rate_limited(session)
+
+    await add_teams_ranks(
+        team_list.teams, api_token, session, rank_store, progress=progress
+    )
     return
 
 
 async def add_team_list_list_ranks(
-    team_list_list: TeamListList, api_token: str, session=None
+    team_list_list: TeamListList,
+    api_token: str,
+    session=None,
+    rank_store: RankStore = None,
+    progress: StalkProgress = None,
 ):
     """
-    :description: Calls add team list ranks for each team list in the given team list list obj.
+    :description: Adds ranks to all players of the given team list list obj and calculates the team ranks.
     :param team_list_list: A team list list with a list of team lists.
     :type team_list_list: TeamListList
     :param api_token: Valid Riot api token.
     :type api_token: str
     :param session: When a session already exits, it should be reused as much as possible for better performance.
     :type session: aiohttp.ClientSession or RateLimiter
+    :param rank_store: When given, ranks seen recently are taken from the store instead of being stalked again.
+    :type rank_store: RankStore
+    :param progress: When given, counts the finished players.
+    :type progress: StalkProgress
     :return: None
     :rtype: None
     """
     if session is None:
-        # custom connector to limit parallel connection pool, to avoid crashes
-        conn = aiohttp.TCPConnector(limit=20)
-        async with aiohttp.ClientSession(connector=conn) as session:
-            session = RateLimiter(session)
-            return await add_team_list_list_ranks(team_list_list, api_token, session)
-
-    # calling gather here causes instability. Due to too many calls?
-    for team_list in team_list_list.team_lists:
-        await add_team_list_ranks(team_list, api_token, session)
-    # await asyncio.gather(*(add_team_list_ranks(team_list, session) for team_list in team_list_list.team_lists))
-
+        async with http_client.create_session() as session:
+            session = rate_limited(session)
+            return await add_team_list_list_ranks(
+                team_list_list, api_token, session, rank_store, progress
+            )
+
+    # a plain session has to be wrapped to respect the rate limit
+    if isinstance(session, aiohttp.ClientSession):
+        session = rate_limited(session)
+
+    await add_teams_ranks(
+        [team for team_list in team_list_list.team_lists for team in team_list.teams],
+        api_token,
+        session,
+        rank_store,
+        progress=progress,
+    )
     return
 
 
@@ -226,52 +412,3 @@ def calc_average_and_max_team_rank(team: Team):
     team.max_rank = Rank(rank_int=max_rank.rank_int, lp=max_rank.lp)
     team.top5_average_rank = Rank(rank_int=top5_average_rank, default_for_master_plus=True)
     return
-
-
-class RateLimiter:
-    # Personal/Test key rate limit
-    # rate = 5/6
-    # max_tokens = 20.0
-
-    # Production key rate limit
-    rate = 50  # should be 50
-    max_tokens = 500  # 500
-    regen_after = 60.0
-
-    request_counter = 0
-    start_time = 0
-
-    def __init__(self, session: aiohttp.ClientSession):
-        self.session = session
-        self.tokens = self.rate
-        self.updated_at = time.monotonic()
-
-    async def get(self, *args, **kwargs):
-        await self.wait_for_tokens()
-        if self.request_counter == 0:
-            self.start_time = time.monotonic()
-        self.request_counter += 1
-        return self.session.get(*args, **kwargs)
-
-    async def wait_for_tokens(self):
-        while self.tokens <= 1.0:
-            self.add_new_tokens()
-            # should be shorter and use exponential back-off
-            await asyncio.sleep(self.regen_after)
-        self.tokens -= 1.0
-
-    def add_new_tokens(self):
-        now = time.monotonic()
-        time_since_update = now - self.updated_at
-        new_tokens = float(time_since_update) * self.rate
-        if self.tokens + new_tokens >= 1.0:
-            self.tokens = min(self.tokens + new_tokens, self.max_tokens)
-            self.updated_at = now
-
-
-"""    def add_new_tokens(self):
-        now = time.monotonic()
-        time_since_update = now - self.updated_at
-        if time_since_update > self.regen_after:
-            self.tokens = self.max_tokens
-            self.updated_at = now"""
@@ -0,0 +1,364 @@
+"""
+Rate limiter for the Riot api that models the app and method rate limits as fixed time windows.
+The limits and current counts are learned from the X-App-Rate-Limit and X-Method-Rate-Limit headers
+and a 429 response blocks the limited bucket for exactly as long as Retry-After asks for.
+The limiter uses a clock object, so its throughput can be simulated offline with SimulatedClock.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Mapping, Tuple
+import aiohttp
+from PykeBot2.models.lookup_tables import (
+    riot_app_rate_limits,
+    riot_method_rate_limits,
+    riot_default_retry_after,
+)
+
+logger = logging.getLogger("pb_logger")
+
+
+class MonotonicClock:
+    """
+    :description: Real clock based on time.monotonic and asyncio.sleep.
+    """
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock:
+    """
+    :description: Deterministic clock for benchmarks and tests, sleeping advances the time instantly.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def now(self) -> float:
+        return self.time
+
+    def advance(self, seconds: float):
+        self.time += max(seconds, 0.0)
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        # still give other coroutines the chance to run
+        await asyncio.sleep(0)
+
+
+def parse_rate_limit_header(header: str) -> List[Tuple[int, float]]:
+    """
+    :description: Parses a rate limit header like "20:1,100:120" into a list of (count, seconds) tuples.
+    The same format is used for the limits and the *-Count headers.
+    :param header: The header value.
+    :type header: str
+    :return: List of (count, seconds) tuples, empty for an empty or broken header.
+    :rtype: List[Tuple[int, float]]
+    """
+    windows = []
+    for part in header.split(","):
+        try:
+            count, seconds = part.strip().split(":")
+            windows.append((int(count), float(seconds)))
+        except ValueError:
+            continue
+    return windows
+
+
+class RateLimitWindow:
+    """
+    :description: A fixed window that allows limit requests per seconds, starting with the first request.
+    """
+
+    def __init__(self, limit: int, seconds: float):
+        self.limit = limit
+        self.seconds = seconds
+        self.start = None
+        self.count = 0
+
+    def _reset_if_expired(self, now: float):
+        if self.start is not None and now >= self.start + self.seconds:
+            self.start = None
+            self.count = 0
+
+    def delay(self, now: float) -> float:
+        """
+        :description: Seconds to wait until one more request fits into the window.
+        """
+        self._reset_if_expired(now)
+        if self.count < self.limit:
+            return 0.0
+        return self.start + self.seconds - now
+
+    def consume(self, now: float):
+        self._reset_if_expired(now)
+        if self.start is None:
+            self.start = now
+        self.count += 1
+
+    def sync(self, count: int, now: float):
+        """
+        :description: Adopts the count reported by the Riot api, if it knows of more requests than counted locally.
+        """
+        self._reset_if_expired(now)
+        if self.start is None:
+            self.start = now
+        self.count = max(self.count, count)
+
+
+class RateLimitBucket:
+    """
+    :description: A set of windows that all need to allow a request, plus a block set by Retry-After.
+    """
+
+    def __init__(self, name: str, limits: List[Tuple[int, float]]):
+        self.name = name
+        self.windows: List[RateLimitWindow] = [
+            RateLimitWindow(limit, seconds) for limit, seconds in limits
+        ]
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        delays = [window.delay(now) for window in self.windows]
+        delays.append(self.blocked_until - now)
+        return max(delays)
+
+    def consume(self, now: float):
+        for window in self.windows:
+            window.consume(now)
+
+    def update(self, limits_header: str, counts_header: str, now: float):
+        """
+        :description: Replaces the windows if the api reports different limits and syncs the counts.
+        """
+        limits = parse_rate_limit_header(limits_header or "")
+        if limits and limits != [(w.limit, w.seconds) for w in self.windows]:
+            logger.debug(f"Riot rate limits for {self.name} changed to {limits}")
+            old_windows = {window.seconds: window for window in self.windows}
+            self.windows = []
+            for limit, seconds in limits:
+                window = RateLimitWindow(limit, seconds)
+                old_window = old_windows.get(seconds)
+                if old_window is not None:
+                    window.start = old_window.start
+                    window.count = old_window.count
+                self.windows.append(window)
+        windows_by_seconds = {window.seconds: window for window in self.windows}
+        for count, seconds in parse_rate_limit_header(counts_header or ""):
+            window = windows_by_seconds.get(seconds)
+            if window is not None:
+                window.sync(count, now)
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+
+    def sustained_rate(self) -> float:
+        """
+        :description: Requests per second the bucket allows in the long run, set by its tightest window.
+        """
+        return min(
+            (window.limit / window.seconds for window in self.windows),
+            default=float("inf"),
+        )
+
+
+class RateLimiter:
+    """
+    :description: Wraps a ClientSession and delays requests so neither the app limit nor the limit of the
+    requested method is exceeded. Each request names its method, e.g. summoner or league, so every method
+    has its own bucket next to the shared app bucket.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        clock=None,
+        app_limits: List[Tuple[int, float]] = None,
+        method_limits: Dict[str, List[Tuple[int, float]]] = None,
+    ):
+        """
+        :description: Creates a new rate limiter, the limits are only the starting point until headers arrive.
+        :param session: The session used for the requests.
+        :type session: aiohttp.ClientSession
+        :param clock: Object with now and async sleep, standard is MonotonicClock.
+        :type clock: MonotonicClock or SimulatedClock
+        :param app_limits: List of (count, seconds) for the app limit, standard is riot_app_rate_limits.
+        :type app_limits: List[Tuple[int, float]]
+        :param method_limits: Maps methods to their list of (count, seconds), standard is riot_method_rate_limits.
+        :type method_limits: Dict[str, List[Tuple[int, float]]]
+        """
+        if clock is None:
+            clock = MonotonicClock()
+        if app_limits is None:
+            app_limits = riot_app_rate_limits
+        if method_limits is None:
+            method_limits = riot_method_rate_limits
+        self.session = session
+        self.clock = clock
+        self.app_bucket = RateLimitBucket("app", app_limits)
+        self.method_limits = method_limits
+        self.method_buckets: Dict[str, RateLimitBucket] = {}
+        self.request_counter = 0
+        self.start_time = 0
+
+    def method_bucket(self, method: str) -> RateLimitBucket:
+        bucket = self.method_buckets.get(method)
+        if bucket is None:
+            bucket = RateLimitBucket(method, self.method_limits.get(method, []))
+            self.method_buckets[method] = bucket
+        return bucket
+
+    def reserve(self, method: str) -> float:
+        """
+        :description: Takes a request from the app and method bucket if both allow it right now.
+        :param method: The method the request is made for.
+        :type method: str
+        :return: 0 if the request was reserved, else the seconds to wait before trying again.
+        :rtype: float
+        """
+        now = self.clock.now()
+        method_bucket = self.method_bucket(method)
+        delay = max(self.app_bucket.delay(now), method_bucket.delay(now))
+        if delay > 0:
+            return delay
+        self.app_bucket.consume(now)
+        method_bucket.consume(now)
+        if self.request_counter == 0:
+            self.start_time = now
+        self.request_counter += 1
+        return 0.0
+
+    def sustained_rate(self, method: str) -> float:
+        """
+        :description: Requests per second for the method the limiter allows in the long run.
+        :param method: The method the requests are made for.
+        :type method: str
+        :return: The rate of the tighter of the app and the method bucket, inf if neither has limits.
+        :rtype: float
+        """
+        return min(
+            self.app_bucket.sustained_rate(), self.method_bucket(method).sustained_rate()
+        )
+
+    async def acquire(self, method: str):
+        """
+        :description: Waits until a request for the method is allowed and reserves it.
+        :param method: The method the request is made for.
+        :type method: str
+        :return: None
+        :rtype: None
+        """
+        while True:
+            delay = self.reserve(method)
+            if delay <= 0:
+                return
+            await self.clock.sleep(delay)
+
+    def update_from_headers(self, method: str, status: int, headers: Mapping[str, str]):
+        """
+        :description: Learns limits and counts from the response headers and handles a 429 response
+        by blocking the limited bucket until Retry-After has passed.
+        :param method: The method the request was made for.
+        :type method: str
+        :param status: The http status of the response.
+        :type status: int
+        :param headers: The response headers.
+        :type headers: Mapping[str, str]
+        :return: None
+        :rtype: None
+        """
+        now = self.clock.now()
+        method_bucket = self.method_bucket(method)
+        self.app_bucket.update(
+            headers.get("X-App-Rate-Limit"), headers.get("X-App-Rate-Limit-Count"), now
+        )
+        method_bucket.update(
+            headers.get("X-Method-Rate-Limit"),
+            headers.get("X-Method-Rate-Limit-Count"),
+            now,
+        )
+
+        if status != 429:
+            return
+
+        try:
+            retry_after = float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = riot_default_retry_after
+        limit_type = headers.get("X-Rate-Limit-Type", "")
+        logger.debug(
+            f"Riot rate limit of type '{limit_type}' exceeded for {method} after {self.request_counter} requests, "
+            f"retrying after {retry_after} seconds."
+        )
+        if limit_type == "application":
+            self.app_bucket.block(now + retry_after)
+        else:
+            method_bucket.block(now + retry_after)
+
+    async def get(self, *args, method: str = "default", **kwargs):
+        """
+        :description: Waits for the rate limit and starts a get request.
+        Should be used as "async with await limiter.get(url, method=...) as response".
+        :param method: The method the request is made for, selects the method bucket.
+        :type method: str
+        :return: Async context manager yielding the response.
+        :rtype: RateLimitedRequest
+        """
+        await self.acquire(method)
+        return RateLimitedRequest(self, method, self.session.get(*args, **kwargs))
+
+
+class RateLimitedRequest:
+    """
+    :description: Async context manager around a request, that reports the response headers to the limiter.
+    """
+
+    def __init__(self, limiter: RateLimiter, method: str, request):
+        self.limiter = limiter
+        self.method = method
+        self.request = request
+
+    async def __aenter__(self):
+        response = await self.request.__aenter__()
+        self.limiter.update_from_headers(self.method, response.status, response.headers)
+        return response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self.request.__aexit__(exc_type, exc, tb)
+
+
+def simulate_throughput(
+    limiter: RateLimiter, methods: List[str], request_count: int
+) -> float:
+    """
+    :description: Benchmarks a limiter with a SimulatedClock offline by reserving request_count requests,
+    cycling through the given methods and advancing the clock whenever the limiter asks to wait.
+    :param limiter: A limiter created with a SimulatedClock.
+    :type limiter: RateLimiter
+    :param methods: The methods requested in turn, e.g. ["summoner", "league"].
+    :type methods: List[str]
+    :param request_count: The number of requests to simulate.
+    :type request_count: int
+    :return: The achieved requests per second in simulated time.
+    :rtype: float
+    """
+    assert isinstance(limiter.clock, SimulatedClock)
+    start = limiter.clock.now()
+    for i in range(request_count):
+        method = methods[i % len(methods)]
+        while True:
+            delay = limiter.reserve(method)
+            if delay <= 0:
+                break
+            limiter.clock.advance(delay)
+    duration = limiter.clock.now() - start
+    if duration == 0:
+        return float("inf")
+    return request_count / duration
@@ -0,0 +1,122 @@
+"""
+Defines the streaming stalker protocol.
+A streaming stalker is an async generator that yields a StalkUpdate whenever a part of its result is ready,
+e.g. a finished group of a season, so the parts can be shown to the user while the rest is still stalked.
+Every streaming stalker has a plain stalker counterpart that collects its stream.
+
+:author: Jonathan Decker
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional
+from PykeBot2.models.data_models import Payload, Team, TeamList
+
+logger = logging.getLogger("pb_logger")
+
+
+@dataclass
+class StalkUpdate:
+    """
+    :description: One step of a streaming stalk. partial holds only what was stalked since the last update,
+    result holds everything stalked so far in the order of the final result.
+    After the last update result is the complete result of the stalk.
+    done and total count the parts of the stalk, e.g. groups of a season, if the stalker knows them.
+    """
+
+    partial: Payload
+    result: Payload
+    done: Optional[int] = None
+    total: Optional[int] = None
+
+
+async def collect_stream(
+    stream: AsyncIterator[StalkUpdate],
+    on_update: Callable[[StalkUpdate], None] = None,
+    default: Payload = None,
+) -> Optional[Payload]:
+    """
+    :description: Runs a streaming stalker to its end and returns its complete result.
+    :param stream: The stream returned by a streaming stalker.
+    :type stream: AsyncIterator[StalkUpdate]
+    :param on_update: Called with every update, e.g. to send its partial result to the user.
+    :type on_update: Callable[[StalkUpdate], None]
+    :param default: Returned if the stream ended without any update.
+    :type default: Payload
+    :return: The result of the last update or default.
+    :rtype: Payload
+    """
+    result = default
+    async for update in stream:
+        result = update.result
+        if on_update is not None:
+            on_update(update)
+    return result
+
+
+class TeamBatcher:
+    """
+    :description: Collects the teams of a TeamList stalk that finish out of order.
+    Finished teams are handed out in batches, the result keeps the order in which the teams were found.
+    """
+
+    def __init__(self, name: str, team_count: int = 0, batch_size: int = 1):
+        """
+        :description: Prepares an empty TeamList with a place for every team.
+        :param name: Name of the TeamList, e.g. the tournament name.
+        :type name: str
+        :param team_count: Number of teams that will be added, if known. Further places are added on demand.
+        :type team_count: int
+        :param batch_size: Number of finished teams per partial result.
+        :type batch_size: int
+        """
+        assert batch_size > 0
+        self.name = name
+        self.batch_size = batch_size
+        self.teams: List[Optional[Team]] = [None] * team_count
+        self.batch: List[Team] = []
+        self.done = 0
+        # an unknown number of teams is not reported as total
+        self.total = team_count or None
+
+    def add(self, index: int, team: Optional[Team]) -> Optional[StalkUpdate]:
+        """
+        :description: Adds a finished team, teams that could not be stalked are given as None and skipped.
+        Skipped teams still count as done.
+        :param index: Position of the team in the result.
+        :type index: int
+        :param team: The finished team.
+        :type team: Team
+        :return: An update once batch_size teams finished since the last one, else None.
+        :rtype: StalkUpdate
+        """
+        if team is None:
+            self.done += 1
+            return None
+        if index >= len(self.teams):
+            self.teams.extend([None] * (index + 1 - len(self.teams)))
+        self.teams[index] = team
+        self.batch.append(team)
+        if len(self.batch) < self.batch_size:
+            return None
+        return self.flush()
+
+    def flush(self) -> StalkUpdate:
+        """
+        :description: Hands out the teams finished since the last update, used for the last batch.
+        :return: The update, its partial is empty if no team finished since the last one.
+        :rtype: StalkUpdate
+        """
+        batch = self.batch
+        self.batch = []
+        self.done += len(batch)
+        return StalkUpdate(
+            TeamList(self.name, batch), self.result(), self.done, self.total
+        )
+
+    def result(self) -> TeamList:
+        """
+        :description: The finished teams in their original order.
+        :rtype: TeamList
+        """
+        return TeamList(self.name, [team for team in self.teams if team is not None])
@@ -6,7 +6,8 @@ Handles scraping of summoners inn with focus on the hausarrest cup.
 import asyncio
 import logging
 import aiohttp
-import bs4
+from PykeBot2.backend import http_client
+from PykeBot2.backend.html_parsing import links_only, parse_html, title_only
 from PykeBot2.backend.stalker.prime_league import stalk_prime_league_team
 from PykeBot2.models.data_models import TeamList
 
@@ -26,7 +27,7 @@ async def stalk_summoners_inn_cup(
     :rtype: TeamList
     """
     if session is None:
-        async with aiohttp.ClientSession() as session:
+        async with http_client.create_session() as session:
             return await stalk_summoners_inn_cup(summoners_inn_cup_link, session)
 
     # edit url and cut any unneeded extensions
@@ -39,7 +40,7 @@ async def stalk_summoners_inn_cup(
         # TODO add error handling
         page = await response.text()
 
-    soup = bs4.BeautifulSoup(page, features="html.parser")
+    soup = parse_html(page, parse_only=title_only)
     title = soup.title.string.split("»")[0].strip()
 
     # get list of team links
@@ -47,7 +48,7 @@ async def stalk_summoners_inn_cup(
         # TODO add error handling
         page = await response.text()
 
-    soup = bs4.BeautifulSoup(page, features="html.parser")
+    soup = parse_html(page, parse_only=links_only)
 
     # somehow does not return the correct block, so grab all possible links instead and filter them
     # list_container = soup.find('table', class_="table table-fixed-single table-responsive")
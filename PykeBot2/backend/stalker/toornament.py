@@ -7,25 +7,75 @@ import asyncio
 import logging
 import aiohttp
 import bs4
-from PykeBot2.models.data_models import TeamList, Team, Player
+import urllib.parse
+from typing import AsyncIterator
+from PykeBot2.models.data_models import Team, Player
 from PykeBot2.models.errors import NotFoundResponseError, ServerErrorResponseError
+from PykeBot2.backend import http_client
+from PykeBot2.backend.html_parsing import parse_html
+from PykeBot2.backend.stalker.streaming import StalkUpdate, TeamBatcher, collect_stream
+from PykeBot2.backend.worker_pool import iter_bounded
+from PykeBot2.models.lookup_tables import (
+    stream_team_batch_size,
+    toornament_page_probe_window,
+    toornament_team_concurrency,
+)
 
 logger = logging.getLogger("pb_logger")
 
+# the participants pages only need the team containers
+team_container_only = bs4.SoupStrainer("div", class_="size-1-of-4")
+
 
 # TODO detect case: summoner names are private
 # TODO add URL checker
 
 
-async def stalk_toornament_tournament(toornament_link: str):
+async def stalk_toornament_tournament(
+    toornament_link: str, session: aiohttp.ClientSession = None
+):
     """
     Stalks all teams signed up for the given toornament and returns a TeamList Object
     :raises ServerErrorResponseError, NotFoundResponseError
     :param toornament_link: url to a tournament on toornament
     :type toornament_link: str
+    :param session: A session that can be reused, if none is given, a new one will be created
+    :type session: aiohttp.ClientSession
     :return: TeamList, containing the Team obj for each signed up team
     :rtype: TeamList
     """
+    return await collect_stream(stream_toornament_tournament(toornament_link, session))
+
+
+async def stream_toornament_tournament(
+    toornament_link: str,
+    session: aiohttp.ClientSession = None,
+    batch_size: int = stream_team_batch_size,
+    concurrency: int = toornament_team_concurrency,
+) -> AsyncIterator[StalkUpdate]:
+    """
+    Streaming version of stalk toornament tournament, yields an update whenever batch_size teams finished
+    and a last one once all teams finished
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param toornament_link: url to a tournament on toornament
+    :type toornament_link: str
+    :param session: A session that can be reused, if none is given, a new one will be created
+    :type session: aiohttp.ClientSession
+    :param batch_size: number of finished teams per update
+    :type batch_size: int
+    :param concurrency: maximum number of teams stalked at the same time
+    :type concurrency: int
+    :return: updates with a TeamList of the newly finished teams as partial and of all finished teams as result
+    :rtype: AsyncIterator[StalkUpdate]
+    """
+
+    if session is None:
+        async with http_client.create_session() as session:
+            async for update in stream_toornament_tournament(
+                toornament_link, session, batch_size, concurrency
+            ):
+                yield update
+        return
 
     # edit the link
     toornament_link_list = toornament_link.split("/")
@@ -35,58 +85,177 @@ async def stalk_toornament_tournament(toornament_link: str):
     participants_links = []
     base_url = "https://www.toornament.com"
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(edited_toornament_link) as response:
-            if response.status >= 500:
-                logger.error(
-                    f"Stalking {edited_toornament_link} resulted in a server error."
-                )
-                raise ServerErrorResponseError
+    async with session.get(edited_toornament_link) as response:
+        if response.status >= 500:
+            logger.error(
+                f"Stalking {edited_toornament_link} resulted in a server error."
+            )
+            raise ServerErrorResponseError
 
-            # check if toornament page was valid
-            if response.status == 404:
-                logger.error(
-                    f"No tournament could be found for {edited_toornament_link}."
-                )
-                raise NotFoundResponseError
-
-            page = await response.text()
-
-        toornament_soup = bs4.BeautifulSoup(page, features="html.parser")
-        team_container = toornament_soup.find_all("div", class_="size-1-of-4")
-
-        # extract toornament name
-        tournament_name = toornament_soup.select(
-            "#main-container > div.layout-section.header.highlight > div > section > div > div.information > h1"
-        )[0].text
-
-        # multiple team page test
-        count = 1
-        multipage_toornament = edited_toornament_link + "?page=1"
-        while True:
-            count += 1
-            multipage_toornament = multipage_toornament[:-1] + str(count)
-            async with session.get(multipage_toornament) as response:
-                page = await response.text()
-
-            toornament_soup = bs4.BeautifulSoup(page, features="html.parser")
-            if len(toornament_soup.find_all("div", class_="size-1-of-4")) > 0:
-                team_container.extend(
-                    toornament_soup.find_all("div", class_="size-1-of-4")
-                )
-            else:
-                break
+        # check if toornament page was valid
+        if response.status == 404:
+            logger.error(
+                f"No tournament could be found for {edited_toornament_link}."
+            )
+            raise NotFoundResponseError
+
+        page = await response.text()
 
-        for team in team_container:
-            a = team.find("a", href=True)
-            participants_links.append(base_url + a["href"])
+    toornament_soup = parse_html(page)
+    team_container = toornament_soup.find_all("div", class_="size-1-of-4")
 
-        # The following syntax exploits async calls to a list of coroutines
-        team_list = await asyncio.gather(
-            *(stalk_toornament_team(link, session) for link in participants_links)
+    # extract toornament name
+    tournament_name = toornament_soup.select(
+        "#main-container > div.layout-section.header.highlight > div > section > div > div.information > h1"
+    )[0].text
+
+    page_count = find_page_count(toornament_soup)
+    if page_count is not None:
+        # all further pages are known, so request them at once
+        pages = await asyncio.gather(
+            *(
+                fetch_participants_page(
+                    participants_page_url(edited_toornament_link, page_number), session
+                )
+                for page_number in range(2, page_count + 1)
+            )
+        )
+        for page in pages:
+            team_container.extend(find_team_containers(page))
+    else:
+        team_container.extend(
+            await probe_participant_pages(edited_toornament_link, session)
         )
 
-        return TeamList(tournament_name, team_list)
+    for team in team_container:
+        a = team.find("a", href=True)
+        participants_links.append(base_url + a["href"])
+
+    # at most concurrency teams are stalked at once, the session further caps the connections per host
+    batcher = TeamBatcher(tournament_name, len(participants_links), batch_size)
+    async for index, team in iter_bounded(
+        lambda link: stalk_toornament_team(link, session),
+        participants_links,
+        concurrency,
+    ):
+        update = batcher.add(index, team)
+        if update is not None:
+            yield update
+
+    yield batcher.flush()
+
+
+def participants_page_url(participants_link: str, page_number: int) -> str:
+    """
+    :description: Builds the url of a participants page.
+    :param participants_link: Link to the participants of a tournament.
+    :type participants_link: str
+    :param page_number: The number of the page, starting at 1.
+    :type page_number: int
+    :return: The url of the page.
+    :rtype: str
+    """
+    return f"{participants_link}?page={page_number}"
+
+
+async def fetch_participants_page(
+    participants_page_link: str,
+    session: aiohttp.ClientSession,
+    missing_is_empty: bool = False,
+) -> str:
+    """
+    :description: Loads a participants page, a page that could not be loaded is never taken for an empty one.
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param participants_page_link: Link to a participants page, see participants_page_url.
+    :type participants_page_link: str
+    :param session: The session used for the request.
+    :type session: aiohttp.ClientSession
+    :param missing_is_empty: Whether a 404 is taken for an empty page, used for probed pages behind the last one.
+    :type missing_is_empty: bool
+    :return: The html of the page, empty for a missing page if missing_is_empty is set.
+    :rtype: str
+    """
+    status, page = await http_client.fetch(session, participants_page_link)
+    if status == 404 and missing_is_empty:
+        return ""
+    if status == 404:
+        logger.error(f"No participants page could be found for {participants_page_link}.")
+        raise NotFoundResponseError
+    if status != 200:
+        logger.error(f"Loading {participants_page_link} resulted in status {status}.")
+        raise ServerErrorResponseError
+    return page
+
+
+def find_team_containers(page: str) -> list:
+    """
+    :description: Parses a participants page and returns its team containers.
+    :param page: The html of the participants page.
+    :type page: str
+    :return: The team containers, empty for a page behind the last one.
+    :rtype: list
+    """
+    return parse_html(page, parse_only=team_container_only).find_all(
+        "div", class_="size-1-of-4"
+    )
+
+
+def find_page_count(toornament_soup: bs4.BeautifulSoup):
+    """
+    :description: Reads the number of participants pages from the page links of the pagination.
+    :param toornament_soup: The parsed first participants page.
+    :type toornament_soup: bs4.BeautifulSoup
+    :return: The highest page number linked, or None if the page has no pagination.
+    :rtype: int
+    """
+    page_count = None
+    for link in toornament_soup.find_all("a", href=True):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(link["href"]).query)
+        try:
+            page_number = int(query["page"][0])
+        except (KeyError, ValueError):
+            continue
+        page_count = max(page_count or 1, page_number)
+    return page_count
+
+
+async def probe_participant_pages(
+    participants_link: str,
+    session: aiohttp.ClientSession,
+    window: int = toornament_page_probe_window,
+) -> list:
+    """
+    :description: Loads the participants pages after the first one without knowing their number.
+    The pages are requested in windows of concurrent requests until a page has no teams or does not exist.
+    :raises ServerErrorResponseError: If a page could not be loaded.
+    :param participants_link: Link to the participants of a tournament.
+    :type participants_link: str
+    :param session: The session used for all requests.
+    :type session: aiohttp.ClientSession
+    :param window: The number of pages requested at the same time.
+    :type window: int
+    :return: The team containers of all further pages.
+    :rtype: list
+    """
+    team_container = []
+    first_page = 2
+    while True:
+        pages = await asyncio.gather(
+            *(
+                fetch_participants_page(
+                    participants_page_url(participants_link, page_number),
+                    session,
+                    missing_is_empty=True,
+                )
+                for page_number in range(first_page, first_page + window)
+            )
+        )
+        for page in pages:
+            containers = find_team_containers(page)
+            if len(containers) == 0:
+                return team_container
+            team_container.extend(containers)
+        first_page += window
 
 
 async def stalk_toornament_team(
@@ -104,7 +273,7 @@ async def stalk_toornament_team(
     """
 
     if session is None:
-        async with aiohttp.ClientSession() as session:
+        async with http_client.create_session() as session:
             return await stalk_toornament_team(toornament_team_link, session)
 
     edited_url = toornament_team_link + "info"
@@ -120,7 +289,7 @@ async def stalk_toornament_team(
 
         page = await response.text()
 
-    toornament_soup = bs4.BeautifulSoup(page, features="html.parser")
+    toornament_soup = parse_html(page)
 
     # extract team name
     team_name = toornament_soup.select(
@@ -1,87 +1,158 @@
 """
 Handles scraping of the toornament page using the official toornament API.
+The api pages its resources with Range headers, the first response tells the total in its Content-Range header,
+so all further windows are requested at the same time.
 
 :author: Jonathan Decker
 """
 
-import requests
+import asyncio
 import logging
+import re
+import time
+import weakref
 import aiohttp
-import bs4
-from typing import List
+from typing import Callable, List, Optional, Tuple
 
 from PykeBot2.models.data_models import TeamList, Team, Player
 from PykeBot2.utils import token_loader
 from PykeBot2.models.errors import NotFoundResponseError, ServerErrorResponseError
+from PykeBot2.models.lookup_tables import (
+    http_retries,
+    toornament_api_concurrency,
+    toornament_api_range_sizes,
+    toornament_api_rate_limit,
+    toornament_api_default_retry_after,
+)
+from PykeBot2.backend import http_client
+from PykeBot2.backend.html_parsing import parse_html
+from PykeBot2.backend.worker_pool import map_bounded
 
 
 logger = logging.getLogger("pb_logger")
 
+api_base_url = "https://api.toornament.com/viewer/v2/tournaments"
 
-async def stalk_toornament_api_tournament(toornament_link: str) -> TeamList:
+
+class FixedWindowLimiter:
+    """
+    :description: Wraps a ClientSession and delays requests so at most limit requests start per window of seconds.
+    A 429 response blocks all requests until its Retry-After has passed.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        limit: int = toornament_api_rate_limit[0],
+        seconds: float = toornament_api_rate_limit[1],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :description: Creates a new limiter with an empty window.
+        :param session: The session used for the requests.
+        :type session: aiohttp.ClientSession
+        :param limit: The number of requests allowed per window.
+        :type limit: int
+        :param seconds: The length of a window in seconds, it starts with its first request.
+        :type seconds: float
+        :param clock: Returns the current time in seconds, replaceable for testing.
+        :type clock: Callable[[], float]
+        """
+        self.session = session
+        self.limit = limit
+        self.seconds = seconds
+        self.clock = clock
+        self.window_start = None
+        self.count = 0
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """
+        :description: Takes a request from the current window if it allows one right now.
+        :return: 0 if the request was reserved, else the seconds to wait before trying again.
+        :rtype: float
+        """
+        now = self.clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.window_start is None or now >= self.window_start + self.seconds:
+            self.window_start = now
+            self.count = 0
+        if self.count >= self.limit:
+            return self.window_start + self.seconds - now
+        self.count += 1
+        return 0.0
+
+    def block(self, headers):
+        """
+        :description: Blocks all requests after a 429 response until its Retry-After has passed.
+        :param headers: The headers of the 429 response.
+        :type headers: Mapping[str, str]
+        :return: None
+        :rtype: None
+        """
+        try:
+            retry_after = float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = toornament_api_default_retry_after
+        self.blocked_until = max(self.blocked_until, self.clock() + retry_after)
+
+    async def get(self, *args, **kwargs):
+        """
+        :description: Waits for the rate limit and starts a get request.
+        Should be used as "async with await limiter.get(url) as response".
+        :return: Async context manager yielding the response.
+        """
+        while True:
+            delay = self.reserve()
+            if delay <= 0:
+                return self.session.get(*args, **kwargs)
+            await asyncio.sleep(delay)
+
+
+# one limiter per session, so all queries sharing a session also share the rate limit
+_rate_limiters = weakref.WeakKeyDictionary()
+
+
+def rate_limited(session: aiohttp.ClientSession) -> FixedWindowLimiter:
+    """
+    :description: Returns the rate limiter for toornament api requests made with the given session.
+    :param session: A plain session.
+    :type session: aiohttp.ClientSession
+    :return: The rate limiter for the session.
+    :rtype: FixedWindowLimiter
+    """
+    limiter = _rate_limiters.get(session)
+    if limiter is None:
+        limiter = FixedWindowLimiter(session)
+        _rate_limiters[session] = limiter
+    return limiter
+
+
+async def stalk_toornament_api_tournament(
+    toornament_link: str, session: aiohttp.ClientSession = None
+) -> TeamList:
     """
     Stalks teams in the given toornament link using the toornament api.
     A valid token in a file called ToornamentToken must be in the working directory for this.
     :param toornament_link: A valid link to a toornament tournament
     :type toornament_link: str
+    :param session: A session that can be reused, if none is given, a new one will be created
+    :type session: aiohttp.ClientSession
     :return: A TeamList object containing all teams from the given tournament
     :rtype: TeamList
     """
+    if session is None:
+        async with http_client.create_session() as session:
+            return await stalk_toornament_api_tournament(toornament_link, session)
+
     api_token = token_loader.load_token("ToornamentToken")
 
-    tournament_id = toornament_link.split("/")[5]
-    participant_resource_url = (
-        f"https://api.toornament.com/viewer/v2/tournaments/{tournament_id}/participants"
+    tournament_name, participants = await asyncio.gather(
+        fetch_tournament_name(toornament_link, session),
+        fetch_participants(toornament_link, api_token, session),
     )
 
-    edited_toornament_link = "/".join(toornament_link.split("/")[:6])
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(edited_toornament_link) as response:
-            if response.status >= 500:
-                logger.error(
-                    f"Stalking {edited_toornament_link} resulted in a server error."
-                )
-                raise ServerErrorResponseError
-
-            # check if toornament page was valid
-            if response.status == 404:
-                logger.error(
-                    f"No tournament could be found for {edited_toornament_link}."
-                )
-                raise NotFoundResponseError
-
-            page = await response.text()
-
-        toornament_soup = bs4.BeautifulSoup(page, features="html.parser")
-
-        # extract toornament name
-        tournament_name = toornament_soup.select(
-            "#main-container > div.layout-section.header > div > section > div > div.information > div.name > h1"
-        )[0].text
-
-        participants = []
-        i = 0
-        while True:
-            range_from = i * 50
-            range_to = i * 50 + 49
-            i += 1
-
-            headers = {
-                "X-Api-Key": api_token,
-                "Range": f"participants={range_from}-{range_to}",
-            }
-
-            async with session.get(
-                participant_resource_url, headers=headers
-            ) as response:
-
-                if response.status == 206 or response.status == 200:
-                    response_json = await response.json()
-                    participants.extend(response_json)
-                else:
-                    break
-
     return parse_participants(participants, tournament_name)
 
 
@@ -131,112 +202,272 @@ def parse_participants(participants: List[dict], tournament_name: str) -> TeamLi
     return team_list
 
 
-def fetch_participants(toornament_link: str, api_token: str) -> List[dict]:
-    tournament_id = toornament_link.split("/")[5]
-
-    participant_resource_url = (
-        f"https://api.toornament.com/viewer/v2/tournaments/{tournament_id}/participants"
+def parse_content_range(content_range: Optional[str]) -> Optional[int]:
+    """
+    :description: Reads the total number of items from a Content-Range header like "participants 0-49/237".
+    :param content_range: The header value.
+    :type content_range: str
+    :return: The total or None if the header is missing or does not tell it.
+    :rtype: int
+    """
+    if content_range is None:
+        return None
+    match = re.search(r"/(\d+)\s*$", content_range)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+async def fetch_range(
+    limiter: FixedWindowLimiter,
+    resource_url: str,
+    resource: str,
+    api_token: str,
+    range_from: int,
+    range_to: int,
+    retries: int = http_retries,
+) -> Tuple[int, List[dict], Optional[int]]:
+    """
+    :description: Requests one Range window of a resource within the rate limit, repeating it after a 429.
+    A window behind the last item is answered with 416 and returned empty.
+    :raises NotFoundResponseError: If the resource does not exist.
+    :raises ServerErrorResponseError: If the request failed with any other status
+    or is still rate limited after retries repetitions.
+    :param limiter: The rate limited session.
+    :type limiter: FixedWindowLimiter
+    :param resource_url: The api url of the resource.
+    :type resource_url: str
+    :param resource: The name of the resource used in the Range header, e.g. participants.
+    :type resource: str
+    :param api_token: Valid toornament api token.
+    :type api_token: str
+    :param range_from: Index of the first item.
+    :type range_from: int
+    :param range_to: Index of the last item, inclusive.
+    :type range_to: int
+    :param retries: How often a rate limited request is repeated.
+    :type retries: int
+    :return: Tuple of status, the items of the window and the total from the Content-Range header.
+    :rtype: Tuple[int, List[dict], Optional[int]]
+    """
+    headers = {"X-Api-Key": api_token, "Range": f"{resource}={range_from}-{range_to}"}
+    for _ in range(retries + 1):
+        async with await limiter.get(resource_url, headers=headers) as response:
+            if response.status == 429:
+                limiter.block(response.headers)
+                continue
+            if response.status == 416:
+                # the window starts behind the last item
+                return response.status, [], None
+            if response.status == 404:
+                logger.error(f"No {resource} could be found for {resource_url}.")
+                raise NotFoundResponseError
+            if response.status not in (200, 206):
+                logger.error(
+                    f"Requesting {resource} {range_from}-{range_to} of {resource_url} "
+                    f"resulted in status {response.status}."
+                )
+                raise ServerErrorResponseError
+            items = await response.json()
+            return (
+                response.status,
+                items,
+                parse_content_range(response.headers.get("Content-Range")),
+            )
+
+    logger.error(
+        f"Requesting {resource} {range_from}-{range_to} of {resource_url} was rate limited {retries + 1} times."
     )
+    raise ServerErrorResponseError
 
-    participants = []
-
-    i = 0
-    while True:
-        range_from = i * 50
-        range_to = i * 50 + 49
-        i += 1
-
-        headers = {
-            "X-Api-Key": api_token,
-            "Range": f"participants={range_from}-{range_to}",
-        }
 
-        r = requests.get(participant_resource_url, headers=headers)
+async def fetch_range_paginated(
+    session: aiohttp.ClientSession,
+    resource_url: str,
+    resource: str,
+    api_token: str,
+    range_size: int = None,
+    concurrency: int = toornament_api_concurrency,
+) -> List[dict]:
+    """
+    :description: Fetches all items of a Range paged resource. The first window tells the total,
+    then all remaining windows are requested concurrently, at most concurrency at a time and within the rate limit.
+    :raises ServerErrorResponseError, NotFoundResponseError: If any window failed, so no items are missing silently.
+    :param session: The session used for all requests, a plain session is wrapped in the shared rate limiter.
+    :type session: aiohttp.ClientSession or FixedWindowLimiter
+    :param resource_url: The api url of the resource.
+    :type resource_url: str
+    :param resource: The name of the resource used in the Range header, e.g. participants.
+    :type resource: str
+    :param api_token: Valid toornament api token.
+    :type api_token: str
+    :param range_size: Items per window, standard is the size from toornament_api_range_sizes.
+    :type range_size: int
+    :param concurrency: The maximum number of windows requested at the same time.
+    :type concurrency: int
+    :return: All items in api order.
+    :rtype: List[dict]
+    """
+    if range_size is None:
+        range_size = toornament_api_range_sizes.get(resource, 50)
+    limiter = rate_limited(session) if isinstance(session, aiohttp.ClientSession) else session
 
-        # print(r.status_code)
-        if r.status_code == 206 or r.status_code == 200:
-            # print(r.json())
-            participants.extend(r.json())
-        else:
-            break
+    status, items, total = await fetch_range(
+        limiter, resource_url, resource, api_token, 0, range_size - 1
+    )
 
-    return participants
+    if total is None:
+        # without a total the windows can only be requested one after another
+        if status == 200 or len(items) < range_size:
+            return items
+        range_from = range_size
+        while True:
+            status, window, _ = await fetch_range(
+                limiter,
+                resource_url,
+                resource,
+                api_token,
+                range_from,
+                range_from + range_size - 1,
+            )
+            items.extend(window)
+            if status == 200 or len(window) < range_size:
+                return items
+            range_from += range_size
+
+    windows = await map_bounded(
+        lambda range_from: fetch_range(
+            limiter,
+            resource_url,
+            resource,
+            api_token,
+            range_from,
+            min(range_from + range_size, total) - 1,
+        ),
+        range(len(items), total, range_size),
+        concurrency,
+    )
+    for _, window, _ in windows:
+        items.extend(window)
+    return items
 
 
-def fetch_stages(toornament_link: str, api_token: str):
+async def fetch_participants(
+    toornament_link: str, api_token: str, session: aiohttp.ClientSession
+) -> List[dict]:
+    """
+    :description: Fetches all participants of a tournament, each with its name and lineup.
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param toornament_link: A valid link to a toornament tournament.
+    :type toornament_link: str
+    :param api_token: Valid toornament api token.
+    :type api_token: str
+    :param session: The session used for all requests, a plain session is wrapped in the shared rate limiter.
+    :type session: aiohttp.ClientSession or FixedWindowLimiter
+    :return: The participants in api order.
+    :rtype: List[dict]
+    """
     tournament_id = toornament_link.split("/")[5]
-    headers = {"X-Api-Key": api_token}
-
-    stages_resource_url = (
-        f"https://api.toornament.com/viewer/v2/tournaments/{tournament_id}/stages"
+    return await fetch_range_paginated(
+        session, f"{api_base_url}/{tournament_id}/participants", "participants", api_token
     )
 
-    r = requests.get(stages_resource_url, headers=headers)
-
-    print(r)
-    # print(r.json())
-    for ele in r.json():
-        print(ele)
-        print("\n")
-
 
-def fetch_matches(toornament_link: str, api_token: str):
+async def fetch_stages(
+    toornament_link: str, api_token: str, session: aiohttp.ClientSession
+) -> List[dict]:
+    """
+    :description: Fetches all stages of a tournament, like the group stage and the playoffs.
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param toornament_link: A valid link to a toornament tournament.
+    :type toornament_link: str
+    :param api_token: Valid toornament api token.
+    :type api_token: str
+    :param session: The session used for all requests, a plain session is wrapped in the shared rate limiter.
+    :type session: aiohttp.ClientSession or FixedWindowLimiter
+    :return: The stages in api order.
+    :rtype: List[dict]
+    """
     tournament_id = toornament_link.split("/")[5]
-    matches_resource_url = (
-        f"https://api.toornament.com/viewer/v2/tournaments/{tournament_id}/matches"
+    return await fetch_range_paginated(
+        session, f"{api_base_url}/{tournament_id}/stages", "stages", api_token
     )
 
-    i = 0
-    while True:
-        range_from = i * 128
-        range_to = i * 128 + 127
-        i += 1
-        headers = {"X-Api-Key": api_token, "Range": f"matches={range_from}-{range_to}"}
-
-        r = requests.get(matches_resource_url, headers=headers)
-
-        print(r.status_code)
-        if r.status_code == 206 or r.status_code == 200:
-            print(r.json())
-        else:
-            break
 
-
-def fetch_groups(toornament_link: str, api_token: str):
+async def fetch_matches(
+    toornament_link: str, api_token: str, session: aiohttp.ClientSession
+) -> List[dict]:
+    """
+    :description: Fetches all matches of a tournament.
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param toornament_link: A valid link to a toornament tournament.
+    :type toornament_link: str
+    :param api_token: Valid toornament api token.
+    :type api_token: str
+    :param session: The session used for all requests, a plain session is wrapped in the shared rate limiter.
+    :type session: aiohttp.ClientSession or FixedWindowLimiter
+    :return: The matches in api order.
+    :rtype: List[dict]
+    """
     tournament_id = toornament_link.split("/")[5]
-    group_resource_url = (
-        f"https://api.toornament.com/viewer/v2/tournaments/{tournament_id}/groups"
+    return await fetch_range_paginated(
+        session, f"{api_base_url}/{tournament_id}/matches", "matches", api_token
     )
 
-    groups = []
-    i = 0
-    while True:
-        range_from = i * 50
-        range_to = i * 50 + 49
-        i += 1
-        headers = {"X-Api-Key": api_token, "Range": f"groups={range_from}-{range_to}"}
-
-        r = requests.get(group_resource_url, headers=headers)
 
-        # print(r.status_code)
-        if r.status_code == 206 or r.status_code == 200:
-            # print(r.json())
-            groups.extend(r.json())
-        else:
-            break
+async def fetch_groups(
+    toornament_link: str, api_token: str, session: aiohttp.ClientSession
+) -> List[dict]:
+    """
+    :description: Fetches all groups of the stages of a tournament.
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param toornament_link: A valid link to a toornament tournament.
+    :type toornament_link: str
+    :param api_token: Valid toornament api token.
+    :type api_token: str
+    :param session: The session used for all requests, a plain session is wrapped in the shared rate limiter.
+    :type session: aiohttp.ClientSession or FixedWindowLimiter
+    :return: The groups in api order.
+    :rtype: List[dict]
+    """
+    tournament_id = toornament_link.split("/")[5]
+    return await fetch_range_paginated(
+        session, f"{api_base_url}/{tournament_id}/groups", "groups", api_token
+    )
 
-    for ele in groups:
-        print(ele)
 
+async def fetch_tournament_name(
+    toornament_link: str, session: aiohttp.ClientSession
+) -> str:
+    """
+    :description: Reads the tournament name from the tournament page, the viewer api does not offer it.
+    :raises ServerErrorResponseError, NotFoundResponseError
+    :param toornament_link: A valid link to a toornament tournament.
+    :type toornament_link: str
+    :param session: The session used for the request.
+    :type session: aiohttp.ClientSession
+    :return: The name of the tournament.
+    :rtype: str
+    """
+    edited_toornament_link = "/".join(toornament_link.split("/")[:6])
 
-def fetch_tournament(toornament_link: str) -> str:
-    edited_link = "/".join(toornament_link.split("/")[:6])
+    async with session.get(edited_toornament_link) as response:
+        if response.status >= 500:
+            logger.error(
+                f"Stalking {edited_toornament_link} resulted in a server error."
+            )
+            raise ServerErrorResponseError
 
-    r = requests.get(edited_link)
+        # check if toornament page was valid
+        if response.status == 404:
+            logger.error(
+                f"No tournament could be found for {edited_toornament_link}."
+            )
+            raise NotFoundResponseError
 
-    page = r.text
+        page = await response.text()
 
-    toornament_soup = bs4.BeautifulSoup(page, features="html.parser")
+    toornament_soup = parse_html(page)
 
     # extract toornament name
     tournament_name = toornament_soup.select(
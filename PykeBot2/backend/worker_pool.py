@@ -0,0 +1,283 @@
+"""
+Offers a worker pool for running backend queries as supervised asyncio tasks with a concurrency limit.
+Further the pool offers lanes, separate limits per stalker family, so one type of query can not use up every slot.
+Free slots go to the waiting query with the best aged priority, so cheap queries overtake expensive ones.
+map_bounded runs many small calls, like the rank lookups of all players, through a bounded work queue,
+iter_bounded does the same but hands out every result as soon as it is ready.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    List,
+    Set,
+    Tuple,
+)
+from PykeBot2.models.lookup_tables import interactive_priority, priority_aging_interval
+from PykeBot2.utils.priority_queue import aged_key
+
+logger = logging.getLogger("pb_logger")
+
+
+class PrioritySemaphore:
+    """
+    :description: Semaphore whose free places go to the waiter with the smallest aged priority key
+    instead of the longest waiting one. A released place is handed to the next waiter directly,
+    so a new caller can not take it first.
+    """
+
+    def __init__(self, value: int, aging: float = priority_aging_interval):
+        """
+        :description: Creates a semaphore with value free places.
+        :param value: The number of places.
+        :type value: int
+        :param aging: Seconds a waiter needs to catch up with the next priority class.
+        :type aging: float
+        """
+        assert value >= 0
+        self.value = value
+        self.aging = aging
+        self.counter = itertools.count()
+        self.waiters: List[Tuple[float, int, asyncio.Future]] = []
+
+    def locked(self) -> bool:
+        """
+        :description: Whether acquire would have to wait.
+        :rtype: bool
+        """
+        return self.value == 0
+
+    async def acquire(self, priority: int = interactive_priority):
+        """
+        :description: Takes a place, waits until one is handed over if none is free.
+        :param priority: The priority class of the caller, lower classes are served first.
+        :type priority: int
+        :return: None
+        :rtype: None
+        """
+        # places are handed over directly, so a free place means nobody is waiting
+        if self.value > 0:
+            self.value -= 1
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = aged_key(priority, loop.time(), self.aging)
+        heapq.heappush(self.waiters, (key, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the place was handed over just before the cancellation, pass it on
+                self.release()
+            raise
+
+    def release(self):
+        """
+        :description: Hands the place to the best waiter or frees it if nobody waits.
+        :return: None
+        :rtype: None
+        """
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            # cancelled waiters are skipped
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    @asynccontextmanager
+    async def hold(self, priority: int = interactive_priority):
+        """
+        :description: Async context manager that holds a place while entered.
+        :param priority: The priority class of the caller.
+        :type priority: int
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class WorkerPool:
+    """
+    :description: Runs submitted coroutines as their own tasks and keeps them referenced until they finished.
+    Exceptions that escape a task are logged.
+    Work that should count against the limits has to be wrapped in slot, which waits for a free place in the
+    requested lane first and for one of the max_workers global places afterwards. That way queries waiting for a
+    busy lane do not block global places needed by other lanes.
+    """
+
+    def __init__(self, max_workers: int, lane_limits: Dict[str, int] = None):
+        """
+        :description: Creates a new worker pool.
+        :param max_workers: The maximum number of slots that may be in use at the same time over all lanes.
+        :type max_workers: int
+        :param lane_limits: Maps lane names to the maximum number of slots used in that lane at the same time.
+        Lanes that are not listed are only limited by max_workers.
+        :type lane_limits: Dict[str, int]
+        """
+        assert max_workers > 0
+        if lane_limits is None:
+            lane_limits = {}
+        self.max_workers = max_workers
+        self.semaphore = PrioritySemaphore(max_workers)
+        self.lanes: Dict[str, PrioritySemaphore] = {
+            lane: PrioritySemaphore(limit) for lane, limit in lane_limits.items()
+        }
+        self.tasks: Set[asyncio.Task] = set()
+
+    def submit(self, coro: Coroutine, name: str = None) -> asyncio.Task:
+        """
+        :description: Schedules the given coroutine as a supervised task.
+        :param coro: The coroutine to run.
+        :type coro: Coroutine
+        :param name: Name used for the task in logs.
+        :type name: str
+        :return: The task wrapping the coroutine.
+        :rtype: asyncio.Task
+        """
+        task = asyncio.ensure_future(coro)
+        if name is not None:
+            task.set_name(name)
+        self.tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    @asynccontextmanager
+    async def slot(self, lane: str = None, priority: int = interactive_priority):
+        """
+        :description: Async context manager that holds a place in the given lane and a global place while entered.
+        :param lane: Name of the lane, None only uses the global limit.
+        :type lane: str
+        :param priority: The priority class of the query, places go to lower classes first.
+        :type priority: int
+        """
+        lane_semaphore = self.lanes.get(lane)
+        if lane_semaphore is None:
+            async with self.semaphore.hold(priority):
+                yield
+        else:
+            async with lane_semaphore.hold(priority):
+                async with self.semaphore.hold(priority):
+                    yield
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if task.cancelled():
+            logger.debug(f"Worker task {task.get_name()} was cancelled")
+            return
+        exception = task.exception()
+        if exception is not None:
+            logger.error(
+                f"Worker task {task.get_name()} failed with {type(exception)}",
+                exc_info=exception,
+            )
+
+    @property
+    def active(self) -> int:
+        """
+        :description: Number of submitted tasks that have not finished yet, including the waiting ones.
+        :rtype: int
+        """
+        return len(self.tasks)
+
+    async def shutdown(self):
+        """
+        :description: Cancels all remaining tasks and waits until they are gone.
+        :return: None
+        :rtype: None
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def iter_bounded(
+    func: Callable[[Any], Awaitable[Any]], items: Iterable, limit: int
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    :description: Calls func for every item with at most limit calls running at the same time
+    and yields every result as soon as its call finished.
+    The items are put into one work queue that is drained by limit workers, so a slow item only holds up one worker.
+    If a call fails or the iteration is stopped early, the remaining work is cancelled.
+    :param func: Coroutine function called with a single item.
+    :type func: Callable[[Any], Awaitable[Any]]
+    :param items: The items to work on.
+    :type items: Iterable
+    :param limit: The maximum number of concurrent calls.
+    :type limit: int
+    :return: Async iterator over (index of the item, result) in the order the calls finished.
+    :rtype: AsyncIterator[Tuple[int, Any]]
+    """
+    assert limit > 0
+    queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        queue.put_nowait((index, item))
+    item_count = queue.qsize()
+    finished = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            finished.put_nowait((index, await func(item)))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(limit, item_count))]
+    all_workers = asyncio.ensure_future(asyncio.gather(*workers))
+    next_result = None
+    try:
+        for _ in range(item_count):
+            next_result = asyncio.ensure_future(finished.get())
+            await asyncio.wait(
+                [next_result, all_workers], return_when=asyncio.FIRST_COMPLETED
+            )
+            if all_workers.done() and (
+                all_workers.cancelled() or all_workers.exception()
+            ):
+                # a worker failed, raise its exception
+                next_result.cancel()
+                all_workers.result()
+            yield await next_result
+    finally:
+        if next_result is not None:
+            next_result.cancel()
+        for worker_task in workers:
+            worker_task.cancel()
+        await asyncio.gather(all_workers, return_exceptions=True)
+
+
+async def map_bounded(
+    func: Callable[[Any], Awaitable[Any]], items: Iterable, limit: int
+) -> List[Any]:
+    """
+    :description: Calls func for every item with at most limit calls running at the same time, see iter_bounded.
+    If a call fails, the remaining work is cancelled and the exception is raised.
+    :param func: Coroutine function called with a single item.
+    :type func: Callable[[Any], Awaitable[Any]]
+    :param items: The items to work on.
+    :type items: Iterable
+    :param limit: The maximum number of concurrent calls.
+    :type limit: int
+    :return: The results in the order of the items.
+    :rtype: List[Any]
+    """
+    items = list(items)
+    results = [None] * len(items)
+    async for index, result in iter_bounded(func, items, limit):
+        results[index] = result
+    return results
@@ -5,9 +5,13 @@
 
 import asyncio
 from logging import getLogger
+from PykeBot2 import gecko_manager
 from PykeBot2.frontend import discord_interface, frontend_master
-from PykeBot2.backend import backend_master
-from PykeBot2.models.lookup_tables import forward_to_lookup
+from PykeBot2.backend import backend_master, http_client, rank_store
+from PykeBot2.utils.priority_queue import PriorityQueryQueue
+from PykeBot2.models.lookup_tables import gecko_pool_warm_size
+from PykeBot2.query_dispatcher import QueryDispatcher
+from PykeBot2 import query_metrics
 
 logger = getLogger("pb_logger")
 
@@ -39,71 +43,81 @@ async def dump_que(queue: asyncio.Queue):
         queue.task_done()
 
 
-async def query_forwarder(
-    forward_queue: asyncio.Queue, sub_module_queues: {str: asyncio.Queue}
-):
+async def warm_up_driver_pool():
     """
-    :description: Coroutine that manages the forward_queue and reads the forward_to field of incoming queries.
-    Based on the value of the field the query is submitted to the next Queue.
-    :param forward_queue: The forward_queue that is awaited by this Coroutine.
-    :type forward_queue: asyncio.Queue
-    :param sub_module_queues: A dictionary that maps the short names of each sub module to its Queue.
-    :type sub_module_queues: {str: asyncio.Queue}
+    :description: Starts the first headless firefox drivers, so the first browser stalk does not wait for them.
+    Failures are only logged as the drivers are started on demand later on.
     :return: None
     :rtype: None
     """
-    while True:
-        query = await forward_queue.get()
-        forward_to = query.forward_to
-        if forward_to not in forward_to_lookup:
-            logger.error(f"Invalid forward_to in query {str(query)}, discarding query.")
-            del query
-            continue
-        target_queue = sub_module_queues.get(forward_to)
-        target_queue.put_nowait(query)
-        forward_queue.task_done()
+    try:
+        await gecko_manager.warm_up_driver_pool(gecko_pool_warm_size)
+    except Exception:
+        logger.exception("Warming up the webdriver pool failed")
 
 
 def run_main_loop():
     """
     :description: The main loop of the program. Uses asyncio event loop and ensures all main Coroutines.
     Further all Queue objects are created here as they need to be present when starting the Coroutines.
+    Every stage of the pipeline is registered with the query dispatcher, which is handed to every sub module
+    as forward queue. The frontend steps run directly in the dispatcher, only the backend and the discord interface
+    have their own Queue.
+    The http session shared by all stalkers and the rank store are also opened here and closed when the loop stops.
+    The pool of headless firefox drivers is warmed up in the background and its drivers are quit at the end.
+    The metrics exporter serves the latency of every stage and the depth of the Queues while the loop runs.
     :return: None
     :rtype: None
     """
     loop = asyncio.get_event_loop()
+    session = loop.run_until_complete(http_client.open_session())
+    player_rank_store = loop.run_until_complete(rank_store.open_rank_store())
+    metrics_runner = loop.run_until_complete(query_metrics.start_exporter())
     try:
-        # create forward Queue
-        forward_queue = asyncio.Queue()
-
-        # create internal Queues
-        discord_out_queue = asyncio.Queue()
-        frontend_master_queue = asyncio.Queue()
-        backend_master_queue = asyncio.Queue()
+        # create internal Queues, every Queue serves cheap queries like help before expensive stalks
+        discord_out_queue = PriorityQueryQueue()
+        backend_master_queue = PriorityQueryQueue()
+
+        # register the stages, the dispatcher replaces the forward Queue
+        forward_queue = QueryDispatcher()
+        forward_queue.register_handler(
+            "frontend",
+            {"interpret", "format", "display"},
+            frontend_master.run_frontend_step,
+        )
+        forward_queue.register_queue(
+            "backend", {"stalk", "cancel"}, backend_master_queue
+        )
+        forward_queue.register_queue("discord", {"display"}, discord_out_queue)
 
-        # register internal queues
-        sub_module_queues = {
-            "discord": discord_out_queue,
-            "frontend": frontend_master_queue,
-            "backend": backend_master_queue,
-        }
+        # report the depth of the Queues
+        query_metrics.queue_depth.set_function(
+            backend_master_queue.qsize, queue="backend"
+        )
+        query_metrics.queue_depth.set_function(
+            discord_out_queue.qsize, queue="discord"
+        )
 
-        # start query forwarder
-        asyncio.ensure_future(query_forwarder(forward_queue, sub_module_queues))
+        # start the first webdrivers without blocking the loop
+        asyncio.ensure_future(warm_up_driver_pool())
 
-        # start sub modules, each sub module requires its input queue and the forward queue
+        # start sub modules with their own coroutine, each requires its input queue and the forward queue
         asyncio.ensure_future(
             discord_interface.run_discord_bot_loop(forward_queue, discord_out_queue)
         )
         asyncio.ensure_future(
-            frontend_master.frontend_loop(forward_queue, frontend_master_queue)
-        )
-        asyncio.ensure_future(
-            backend_master.backend_loop(forward_queue, backend_master_queue)
+            backend_master.backend_loop(
+                forward_queue, backend_master_queue, session, player_rank_store
+            )
         )
 
         loop.run_forever()
     except KeyboardInterrupt:
         pass
     finally:
+        if metrics_runner is not None:
+            loop.run_until_complete(metrics_runner.cleanup())
+        loop.run_until_complete(http_client.close_session(session))
+        loop.run_until_complete(player_rank_store.close())
+        gecko_manager.close_driver_pool()
         loop.close()
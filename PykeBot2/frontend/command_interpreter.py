@@ -5,6 +5,7 @@ Responsible for understanding the raw command in a given Query and setting next
 """
 from PykeBot2.models.query import Query
 import logging
+from typing import Set
 from PykeBot2.models.lookup_tables import (
     stalk_command_lookup,
     all_flags_lookup,
@@ -13,8 +14,18 @@ from PykeBot2.models.lookup_tables import (
     uniliga_seitenwahl_commands_lookup,
     uniliga_seitenwahl_rules,
     version_command_lookup,
+    cancel_command_lookup,
     version,
     last_updated,
+    with_ranks_flag_lookup,
+    prime_league_use_group_flag_lookup,
+    prime_league_group_key_words,
+    prime_league_team_key_words,
+    summoners_inn_team_key_words,
+    team_priority,
+    group_priority,
+    large_priority,
+    ranks_priority_penalty,
 )
 from PykeBot2.models.data_models import Error, Message
 
@@ -84,6 +95,7 @@ def interpret_command(query: Query):
 
         # update query so it can be forwarded to backend
         query.update_query("backend", "stalk", data=url, flags=flags)
+        query.priority = determine_priority(url, flags)
         return
 
     elif base_command in help_commands_lookup:
@@ -100,6 +112,11 @@ def interpret_command(query: Query):
         version_m = Message(f"PykeBot2 Version {version}\n Released on {last_updated}")
         query.update_query("frontend", "format", payload=version_m)
 
+    elif base_command in cancel_command_lookup:
+        # the backend knows the running stalks and answers with a message
+        query.update_query("backend", "cancel")
+        return
+
     else:
         error_message = (
             f"Only basic stalking has been implemented so far, command {str(query)} failed.\n"
@@ -110,6 +127,36 @@ def interpret_command(query: Query):
         return
 
 
+def determine_priority(url: str, flags: Set[str]) -> int:
+    """
+    :description: Estimates the cost of a stalk from its url and flags and returns its priority class.
+    Single teams are cheapest, followed by groups and finally seasons, tournaments and cups.
+    Stalking ranks moves the query one class further back.
+    :param url: The url given for stalking.
+    :type url: str
+    :param flags: The flags of the stalk command.
+    :type flags: Set[str]
+    :return: The priority class, lower classes are served first.
+    :rtype: int
+    """
+    url_split = url.split("/")
+    # same order as the stalker determination of the backend
+    if len(prime_league_use_group_flag_lookup.intersection(flags)) >= 1 or all(
+        elem in url_split for elem in prime_league_group_key_words
+    ):
+        priority = group_priority
+    elif all(elem in url_split for elem in prime_league_team_key_words) or all(
+        elem in url_split for elem in summoners_inn_team_key_words
+    ):
+        priority = team_priority
+    else:
+        priority = large_priority
+
+    if len(with_ranks_flag_lookup.intersection(flags)) >= 1:
+        priority += ranks_priority_penalty
+    return priority
+
+
 def create_error(query: Query, content: str):
     """
     :description: Creates an error message from the content and adds it to the query,
@@ -6,12 +6,14 @@ import logging
 import asyncio
 from discord.ext import commands
 import datetime
-from discord import Message, File, Game, __version__, Intents
+from typing import Dict
+from discord import DiscordException, Message, File, Game, __version__, Intents
 
 from PykeBot2.utils.token_loader import load_token
 from PykeBot2.models.query import Query
-from PykeBot2.models.lookup_tables import as_file_flag_lookup
-from PykeBot2.models.data_models import Error
+from PykeBot2.models.lookup_tables import as_file_flag_lookup, partial_flag_lookup
+from PykeBot2.models.data_models import Error, Progress
+from PykeBot2.query_metrics import record_query
 
 logger = logging.getLogger("pb_logger")
 prefix = ".pb"
@@ -25,10 +27,15 @@ class PykeBot(commands.Bot):
 
     forward_queue: asyncio.Queue
     output_queue: asyncio.Queue
+    # the progress message of every running query by progress key, edited in place
+    progress_messages: Dict[int, Message]
 
     async def output_queue_listener(self):
         """
         :description: Coroutine that handles the discord output queue and sends messages based on the incoming queries.
+        Partial results of a running stalk are always sent as messages, so they show up while the stalk continues.
+        Progress of a query is sent once and afterwards the same message is edited.
+        Once sent, the stages of the query are added to the metrics.
         The query objects is not further forwarded.
         :return: None
         :rtype: None
@@ -37,10 +44,15 @@ class PykeBot(commands.Bot):
         while not self.is_closed():
             query = await self.output_queue.get()
 
-            # check if send as file, in case of error always skip file flag
-            if len(
-                    as_file_flag_lookup.intersection(query.flags)
-            ) >= 1 and not isinstance(query.payload, Error):
+            if isinstance(query.payload, Progress):
+                await self.show_progress(query)
+
+            # check if send as file, in case of error or partial result always skip file flag
+            elif (
+                    len(as_file_flag_lookup.intersection(query.flags)) >= 1
+                    and len(partial_flag_lookup.intersection(query.flags)) == 0
+                    and not isinstance(query.payload, Error)
+            ):
 
                 # prepare file creation
                 title = query.output_message.split("\n", 1)[0]
@@ -56,10 +68,40 @@ class PykeBot(commands.Bot):
             else:
                 out_list = chunk_message(query.output_message)
                 for out in out_list:
-                    await query.discord_channel.send(out)
+                    # discord rejects empty messages
+                    if out.strip():
+                        await query.discord_channel.send(out)
 
+            query.mark("sent")
+            record_query(query)
             self.output_queue.task_done()
 
+    async def show_progress(self, query: Query):
+        """
+        :description: Sends the first progress of a query and edits that message with every later progress.
+        Failing edits are only logged, as the progress is not essential.
+        :param query: A query with a Progress payload.
+        :type query: Query
+        :return: None
+        :rtype: None
+        """
+        progress = query.payload
+        message = self.progress_messages.get(progress.key)
+        try:
+            if message is None:
+                if progress.finished:
+                    return
+                self.progress_messages[progress.key] = await query.discord_channel.send(
+                    query.output_message
+                )
+            else:
+                await message.edit(content=query.output_message)
+        except DiscordException:
+            logger.exception("Updating a progress message failed")
+        finally:
+            if progress.finished:
+                self.progress_messages.pop(progress.key, None)
+
     async def setup_hook(self) -> None:
         self.output_queue_listener = self.loop.create_task(self.output_queue_listener())
 
@@ -76,6 +118,7 @@ class PykeBot(commands.Bot):
         intents.messages = True
         intents.message_content = True
         super().__init__(*args, **kwargs, command_prefix=prefix, intents=intents)
+        self.progress_messages = {}
 
 
 pb = PykeBot()
@@ -152,6 +195,7 @@ def initiate_query(message: Message):
         raw_command=message.content,
         discord_channel=message.channel,
     )
+    query.mark("received")
     pb.forward_queue.put_nowait(query)
 
 
@@ -6,12 +6,21 @@ Responsible for creating the output message from the payload by calling str mess
 
 import logging
 from PykeBot2.models.query import Query
-from PykeBot2.models.data_models import Error, Payload, Message, TeamList, Team
+from PykeBot2.models.data_models import (
+    Error,
+    Payload,
+    Message,
+    TeamList,
+    TeamListList,
+    Team,
+)
 from PykeBot2.models.lookup_tables import (
     as_file_flag_lookup,
     with_ranks_flag_lookup,
     used_toornament_api_flag_lookup,
     used_riot_api_flag_lookup,
+    partial_flag_lookup,
+    streamed_flag_lookup,
 )
 
 logger = logging.getLogger("pb_logger")
@@ -20,6 +29,8 @@ logger = logging.getLogger("pb_logger")
 def format_payload(query: Query):
     """
     :description: Takes the Payload from the Query and calls to str based on context and flags and saves it to output message.
+    Partial results of a running stalk are formatted without ranks and without the api notices, which follow with the
+    complete result. If all parts were already shown as messages, the complete result is only summarized.
     :param query: The handled Query.
     :type query: Query
     :return: None
@@ -41,6 +52,10 @@ def format_payload(query: Query):
         format_message(query)
         return
 
+    if len(partial_flag_lookup.intersection(query.flags)) >= 1:
+        format_partial(query)
+        return
+
     # additional case for valid TeamList payloads with 0 teams
     if isinstance(query.payload, TeamList):
         if len(query.payload.teams) == 0:
@@ -75,7 +90,10 @@ def format_payload(query: Query):
     # identify target display
     # file output should ignore extra formatting for discord
     output = ""
-    if query.context_type == "discord" and not file:
+    if len(streamed_flag_lookup.intersection(query.flags)) >= 1 and not (rank or file):
+        # the parts were already sent, so only a summary is needed
+        output = summarize_payload(query.payload)
+    elif query.context_type == "discord" and not file:
         # do discord formatting
         if rank:
             # do extended discord formatting
@@ -106,6 +124,41 @@ def format_payload(query: Query):
     query.update_query("frontend", "display", output_message=output)
 
 
+def format_partial(query: Query):
+    """
+    :description: Formats partial results of a running stalk, and sets output message.
+    :param query: The handled Query.
+    :type query: Query
+    :return: None
+    :rtype: None
+    """
+    # ranks are only added to the complete result and a partial result is never sent as file
+    if query.context_type == "discord":
+        output = query.payload.discord_str()
+    else:
+        output = str(query.payload)
+    query.update_query("frontend", "display", output_message=output)
+
+
+def summarize_payload(payload: Payload) -> str:
+    """
+    :description: Creates a short summary of a result whose parts were already sent as partial results.
+    :param payload: The complete result.
+    :type payload: Payload
+    :return: The summary, naming the number of teams and groups.
+    :rtype: str
+    """
+    if isinstance(payload, TeamListList):
+        team_count = sum(len(team_list.teams) for team_list in payload.team_lists)
+        return (
+            f"Finished stalking {len(payload.team_lists)} groups "
+            f"with {team_count} teams."
+        )
+    if isinstance(payload, TeamList):
+        return f"Finished stalking {payload.name} with {len(payload.teams)} teams."
+    return "Finished stalking."
+
+
 def create_error(query: Query, content: str):
     """
     :description: Creates an error message from the content and adds it to the query,
@@ -1,21 +1,78 @@
 """
 Offers utility to open a firefox webdriver.
-Uses webdriver-manager to acquire Geckodriver.
+Uses webdriver-manager to acquire Geckodriver, the resolved driver path is cached on disk,
+so later starts do not need network access to the driver mirror.
+Further offers a pool of warm headless drivers that are reused between stalks.
+All browser work should go through run_in_browser, which runs it on a dedicated thread pool,
+as every WebDriver call blocks until the browser answered. Cancelling run_in_browser quits the driver in use,
+so the abandoned browser work stops right away.
 
 :author: Jonathan Decker
 """
 
+import asyncio
+import logging
+import os
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Set
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service as FirefoxService
 from selenium.webdriver.firefox.webdriver import WebDriver
 from webdriver_manager.firefox import GeckoDriverManager
+from PykeBot2.models.lookup_tables import (
+    gecko_driver_path_cache_file_name,
+    gecko_pool_max_pages,
+    gecko_pool_max_size,
+)
+
+logger = logging.getLogger("pb_logger")
+
+_driver_path: Optional[str] = None
+_driver_path_lock = threading.Lock()
+
+
+def resolve_driver_path(cache_file: pathlib.Path = None) -> str:
+    """
+    :description: Finds the Geckodriver executable. The path is remembered in memory and in the cache file,
+    webdriver-manager is only asked if neither holds a path to an existing file.
+    :param cache_file: File the resolved path is stored in, standard is gecko_driver_path_cache_file_name in the
+    current working directory.
+    :type cache_file: pathlib.Path
+    :return: Path to the Geckodriver executable.
+    :rtype: str
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is not None and os.path.isfile(_driver_path):
+            return _driver_path
+
+        if cache_file is None:
+            cache_file = pathlib.Path.cwd() / gecko_driver_path_cache_file_name
+
+        if cache_file.is_file():
+            cached_path = cache_file.read_text(encoding="utf-8").strip()
+            if os.path.isfile(cached_path):
+                _driver_path = cached_path
+                return _driver_path
+
+        _driver_path = GeckoDriverManager().install()
+        try:
+            cache_file.write_text(_driver_path, encoding="utf-8")
+        except OSError:
+            logger.exception(f"Could not cache the Geckodriver path in {cache_file}")
+        logger.info(f"Resolved Geckodriver at {_driver_path}")
+        return _driver_path
 
 
 def open_session(headless=True) -> WebDriver:
     """
     :description: Opens a Selenium Firefox web session.
-    Uses webdriver-manager to acquire Geckodriver.
+    Uses the cached Geckodriver path or webdriver-manager to acquire Geckodriver.
     :param headless: Set whether the web session should be headless or not.
     :type headless: bool
     :return: A new firefox webdriver.
@@ -24,7 +81,7 @@ def open_session(headless=True) -> WebDriver:
     options = Options()
     options.add_argument("--headless=new")
 
-    service = FirefoxService(GeckoDriverManager().install())
+    service = FirefoxService(resolve_driver_path())
 
     # opens a web session and returns the webdriver
     if headless:
@@ -38,3 +95,388 @@ def open_session(headless=True) -> WebDriver:
 
 def quit_session(driver: webdriver):
     driver.quit()
+
+
+class DriverPool:
+    """
+    :description: Keeps up to max_size headless drivers. Drivers are checked before they are handed out,
+    broken drivers are replaced and every driver is recycled after max_pages uses to keep its memory in check.
+    The pool is thread safe, as drivers are used from executor threads.
+    """
+
+    def __init__(
+        self,
+        max_size: int = gecko_pool_max_size,
+        max_pages: int = gecko_pool_max_pages,
+        factory: Callable[[], WebDriver] = open_session,
+    ):
+        """
+        :description: Creates an empty pool, drivers are started on demand or by warm up.
+        :param max_size: The maximum number of drivers, idle and in use.
+        :type max_size: int
+        :param max_pages: Number of uses after which a driver is quit and replaced.
+        :type max_pages: int
+        :param factory: Starts a new headless driver, replaceable for testing.
+        :type factory: Callable[[], WebDriver]
+        """
+        assert max_size > 0
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self.factory = factory
+        self.idle: List[WebDriver] = []
+        self.uses: Dict[WebDriver, int] = {}
+        # drivers quit while in use, they are dropped when given back
+        self.aborted: Set[WebDriver] = set()
+        # drivers currently being started count against max_size
+        self.starting = 0
+        self.condition = threading.Condition()
+        self.closed = False
+
+    @property
+    def size(self) -> int:
+        """
+        :description: Number of drivers in the pool, idle and in use.
+        :rtype: int
+        """
+        return len(self.uses) + self.starting
+
+    def warm_up(self, count: int = None):
+        """
+        :description: Starts drivers until count drivers are idle or the pool is full. Blocks while starting.
+        :param count: Number of idle drivers wanted, standard is max_size.
+        :type count: int
+        :return: None
+        :rtype: None
+        """
+        if count is None:
+            count = self.max_size
+        while True:
+            with self.condition:
+                if self.closed or len(self.idle) >= count or self.size >= self.max_size:
+                    return
+            driver = self._start_driver()
+            self.release(driver, used=False)
+
+    def acquire(self, timeout: float = None) -> WebDriver:
+        """
+        :description: Takes a healthy idle driver, starts a new one if the pool is not full or waits for a release.
+        :param timeout: Seconds to wait for a free driver, None waits forever.
+        :type timeout: float
+        :return: A driver that has to be given back with release.
+        :rtype: WebDriver
+        """
+        while True:
+            with self.condition:
+                if self.closed:
+                    raise RuntimeError("The driver pool is closed")
+                if self.idle:
+                    driver = self.idle.pop()
+                elif self.size < self.max_size:
+                    driver = None
+                    # reserve the place, so no other thread starts a driver for it
+                    self.starting += 1
+                else:
+                    if not self.condition.wait(timeout):
+                        raise TimeoutError("No driver became available in time")
+                    continue
+
+            if driver is None:
+                return self._start_reserved()
+            if self._is_healthy(driver):
+                return driver
+            logger.debug("Replacing broken webdriver")
+            self._discard(driver)
+
+    def release(self, driver: WebDriver, used: bool = True):
+        """
+        :description: Gives a driver back to the pool, it is quit instead if it reached max_pages or the pool is closed.
+        :param driver: A driver returned by acquire.
+        :type driver: WebDriver
+        :param used: Whether the driver loaded pages since it was acquired.
+        :type used: bool
+        :return: None
+        :rtype: None
+        """
+        with self.condition:
+            if driver in self.aborted:
+                self.aborted.discard(driver)
+                return
+            if used:
+                self.uses[driver] = self.uses.get(driver, 0) + 1
+            recycle = self.closed or self.uses.get(driver, 0) >= self.max_pages
+            if not recycle:
+                self.idle.append(driver)
+                self.condition.notify()
+                return
+        logger.debug("Recycling webdriver")
+        self._discard(driver)
+
+    def discard(self, driver: WebDriver):
+        """
+        :description: Quits a driver that should not be reused, e.g. after it failed.
+        :param driver: A driver returned by acquire.
+        :type driver: WebDriver
+        :return: None
+        :rtype: None
+        """
+        with self.condition:
+            if driver in self.aborted:
+                self.aborted.discard(driver)
+                return
+        self._discard(driver)
+
+    def abort(self, driver: WebDriver):
+        """
+        :description: Quits a driver that is still in use by another thread, which makes its blocking call fail.
+        The place of the driver is freed at once, giving it back afterwards does nothing.
+        :param driver: A driver returned by acquire.
+        :type driver: WebDriver
+        :return: None
+        :rtype: None
+        """
+        with self.condition:
+            if driver not in self.uses:
+                return
+            self.aborted.add(driver)
+        logger.debug("Aborting webdriver in use")
+        self._discard(driver)
+
+    @contextmanager
+    def driver(self, timeout: float = None):
+        """
+        :description: Context manager that acquires a driver and releases it afterwards.
+        A driver that raised a WebDriverException is discarded instead of released.
+        :param timeout: Seconds to wait for a free driver, None waits forever.
+        :type timeout: float
+        """
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        except WebDriverException:
+            self.discard(driver)
+            raise
+        except BaseException:
+            self.release(driver)
+            raise
+        else:
+            self.release(driver)
+
+    def close(self):
+        """
+        :description: Quits all idle drivers, drivers in use are quit when they are released.
+        :return: None
+        :rtype: None
+        """
+        with self.condition:
+            self.closed = True
+            idle = self.idle
+            self.idle = []
+            self.condition.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+    def _start_driver(self) -> WebDriver:
+        with self.condition:
+            self.starting += 1
+        return self._start_reserved()
+
+    def _start_reserved(self) -> WebDriver:
+        try:
+            driver = self.factory()
+        except BaseException:
+            with self.condition:
+                self.starting -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.starting -= 1
+            self.uses[driver] = 0
+        return driver
+
+    def _discard(self, driver: WebDriver):
+        with self.condition:
+            self.uses.pop(driver, None)
+            self.condition.notify()
+        try:
+            driver.quit()
+        except Exception:
+            logger.exception("Quitting a webdriver failed")
+
+    @staticmethod
+    def _is_healthy(driver: WebDriver) -> bool:
+        try:
+            # any command fails if the browser or the driver process died
+            driver.current_url
+            driver.delete_all_cookies()
+            return True
+        except Exception:
+            return False
+
+
+_driver_pool: Optional[DriverPool] = None
+_driver_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """
+    :description: Returns the process wide driver pool, creating it on first use.
+    :return: The driver pool.
+    :rtype: DriverPool
+    """
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None or _driver_pool.closed:
+            _driver_pool = DriverPool()
+        return _driver_pool
+
+
+@contextmanager
+def pooled_session(headless=True):
+    """
+    :description: Context manager yielding a driver. Headless drivers come from the process wide pool,
+    a driver with head is started for debugging and quit afterwards.
+    :param headless: Set whether the web session should be headless or not.
+    :type headless: bool
+    """
+    if not headless:
+        driver = open_session(headless)
+        try:
+            yield driver
+        finally:
+            quit_session(driver)
+        return
+
+    with get_driver_pool().driver() as driver:
+        yield driver
+
+
+_browser_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_browser_executor() -> ThreadPoolExecutor:
+    """
+    :description: Returns the thread pool that runs all browser work, creating it on first use.
+    It has one thread per pooled driver, so a browser stalk never waits for a thread while a driver is idle.
+    :return: The browser executor.
+    :rtype: ThreadPoolExecutor
+    """
+    global _browser_executor
+    with _driver_pool_lock:
+        if _browser_executor is None:
+            _browser_executor = ThreadPoolExecutor(
+                max_workers=gecko_pool_max_size, thread_name_prefix="browser"
+            )
+        return _browser_executor
+
+
+class BrowserWork:
+    """
+    :description: Connects a call of run_in_browser with the driver its thread uses, so it can be aborted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.driver: Optional[WebDriver] = None
+        self.pool: Optional[DriverPool] = None
+        self.aborted = False
+
+    def attach(self, driver: WebDriver, pool: Optional[DriverPool]) -> bool:
+        """
+        :description: Remembers the driver the work runs with.
+        :param driver: The driver.
+        :type driver: WebDriver
+        :param pool: The pool the driver belongs to, None for a driver with head.
+        :type pool: DriverPool
+        :return: False if the work was aborted before it started.
+        :rtype: bool
+        """
+        with self.lock:
+            if self.aborted:
+                return False
+            self.driver = driver
+            self.pool = pool
+            return True
+
+    def abort(self):
+        """
+        :description: Stops the work, a pooled driver that is in use is quit. Blocks while the driver quits.
+        :return: None
+        :rtype: None
+        """
+        with self.lock:
+            self.aborted = True
+            driver, pool = self.driver, self.pool
+        if driver is not None and pool is not None:
+            pool.abort(driver)
+
+
+def _run_with_driver(
+    func: Callable[..., Any], headless: bool, args: tuple, work: BrowserWork
+) -> Any:
+    if not headless:
+        with pooled_session(headless) as driver:
+            if work.attach(driver, None):
+                return func(driver, *args)
+            return None
+
+    pool = get_driver_pool()
+    with pool.driver() as driver:
+        if work.attach(driver, pool):
+            return func(driver, *args)
+        return None
+
+
+async def run_in_browser(func: Callable[..., Any], *args, headless=True) -> Any:
+    """
+    :description: Runs func(driver, *args) on the browser executor with a driver from the pool,
+    so the blocking WebDriver calls do not stall the event loop.
+    If the call is cancelled, the pooled driver in use is quit, so its thread and its place in the pool
+    are free again right away.
+    :param func: Blocking function that receives the driver as first argument.
+    :type func: Callable[..., Any]
+    :param args: Further arguments for func.
+    :param headless: Set whether the web session should be headless or not.
+    :type headless: bool
+    :return: The return value of func.
+    :rtype: Any
+    """
+    loop = asyncio.get_running_loop()
+    work = BrowserWork()
+    try:
+        return await loop.run_in_executor(
+            get_browser_executor(), _run_with_driver, func, headless, args, work
+        )
+    except asyncio.CancelledError:
+        # quitting blocks until the browser is gone, so it must not run on the event loop
+        loop.run_in_executor(None, work.abort)
+        raise
+
+
+async def warm_up_driver_pool(count: int = None):
+    """
+    :description: Starts drivers on the browser executor until count drivers are idle.
+    :param count: Number of idle drivers wanted, standard is the pool size.
+    :type count: int
+    :return: None
+    :rtype: None
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        get_browser_executor(), get_driver_pool().warm_up, count
+    )
+
+
+def close_driver_pool():
+    """
+    :description: Quits all drivers of the process wide pool and stops the browser executor, used at shutdown.
+    :return: None
+    :rtype: None
+    """
+    global _browser_executor
+    with _driver_pool_lock:
+        if _driver_pool is not None:
+            _driver_pool.close()
+        executor = _browser_executor
+        _browser_executor = None
+    if executor is not None:
+        executor.shutdown(wait=True)
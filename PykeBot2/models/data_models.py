@@ -1,6 +1,6 @@
 """
 Provides data models for Player, Team, Team list and Team list list objects.
-Further also Error and Message objects are also defined.
+Further also Error, Message and Progress objects are also defined.
 All of them are subclasses of Payload which is used in Query.
 Finally also Rank is defined.
 
@@ -300,6 +300,16 @@ class Message(Payload):
         return str(self)
 
 
+@dataclass
+class Progress(Message):
+    """
+    Progress of a running stalk, all progress of a query shares its key and is shown in a single message
+    """
+
+    key: int = 0
+    finished: bool = False
+
+
 @dataclass
 class Error(Payload):
     content: str
@@ -27,11 +27,14 @@ uniliga_seitenwahl_commands_lookup = {"uniliga-sides", "uniliga"}
 
 version_command_lookup = {"version", "v", "V", "Version"}
 
+cancel_command_lookup = {"cancel", "stop"}
+
 all_commands_lookup = {
     *stalk_command_lookup,
     *help_commands_lookup,
     *uniliga_seitenwahl_commands_lookup,
     *version_command_lookup,
+    *cancel_command_lookup,
 }
 
 # flags
@@ -39,10 +42,15 @@ with_ranks_flag_lookup = {"rank", "ranks", "r"}
 as_file_flag_lookup = {"file", "f"}
 prime_league_use_group_flag_lookup = {"group"}
 dont_use_api_flag_lookup = {"no-api"}
+fresh_flag_lookup = {"fresh"}
 # internal flag used to signal, when to add the powered by toornament to an output
 used_toornament_api_flag_lookup = {"powered_by_toornament"}
 # internal flag used to signal, when to add the riot games legal boilerplate
 used_riot_api_flag_lookup = {"not_endorsed_by_riot_games"}
+# internal flag used to mark a part of a result that is sent while the stalk is still running
+partial_flag_lookup = {"partial"}
+# internal flag used to signal, that all parts of the result were already sent as partial results
+streamed_flag_lookup = {"streamed"}
 
 # flag pool
 all_flags_lookup = {
@@ -50,16 +58,204 @@ all_flags_lookup = {
     *as_file_flag_lookup,
     *prime_league_use_group_flag_lookup,
     *dont_use_api_flag_lookup,
+    *fresh_flag_lookup,
 }
 
 """
 lookup tables for query parameters
 """
 
-next_step_lookup = {"interpret", "stalk", "query_db", "format", "display"}
+next_step_lookup = {"interpret", "stalk", "cancel", "query_db", "format", "display"}
 
 forward_to_lookup = {"discord", "frontend", "backend"}
 
+"""
+settings for the backend worker pool
+"""
+
+# maximum number of queries the backend handles at the same time
+backend_max_concurrent_queries = 8
+
+# seconds a query may take from reaching the backend until it is stopped
+query_timeout = 60 * 60
+
+# maximum number of queries per stalker family handled at the same time
+# the keys are the website short names from determine_stalker, the heavy season stalk and the rank stalkers
+backend_lane_limits = {
+    "prime_league": 3,
+    "prime_league_season": 1,
+    "toornament": 2,
+    "summoners_inn": 2,
+    "battlefy": 2,
+    "op_gg": 2,
+    "riot_api": 2,
+}
+
+# maximum number of player ranks stalked at the same time within one query
+# the riot api is additionally throttled by its rate limiter
+op_gg_rank_concurrency = 10
+riot_api_rank_concurrency = 20
+
+"""
+settings for query priorities
+"""
+
+# priority classes by the cost of a query, queries of lower classes are served first by every queue
+# and every worker pool slot. help, version and other messages use the interactive class
+interactive_priority = 0
+team_priority = 1
+group_priority = 2
+# seasons, tournaments and cups
+large_priority = 3
+# stalking ranks moves a query one class further back
+ranks_priority_penalty = 1
+
+# seconds a waiting query needs to catch up with the next class, so expensive queries are not starved
+priority_aging_interval = 10
+
+"""
+settings for the metrics exporter
+"""
+
+# the Prometheus text format is served on http://metrics_host:metrics_port/metrics, None disables the exporter
+metrics_host = "127.0.0.1"
+metrics_port = 9464
+
+# stages of the pipeline a query passes, in order, each is recorded with a monotonic timestamp
+query_stages = (
+    "received",
+    "interpreted",
+    "stalk_start",
+    "stalk_end",
+    "rank_start",
+    "rank_end",
+    "formatted",
+    "sent",
+)
+
+# upper bounds in seconds of the latency histogram buckets, stalks with ranks can take an hour
+metrics_latency_buckets = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+    5, 10, 30, 60, 120, 300, 600, 1800, 3600,
+)
+
+"""
+settings for the pool of headless firefox drivers
+"""
+
+# maximum number of drivers, idle and in use
+gecko_pool_max_size = 2
+# number of drivers started when the bot starts
+gecko_pool_warm_size = 1
+# number of stalks after which a driver is quit and replaced to free its memory
+gecko_pool_max_pages = 20
+# file name of the cached Geckodriver path, placed in the working directory
+gecko_driver_path_cache_file_name = "geckodriver_path.txt"
+
+"""
+settings for the stalk result cache
+"""
+
+# memory budget for all cached stalk results in bytes
+result_cache_max_bytes = 64 * 1024 * 1024
+
+# seconds a stalk result stays valid per website
+result_cache_ttl_per_platform = {
+    "prime_league": 60 * 60,
+    "toornament": 30 * 60,
+    "summoners_inn": 60 * 60,
+    "battlefy": 15 * 60,
+}
+result_cache_default_ttl = 30 * 60
+
+"""
+settings for the shared http session
+"""
+
+# maximum number of open connections over all hosts
+http_connection_limit = 100
+# maximum number of open connections to a single host
+http_connection_limit_per_host = 20
+# seconds a resolved DNS entry is cached
+http_dns_cache_ttl = 300
+# seconds an idle connection is kept open for reuse
+http_keepalive_timeout = 30
+# how often a failed page request is repeated and the seconds waited before the first repetition, doubled each time
+http_retries = 3
+http_retry_backoff = 0.5
+
+# upper bounds in seconds of the buckets of the per host request phase histograms
+http_telemetry_buckets = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+
+# size of the chunks read from large json responses, like the battlefy teams endpoint
+json_stream_chunk_size = 64 * 1024
+
+# number of toornament participants pages requested at the same time, when the page count is unknown
+toornament_page_probe_window = 4
+# maximum number of toornament teams stalked at the same time within one query
+toornament_team_concurrency = 10
+
+# items per Range window of the toornament api resources
+toornament_api_range_sizes = {
+    "participants": 50,
+    "matches": 128,
+    "groups": 50,
+    "stages": 50,
+}
+# maximum number of Range windows requested at the same time and the (requests, seconds) window of the api limit
+toornament_api_concurrency = 4
+toornament_api_rate_limit = (10, 1)
+# seconds to wait after a 429 response of the toornament api without Retry-After header
+toornament_api_default_retry_after = 1
+
+# maximum number of prime league groups of a season stalked at the same time
+prime_league_group_concurrency = 4
+
+"""
+settings for streaming stalkers
+"""
+
+# number of finished teams collected before they are sent to the user as a partial result
+stream_team_batch_size = 10
+
+"""
+settings for the progress message of long stalks
+"""
+
+# seconds before the first progress message, stalks finishing earlier are never reported
+progress_first_update_delay = 5
+# seconds between two edits of the progress message
+progress_update_interval = 5
+# seconds over which the request rate and the rates for the estimated time left are measured
+progress_rate_window = 30
+
+"""
+settings for the player rank store
+"""
+
+# directory of the SQLite rank store relative to the working directory, a volume in the Docker image
+rank_store_directory = "data"
+# file name of the SQLite rank store within the rank store directory
+rank_store_file_name = "rank_store.db"
+# seconds a stored rank is used before the player is stalked again
+rank_store_max_age = 7 * 24 * 60 * 60
+
+"""
+settings for the riot api rate limiter
+"""
+
+# (requests, seconds) windows used until the api reports its limits in the response headers
+# production key app limit, a personal key would be [(20, 1), (100, 120)]
+riot_app_rate_limits = [(500, 10), (30000, 600)]
+riot_method_rate_limits = {
+    "summoner": [(1600, 60)],
+    "league": [(100, 60)],
+}
+# seconds to wait after a 429 response without Retry-After header
+riot_default_retry_after = 1
+
 """
 lookup tables for websites and website key words
 """
@@ -104,12 +300,14 @@ help_message = (
     "For example: .pb stalk rank file <url>\n"
     "would return teams and players for the given <url> with ranks as a file.\n\n"
     "help returns this message and ignores any flags or data.\n"
+    "cancel stops all stalks running for the channel it was sent in.\n"
     "For further information on PykeBot2 see:\n"
     "https://github.com/Twalord/PykeBot2\n"
     "\n"
     "Additional flags: \n"
     "'group' to force prime league group stalker instead of season stalker.\n"
-    "'no-api' to force using the HTML scraper instead of an api."
+    "'no-api' to force using the HTML scraper instead of an api.\n"
+    "'fresh' to ignore recently cached results and stalk again."
 )
 
 """
@@ -8,15 +8,18 @@ but in some cases additional Queries carrying Messages might be created.
 
 from dataclasses import dataclass
 import logging
+import time
 from discord import Message
 from PykeBot2.models.data_models import Payload
 from PykeBot2.models.lookup_tables import (
     next_step_lookup,
     forward_to_lookup,
     debug_flag,
+    interactive_priority,
+    query_stages,
 )
 from PykeBot2.models.errors import InvalidForwardToError, InvalidNextStepError
-from typing import Set
+from typing import Dict, Set
 
 logger = logging.getLogger("pb_logger")
 
@@ -38,6 +41,9 @@ class Query:
     flags: Set[str]
     payload: Payload
     next_step: str
+    deadline: float
+    priority: int
+    timestamps: Dict[str, float]
 
     def __init__(
         self,
@@ -50,6 +56,8 @@ class Query:
         output_message: str = "",
         flags: Set[str] = None,
         payload: Payload = None,
+        deadline: float = None,
+        priority: int = interactive_priority,
     ):
         """
         :description: For new Query Objects its assumed they originate from some interface
@@ -73,6 +81,10 @@ class Query:
         :type flags: Set[str]
         :param payload: Data model that carries the data produced by the backend, a message or an error message.
         :type payload: Payload
+        :param deadline: Event loop time at which the query is stopped, set by the backend if not given.
+        :type deadline: float
+        :param priority: Priority class from the cost of the query, lower classes are served first.
+        :type priority: int
         """
 
         if forward_to not in forward_to_lookup:
@@ -99,6 +111,9 @@ class Query:
         self.flags = flags
         self.forward_to = forward_to
         self.next_step = next_step
+        self.deadline = deadline
+        self.priority = priority
+        self.timestamps = {}
 
     def __str__(self):
         """
@@ -127,6 +142,7 @@ class Query:
         flags: Set[str] = None,
         output_message: str = None,
         payload: Payload = None,
+        deadline: float = None,
     ):
         """
         :description: Updates query information, should be used instead of directly modifying attributes as some checks are
@@ -143,6 +159,8 @@ class Query:
         :type output_message:
         :param payload: Data model that carries the data produced by the backend, a message or an error message.
         :type payload: Payload
+        :param deadline: Event loop time at which the query is stopped, kept if None.
+        :type deadline: float
         :return: None
         :rtype: None
         """
@@ -169,3 +187,26 @@ class Query:
             self.output_message = output_message
         if payload is not None:
             self.payload = payload
+        if deadline is not None:
+            self.deadline = deadline
+
+    def mark(self, stage: str, at: float = None):
+        """
+        :description: Records the monotonic time at which the query reached a stage of the pipeline,
+        used for the latency metrics. The stages are kept in order, a time before the last recorded stage
+        is moved up to it, e.g. for a query that joined a stalk which was already running.
+        :param stage: One of query_stages.
+        :type stage: str
+        :param at: The time.monotonic() at which the stage was reached, standard is now.
+        :type at: float
+        :return: None
+        :rtype: None
+        """
+        if stage not in query_stages:
+            logger.error(f"Failed to mark unknown stage {stage} for query {str(self)}")
+            return
+        if at is None:
+            at = time.monotonic()
+        if len(self.timestamps) > 0:
+            at = max(at, next(reversed(self.timestamps.values())))
+        self.timestamps[stage] = at
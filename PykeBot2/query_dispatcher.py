@@ -0,0 +1,143 @@
+"""
+Offers the dispatcher that moves queries between the stages of the pipeline.
+Every stage registers for its forward_to and next_step values once, which are validated at registration.
+Cheap stages like interpreting and formatting are registered as handlers and run right away on the caller,
+stages with their own coroutine, like the backend or the discord interface, are registered with their Queue.
+A query is passed from handler to handler until it reaches a Queue, so a command only waits in the queue of
+the stage that actually needs time instead of hopping through a single forwarder between every step.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Tuple
+from PykeBot2.models.query import Query
+from PykeBot2.models.errors import InvalidForwardToError, InvalidNextStepError
+from PykeBot2.models.lookup_tables import forward_to_lookup, next_step_lookup
+
+logger = logging.getLogger("pb_logger")
+
+"""
+Maximum number of handlers a single query may pass without reaching a Queue, guards against routing loops.
+"""
+max_handler_hops = 16
+
+
+class QueryDispatcher:
+    """
+    :description: Routes every query by its forward_to and next_step to the registered stage.
+    Offers put_nowait and put like an asyncio.Queue, so it can be handed to every sub module as forward queue.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[Tuple[str, str], Callable[[Query], bool]] = {}
+        self.queues: Dict[Tuple[str, str], asyncio.Queue] = {}
+
+    def register_handler(
+        self,
+        forward_to: str,
+        next_steps: Iterable[str],
+        handler: Callable[[Query], bool],
+    ):
+        """
+        :description: Registers a handler that runs the given steps right away when a query is dispatched to it.
+        The handler updates the query and returns whether it should be dispatched further.
+        :param forward_to: The sub module the handler belongs to.
+        :type forward_to: str
+        :param next_steps: The next_step values handled.
+        :type next_steps: Iterable[str]
+        :param handler: Called with the query, must not block.
+        :type handler: Callable[[Query], bool]
+        :return: None
+        :rtype: None
+        :raises InvalidForwardToError: If forward_to is not a valid value.
+        :raises InvalidNextStepError: If one of next_steps is not a valid value.
+        :raises ValueError: If a route is already registered.
+        """
+        for route in self._routes(forward_to, next_steps):
+            self.handlers[route] = handler
+
+    def register_queue(
+        self, forward_to: str, next_steps: Iterable[str], queue: asyncio.Queue
+    ):
+        """
+        :description: Registers the Queue of a sub module that handles the given steps in its own coroutine.
+        :param forward_to: The sub module.
+        :type forward_to: str
+        :param next_steps: The next_step values handled.
+        :type next_steps: Iterable[str]
+        :param queue: The Queue awaited by the sub module.
+        :type queue: asyncio.Queue
+        :return: None
+        :rtype: None
+        :raises InvalidForwardToError: If forward_to is not a valid value.
+        :raises InvalidNextStepError: If one of next_steps is not a valid value.
+        :raises ValueError: If a route is already registered.
+        """
+        for route in self._routes(forward_to, next_steps):
+            self.queues[route] = queue
+
+    def put_nowait(self, query: Query):
+        """
+        :description: Dispatches the query. Handlers run right away, until the query reaches a Queue.
+        Queries without a registered route or with a failing handler are logged and discarded.
+        :param query: The query to dispatch.
+        :type query: Query
+        :return: None
+        :rtype: None
+        """
+        for _ in range(max_handler_hops):
+            route = (query.forward_to, query.next_step)
+
+            queue = self.queues.get(route)
+            if queue is not None:
+                queue.put_nowait(query)
+                return
+
+            handler = self.handlers.get(route)
+            if handler is None:
+                logger.error(
+                    f"No stage registered for forward_to {query.forward_to} and next_step {query.next_step} "
+                    f"in query {str(query)}, discarding query."
+                )
+                return
+
+            try:
+                dispatch_further = handler(query)
+            except Exception:
+                logger.exception(f"Handling query {str(query)} failed, discarding query.")
+                return
+            if not dispatch_further:
+                return
+
+        logger.error(
+            f"Query {str(query)} passed {max_handler_hops} handlers without reaching a Queue, discarding query."
+        )
+
+    async def put(self, query: Query):
+        """
+        :description: Same as put_nowait, offered for compatibility with asyncio.Queue.
+        :param query: The query to dispatch.
+        :type query: Query
+        :return: None
+        :rtype: None
+        """
+        self.put_nowait(query)
+
+    def _routes(self, forward_to: str, next_steps: Iterable[str]):
+        if forward_to not in forward_to_lookup:
+            logger.error(f"Failed to register stage as forward_to could not be matched: {forward_to}")
+            raise InvalidForwardToError
+        routes = []
+        for next_step in next_steps:
+            if next_step not in next_step_lookup:
+                logger.error(
+                    f"Failed to register stage as next_step could not be matched: {next_step}"
+                )
+                raise InvalidNextStepError
+            route = (forward_to, next_step)
+            if route in self.handlers or route in self.queues:
+                raise ValueError(f"A stage is already registered for {route}")
+            routes.append(route)
+        return routes
@@ -0,0 +1,160 @@
+"""
+Defines the metrics of the query pipeline and the exporter serving them.
+Every query records a monotonic timestamp for each stage it passes, see Query.mark.
+Once the answer was sent, the time between its stages is added to histograms by command and platform,
+so the p50, p95 and p99 latency of every stage can be tracked. Gauges report the depth of the queues.
+The per host http telemetry is exported alongside.
+
+:author: Jonathan Decker
+"""
+
+import logging
+from typing import Optional
+from aiohttp import web
+from PykeBot2.backend.backend_master import determine_website
+from PykeBot2.backend.http_telemetry import telemetry
+from PykeBot2.models.data_models import Error
+from PykeBot2.models.query import Query
+from PykeBot2.models.lookup_tables import (
+    stalk_command_lookup,
+    help_commands_lookup,
+    uniliga_seitenwahl_commands_lookup,
+    version_command_lookup,
+    cancel_command_lookup,
+    metrics_host,
+    metrics_port,
+    metrics_latency_buckets,
+)
+from PykeBot2.utils.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    start_metrics_server,
+)
+
+logger = logging.getLogger("pb_logger")
+
+"""
+Maps every command alias to the name used as command label.
+"""
+command_type_lookup = {
+    **{command: "stalk" for command in stalk_command_lookup},
+    **{command: "help" for command in help_commands_lookup},
+    **{command: "uniliga" for command in uniliga_seitenwahl_commands_lookup},
+    **{command: "version" for command in version_command_lookup},
+    **{command: "cancel" for command in cancel_command_lookup},
+}
+
+"""
+The metrics of the query pipeline.
+"""
+registry = MetricsRegistry()
+queries_total = registry.register(
+    Counter(
+        "pykebot_queries_total",
+        "Answered queries by command, platform and outcome.",
+        ("command", "platform", "outcome"),
+    )
+)
+query_seconds = registry.register(
+    Histogram(
+        "pykebot_query_seconds",
+        "Seconds from receiving a command until its answer was sent.",
+        ("command", "platform"),
+        metrics_latency_buckets,
+    )
+)
+stage_seconds = registry.register(
+    Histogram(
+        "pykebot_query_stage_seconds",
+        "Seconds from the previous stage of a query until it reached the stage.",
+        ("stage", "command", "platform"),
+        metrics_latency_buckets,
+    )
+)
+queue_depth = registry.register(
+    Gauge(
+        "pykebot_queue_depth",
+        "Queries waiting in the queue of a sub module.",
+        ("queue",),
+    )
+)
+for http_metric in telemetry.metrics():
+    registry.register(http_metric)
+
+
+def command_type(query: Query) -> str:
+    """
+    :description: Determines the command label of the query from its raw command.
+    :param query: The handled Query.
+    :type query: Query
+    :return: The command name, e.g. stalk, or unknown.
+    :rtype: str
+    """
+    raw_commands = (query.raw_command or "").split()
+    if len(raw_commands) < 2:
+        return "unknown"
+    return command_type_lookup.get(raw_commands[1], "unknown")
+
+
+def platform(query: Query) -> str:
+    """
+    :description: Determines the platform label of the query from the url of its raw command.
+    :param query: The handled Query.
+    :type query: Query
+    :return: The short name of the website, e.g. prime_league, or none.
+    :rtype: str
+    """
+    raw_commands = (query.raw_command or "").split()
+    website: Optional[str] = None
+    if len(raw_commands) > 2:
+        website = determine_website(raw_commands[-1])
+    return website or "none"
+
+
+def record_query(query: Query):
+    """
+    :description: Adds the stages of an answered query to the metrics.
+    Only queries created from a command are recorded, not the additional messages of a stalk.
+    :param query: The answered Query, its last stage should be sent.
+    :type query: Query
+    :return: None
+    :rtype: None
+    """
+    timestamps = query.timestamps
+    if "received" not in timestamps:
+        return
+    labels = {"command": command_type(query), "platform": platform(query)}
+
+    previous = None
+    for stage, at in timestamps.items():
+        if previous is not None:
+            stage_seconds.observe(at - previous, stage=stage, **labels)
+        previous = at
+    query_seconds.observe(previous - timestamps["received"], **labels)
+
+    outcome = "error" if isinstance(query.payload, Error) else "ok"
+    queries_total.inc(outcome=outcome, **labels)
+
+
+async def start_exporter(
+    host: str = metrics_host, port: int = metrics_port
+) -> Optional[web.AppRunner]:
+    """
+    :description: Serves the metrics in the Prometheus text format on http://host:port/metrics.
+    A failing start, e.g. as the port is taken, is only logged, as the bot works without metrics.
+    :param host: The address to listen on.
+    :type host: str
+    :param port: The port to listen on, None disables the exporter.
+    :type port: int
+    :return: The runner of the server or None if it is not running.
+    :rtype: web.AppRunner
+    """
+    if port is None:
+        return None
+    try:
+        return await start_metrics_server(registry, host, port)
+    except OSError:
+        logger.exception(f"Failed to serve metrics on {host}:{port}")
+        return None
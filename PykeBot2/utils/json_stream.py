@@ -0,0 +1,89 @@
+"""
+Offers incremental decoding of large JSON arrays, so each element can be used as soon as its bytes arrived
+and the whole document never needs to be held in memory.
+
+:author: Jonathan Decker
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterator
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    :description: Decodes a JSON document consisting of a top level array from a stream of byte chunks
+    and yields its elements one by one. Only the element currently decoded is buffered.
+    :param chunks: The utf-8 encoded document, e.g. response.content.iter_chunked(size) of an aiohttp response.
+    :type chunks: AsyncIterator[bytes]
+    :return: Async iterator over the decoded elements.
+    :rtype: AsyncIterator[Any]
+    :raises ValueError: If the document is not a JSON array or ends early.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunk_iterator = chunks.__aiter__()
+    buffer = ""
+    position = 0
+    finished = False
+
+    async def read_more() -> bool:
+        nonlocal buffer, position, finished
+        if finished:
+            return False
+        try:
+            chunk = await chunk_iterator.__anext__()
+        except StopAsyncIteration:
+            finished = True
+            buffer = buffer[position:] + text_decoder.decode(b"", final=True)
+            position = 0
+            return True
+        # drop consumed text, so the buffer only holds the current element
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+        return True
+
+    async def next_token() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _whitespace:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not await read_more():
+                raise ValueError("JSON document ended early")
+
+    if await next_token() != "[":
+        raise ValueError("JSON document is not an array")
+    position += 1
+
+    expect_element = True
+    while True:
+        token = await next_token()
+        if token == "]":
+            return
+        if not expect_element:
+            if token != ",":
+                raise ValueError(f"Unexpected {token!r} between array elements")
+            position += 1
+            expect_element = True
+            continue
+
+        while True:
+            try:
+                element, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not await read_more():
+                    raise
+                continue
+            # a number or literal at the end of the buffer might continue in the next chunk
+            if end == len(buffer) and not finished:
+                await read_more()
+                continue
+            break
+
+        position = end
+        expect_element = False
+        yield element
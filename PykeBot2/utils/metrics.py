@@ -0,0 +1,356 @@
+"""
+Offers counters, gauges and histograms and an exporter serving them in the Prometheus text format.
+Only the few features needed by PykeBot2 are implemented, so no client library is required.
+Quantiles like p95 are calculated by Prometheus from the histogram buckets, e.g. with histogram_quantile.
+
+:author: Jonathan Decker
+"""
+
+import logging
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+
+logger = logging.getLogger("pb_logger")
+
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value: float) -> str:
+    """
+    :description: Formats a sample value for the text format.
+    :param value: The value.
+    :type value: float
+    :return: The formatted value.
+    :rtype: str
+    """
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """
+    :description: Formats label names and values, e.g. {command="stalk",platform="battlefy"}.
+    :param names: The label names.
+    :type names: Sequence[str]
+    :param values: The label values in the order of the names.
+    :type values: Sequence[str]
+    :return: The formatted labels, an empty string without labels.
+    :rtype: str
+    """
+    if len(names) == 0:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\")
+        value = value.replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """
+    :description: Base class of all metrics, keeps a value per combination of label values.
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ):
+        """
+        :description: Creates a metric without samples.
+        :param name: The metric name, e.g. pykebot_queries_total.
+        :type name: str
+        :param documentation: Shown as HELP line.
+        :type documentation: str
+        :param label_names: The names of the labels every sample needs.
+        :type label_names: Sequence[str]
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"Metric {self.name} needs the labels {self.label_names}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """
+        :description: Lists the current samples.
+        :return: (name suffix, label names, label values, value) per sample.
+        :rtype: List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        :description: Renders the metric in the Prometheus text format.
+        :rtype: str
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, names, values, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{format_labels(names, values)} {format_value(value)}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """
+    :description: A value that only goes up, like the number of handled queries.
+    """
+
+    kind = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ):
+        super().__init__(name, documentation, label_names)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        """
+        :description: Increases the value of the given labels.
+        :param amount: Added to the value, must not be negative.
+        :type amount: float
+        :param labels: The label values.
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+        assert amount >= 0
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        """
+        :description: The value of the given labels, 0 if it was never increased.
+        :rtype: float
+        """
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [
+            ("", self.label_names, key, value) for key, value in self.values.items()
+        ]
+
+
+class Gauge(Metric):
+    """
+    :description: A value that goes up and down, like the depth of a Queue.
+    Values can be set directly or read from a function whenever the metrics are rendered.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ):
+        super().__init__(name, documentation, label_names)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str):
+        """
+        :description: Sets the value of the given labels.
+        :param value: The new value.
+        :type value: float
+        :param labels: The label values.
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+        self.values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str):
+        """
+        :description: Reads the value of the given labels from function whenever the metrics are rendered.
+        :param function: Returns the current value, e.g. queue.qsize.
+        :type function: Callable[[], float]
+        :param labels: The label values.
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+        self.functions[self._key(labels)] = function
+
+    def samples(self):
+        values = dict(self.values)
+        for key, function in self.functions.items():
+            values[key] = function()
+        return [("", self.label_names, key, value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """
+    :description: Counts observations, like durations, in cumulative buckets and keeps their sum and count.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = (0.1, 1, 10),
+    ):
+        """
+        :description: Creates a histogram without observations.
+        :param name: The metric name, e.g. pykebot_query_seconds.
+        :type name: str
+        :param documentation: Shown as HELP line.
+        :type documentation: str
+        :param label_names: The names of the labels every observation needs, le is reserved.
+        :type label_names: Sequence[str]
+        :param buckets: The upper bounds of the buckets, +Inf is added.
+        :type buckets: Sequence[float]
+        """
+        super().__init__(name, documentation, label_names)
+        assert "le" not in self.label_names
+        self.buckets = tuple(sorted(buckets))
+        if len(self.buckets) == 0 or not math.isinf(self.buckets[-1]):
+            self.buckets += (math.inf,)
+        # bucket counts, sum and count per label values
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        :description: Adds an observation.
+        :param value: The observed value, e.g. seconds.
+        :type value: float
+        :param labels: The label values.
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+        key = self._key(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, total = self.values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        total[0] += value
+        total[1] += 1
+
+    def count(self, **labels: str) -> int:
+        """
+        :description: The number of observations of the given labels.
+        :rtype: int
+        """
+        values = self.values.get(self._key(labels))
+        return 0 if values is None else values[1][1]
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """
+        :description: Estimates a quantile of the observations of the given labels as the upper bound
+        of the bucket it falls into, the same precision Prometheus has without interpolation.
+        :param q: The quantile, e.g. 0.95.
+        :type q: float
+        :param labels: The label values.
+        :type labels: str
+        :return: The upper bound of the bucket, None without observations.
+        :rtype: float
+        """
+        values = self.values.get(self._key(labels))
+        if values is None:
+            return None
+        counts, (_, total_count) = values
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= q * total_count:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self):
+        samples = []
+        bucket_names = self.label_names + ("le",)
+        for key, (counts, (total_sum, total_count)) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = format_value(float(bound))
+                samples.append(("_bucket", bucket_names, key + (le,), cumulative))
+            samples.append(("_sum", self.label_names, key, total_sum))
+            samples.append(("_count", self.label_names, key, total_count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    :description: Collection of metrics that are rendered together.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        :description: Adds a metric, its name must be unique.
+        :param metric: The metric.
+        :type metric: Metric
+        :return: The metric, so it can be registered where it is created.
+        :rtype: Metric
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        :description: Renders every metric in the Prometheus text format.
+        :rtype: str
+        """
+        return "".join(metric.render() for metric in self.metrics.values())
+
+
+async def start_metrics_server(
+    registry: MetricsRegistry, host: str, port: int
+) -> web.AppRunner:
+    """
+    :description: Serves the metrics of the registry on http://host:port/metrics.
+    :param registry: The metrics to serve.
+    :type registry: MetricsRegistry
+    :param host: The address to listen on, should be a local one.
+    :type host: str
+    :param port: The port to listen on, 0 picks a free one.
+    :type port: int
+    :return: The runner of the server, its cleanup stops the server.
+    :rtype: web.AppRunner
+    :raises OSError: If the server could not listen on host and port, nothing is left running in that case.
+    """
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode(), headers={"Content-Type": content_type}
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    try:
+        await site.start()
+    except BaseException:
+        # e.g. the port is taken, the runner would keep its resources otherwise
+        await runner.cleanup()
+        raise
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,70 @@
+"""
+Offers the priority queue used between the sub modules.
+Queries are served by their priority class, so help, version and other messages are not stuck behind
+expensive stalks. Waiting queries age, a query catches up with the next class every aging interval,
+so expensive queries are delayed but never starved.
+
+:author: Jonathan Decker
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable, List, Tuple
+from PykeBot2.models.query import Query
+from PykeBot2.models.lookup_tables import priority_aging_interval
+
+
+def aged_key(priority: int, now: float, aging: float = priority_aging_interval) -> float:
+    """
+    :description: Turns a priority class into a sort key that ages with time.
+    The key is the time at which the entry would be served if it was the only one of class 0,
+    so an entry of class n waiting for n aging intervals is equal to a new entry of class 0.
+    :param priority: The priority class, lower classes are served first.
+    :type priority: int
+    :param now: The time the entry starts waiting.
+    :type now: float
+    :param aging: Seconds a waiting entry needs to catch up with the next class.
+    :type aging: float
+    :return: The sort key, smaller keys are served first.
+    :rtype: float
+    """
+    return now + priority * aging
+
+
+class PriorityQueryQueue(asyncio.Queue):
+    """
+    :description: Drop in replacement for asyncio.Queue that hands out queries ordered by their aged priority.
+    Queries with the same key keep their order.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        aging: float = priority_aging_interval,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :description: Creates an empty queue.
+        :param maxsize: The maximum number of queries, 0 for no limit.
+        :type maxsize: int
+        :param aging: Seconds a waiting query needs to catch up with the next class.
+        :type aging: float
+        :param clock: Returns the current time in seconds, replaceable for testing.
+        :type clock: Callable[[], float]
+        """
+        self.aging = aging
+        self.clock = clock
+        self.counter = itertools.count()
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._queue: List[Tuple[float, int, Query]] = []
+
+    def _put(self, query: Query):
+        key = aged_key(query.priority, self.clock(), self.aging)
+        heapq.heappush(self._queue, (key, next(self.counter), query))
+
+    def _get(self) -> Query:
+        return heapq.heappop(self._queue)[2]
@@ -4,10 +4,12 @@ Test Prime League stalker and op gg stalker functions.
 :author: Jonathan Decker
 """
 
+import asyncio
 import sys
 
 import pytest
 import os
+from tests.fake_http import FakeResponse, FakeSession
 
 recreate_test_data = False
 
@@ -129,3 +131,236 @@ async def test_positive_stalk_prime_league_team():
     with open(os.path.join(sys.path[0], "expected_result_stalk_prime_league_team_with_ranks"), "r", encoding='utf-8') as file:
         expected_result = file.read()
         assert extended_result_str == expected_result
+
+
+@pytest.mark.asyncio
+async def test_prime_league_groups_are_stalked_concurrently(monkeypatch):
+    from PykeBot2.backend.stalker import prime_league
+    from PykeBot2.models.data_models import TeamList
+
+    running = 0
+    max_running = 0
+
+    async def fake_stalk_group(link, session=None, headless=True):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0)
+        running -= 1
+        return TeamList(link, [])
+
+    monkeypatch.setattr(prime_league, "stalk_prime_league_group", fake_stalk_group)
+    links = [f"group-{i}" for i in range(10)]
+
+    team_list_list = await prime_league.stalk_prime_league_groups(links, None, 3)
+
+    assert [team_list.name for team_list in team_list_list.team_lists] == links
+    assert max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_prime_league_groups_are_streamed_as_they_finish(monkeypatch):
+    from PykeBot2.backend.stalker import prime_league
+    from PykeBot2.models.data_models import TeamList
+
+    async def fake_stalk_group(link, session=None, headless=True):
+        # the first group is the slowest
+        for _ in range(3 - int(link[-1])):
+            await asyncio.sleep(0)
+        return TeamList(link, [])
+
+    monkeypatch.setattr(prime_league, "stalk_prime_league_group", fake_stalk_group)
+    links = [f"group-{i}" for i in range(3)]
+
+    updates = [
+        update async for update in prime_league.stream_prime_league_groups(links, None, 3)
+    ]
+
+    assert [update.partial.name for update in updates] == list(reversed(links))
+    assert [team_list.name for team_list in updates[-1].result.team_lists] == links
+    assert [len(update.result.team_lists) for update in updates] == [1, 2, 3]
+
+
+season_link = "https://www.primeleague.gg/leagues/prm/1-season"
+
+season_page = """
+<section class="boxed-section"><h2>Gruppenphase</h2>
+  <div class="content-subsection">
+    <a href="https://www.primeleague.gg/leagues/prm/1-season/group/1-div-1">Division 1</a>
+  </div>
+  <div class="content-subsection">
+    <a href="https://www.primeleague.gg/leagues/prm/1-season/group/2-div-2-1">Gruppe 2.1</a>
+    <a href="https://www.primeleague.gg/leagues/prm/1-season/group/3-div-2-2">Gruppe 2.2</a>
+  </div>
+  <div class="content-subsection">
+    <a href="https://www.primeleague.gg/leagues/prm/1-season/division/3">Division 3</a>
+  </div>
+</section>
+"""
+
+division_page = """
+<a href="https://www.primeleague.gg/leagues/prm/1-season/group/4-div-3-1">Gruppe 3.1</a>
+<a href="https://www.primeleague.gg/leagues/prm/1-season/teams/5-team">Team</a>
+"""
+
+
+@pytest.mark.asyncio
+async def test_season_group_links_are_discovered_over_http():
+    from PykeBot2.backend.stalker.prime_league import discover_group_links_http
+
+    session = FakeSession(
+        {
+            season_link: season_page,
+            "https://www.primeleague.gg/leagues/prm/1-season/division/3": division_page,
+        }
+    )
+
+    group_links = await discover_group_links_http(season_link, session)
+
+    assert [link.rsplit("/", 1)[1] for link in group_links] == [
+        "1-div-1",
+        "2-div-2-1",
+        "3-div-2-2",
+        "4-div-3-1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_collapsed_divisions_need_the_browser():
+    from PykeBot2.backend.stalker.prime_league import discover_group_links_http
+
+    collapsed_page = season_page.replace(
+        '<a href="https://www.primeleague.gg/leagues/prm/1-season/division/3">Division 3</a>', ""
+    )
+    session = FakeSession({season_link: collapsed_page})
+
+    assert await discover_group_links_http(season_link, session) == []
+
+
+@pytest.mark.asyncio
+async def test_division_pages_without_groups_need_the_browser():
+    from PykeBot2.backend.stalker.prime_league import discover_group_links_http
+
+    session = FakeSession(
+        {
+            season_link: season_page,
+            "https://www.primeleague.gg/leagues/prm/1-season/division/3": '<a href="/">Home</a>',
+        }
+    )
+
+    assert await discover_group_links_http(season_link, session) == []
+
+
+@pytest.mark.asyncio
+async def test_season_pages_failing_with_server_errors_need_the_browser(monkeypatch):
+    from PykeBot2.backend import http_client
+    from PykeBot2.backend.stalker import prime_league
+    from PykeBot2.backend.stalker.streaming import StalkUpdate
+    from PykeBot2.models.data_models import TeamListList
+
+    async def no_sleep(delay):
+        pass
+
+    async def fake_run_in_browser(func, link, headless=True):
+        assert func is prime_league.load_prime_league_season_page
+        return season_page
+
+    async def fake_stream_groups(group_links, session):
+        yield StalkUpdate(TeamListList([]), TeamListList(group_links))
+
+    monkeypatch.setattr(http_client.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(prime_league.gecko_manager, "run_in_browser", fake_run_in_browser)
+    monkeypatch.setattr(prime_league, "stream_prime_league_groups", fake_stream_groups)
+    session = FakeSession({season_link: FakeResponse(503)})
+
+    updates = [
+        update async for update in prime_league.stream_prime_league_season(season_link, session)
+    ]
+
+    # the season page was requested until the retries ran out, then the browser found the groups
+    assert len(session.requested) == http_client.http_retries + 1
+    assert [link.rsplit("/", 1)[1] for link in updates[-1].result.team_lists] == [
+        "1-div-1",
+        "2-div-2-1",
+        "3-div-2-2",
+    ]
+
+
+swiss_link = "https://www.primeleague.gg/leagues/prm/1-season/group/9-swiss-starter"
+
+
+def swiss_page(page: int) -> str:
+    return f"""
+<div class="page-title"><h1>Swiss Starter</h1></div>
+<div id="league-swiss-ranking-tab-main">
+  <table class="table table-fixed-single">
+    <a href="https://www.primeleague.gg/leagues/teams/{page}1-team">Team</a>
+    <a href="https://www.primeleague.gg/leagues/teams/{page}2-team">Team</a>
+  </table>
+  <div><div></div><div>
+    <a href="?page=1"><i></i></a>
+    <a href="?page=2">2</a>
+    <a class="nav-next" href="?page={min(page + 1, 3)}"></a>
+    <a href="?page=3">3</a>
+  </div></div>
+</div>
+"""
+
+
+@pytest.mark.asyncio
+async def test_swiss_pages_are_fetched_over_http():
+    import bs4
+    from PykeBot2.backend.stalker.prime_league import stalk_swiss_team_links_http
+
+    session = FakeSession(
+        {f"{swiss_link}?page={page}": swiss_page(page) for page in (2, 3)}
+    )
+    soup = bs4.BeautifulSoup(swiss_page(1), features="html.parser")
+
+    team_links = await stalk_swiss_team_links_http(swiss_link, soup, session)
+
+    assert sorted(session.requested) == [f"{swiss_link}?page=2", f"{swiss_link}?page=3"]
+    assert [link.rsplit("/", 1)[1] for link in team_links] == [
+        "11-team", "12-team", "21-team", "22-team", "31-team", "32-team",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_swiss_tables_rendered_by_javascript_need_the_browser():
+    import bs4
+    from PykeBot2.backend.stalker.prime_league import stalk_swiss_team_links_http
+
+    soup = bs4.BeautifulSoup('<div id="league-swiss-ranking-tab-main"></div>', features="html.parser")
+
+    assert await stalk_swiss_team_links_http(swiss_link, soup, FakeSession({})) == []
+
+
+@pytest.mark.asyncio
+async def test_swiss_pages_failing_with_server_errors_need_the_browser(monkeypatch):
+    from PykeBot2.backend import http_client
+    from PykeBot2.backend.stalker import prime_league
+
+    async def no_sleep(delay):
+        pass
+
+    async def fake_run_in_browser(func, link, headless=True):
+        assert func is prime_league.load_swiss_group_page
+        return swiss_page(1) + swiss_page(2) + swiss_page(3)
+
+    async def fake_stalk_team(link, session=None):
+        return link
+
+    monkeypatch.setattr(http_client.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(prime_league.gecko_manager, "run_in_browser", fake_run_in_browser)
+    monkeypatch.setattr(prime_league, "stalk_prime_league_team", fake_stalk_team)
+    session = FakeSession(
+        {
+            swiss_link: swiss_page(1),
+            f"{swiss_link}?page=2": FakeResponse(503),
+            f"{swiss_link}?page=3": swiss_page(3),
+        }
+    )
+
+    team_list = await prime_league.stalk_prime_league_group(swiss_link, session)
+
+    assert len(team_list.teams) == 6
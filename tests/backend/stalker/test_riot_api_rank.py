@@ -0,0 +1,140 @@
+import pytest
+from tests.fake_http import FakeResponse, FakeSession
+
+
+class FakeRiotSession(FakeSession):
+    """
+    Answers summoner and league requests like the Riot api.
+    """
+
+    def __init__(self, summoner_ids: dict, leagues: dict):
+        super().__init__()
+        self.summoner_ids = summoner_ids
+        self.leagues = leagues
+
+    def respond(self, url: str, **kwargs):
+        key = url.rsplit("/", 1)[1]
+        if "/summoners/by-name/" in url:
+            if key not in self.summoner_ids:
+                return FakeResponse(404, {})
+            return FakeResponse(200, {"id": self.summoner_ids[key]})
+        if key not in self.leagues:
+            return FakeResponse(404, {})
+        return FakeResponse(200, self.leagues[key])
+
+
+solo_queue_gold = [
+    {"queueType": "RANKED_SOLO_5x5", "tier": "GOLD", "rank": "I", "leaguePoints": 42}
+]
+
+
+@pytest.mark.asyncio
+async def test_summoner_id_is_cached():
+    from PykeBot2.backend.rank_store import RankStore
+    from PykeBot2.backend.stalker.riot_api_rank import RateLimiter, stalk_player_riot_api
+
+    rank_store = RankStore(":memory:")
+    await rank_store.open()
+    fake_session = FakeRiotSession({"Player": "id-1"}, {"id-1": solo_queue_gold})
+    session = RateLimiter(fake_session)
+
+    assert await stalk_player_riot_api("Player", "token", session, rank_store) == ("GOLD I", 42)
+    assert len(fake_session.requested) == 2
+
+    # warm lookup only needs the league request
+    fake_session.requested.clear()
+    assert await stalk_player_riot_api("Player", "token", session, rank_store) == ("GOLD I", 42)
+    assert len(fake_session.requested) == 1
+    assert "/league/v4/" in fake_session.requested[0]
+
+    await rank_store.close()
+
+
+@pytest.mark.asyncio
+async def test_invalid_summoner_id_is_looked_up_again():
+    from PykeBot2.backend.rank_store import RankStore
+    from PykeBot2.backend.stalker.riot_api_rank import RateLimiter, stalk_player_riot_api
+
+    rank_store = RankStore(":memory:")
+    await rank_store.open()
+    await rank_store.put_summoner_id("Player", "outdated-id")
+    fake_session = FakeRiotSession({"Player": "id-2"}, {"id-2": solo_queue_gold})
+
+    result = await stalk_player_riot_api("Player", "token", RateLimiter(fake_session), rank_store)
+
+    assert result == ("GOLD I", 42)
+    assert await rank_store.get_summoner_id("Player") == "id-2"
+
+    await rank_store.close()
+
+
+@pytest.mark.asyncio
+async def test_team_list_list_ranks_are_stalked_over_all_teams():
+    from PykeBot2.models.data_models import Player, Team, TeamList, TeamListList
+    from PykeBot2.backend.stalker.riot_api_rank import RateLimiter, add_team_list_list_ranks
+
+    names = [f"Player{i}" for i in range(12)]
+    fake_session = FakeRiotSession(
+        {name: f"id-{name}" for name in names},
+        {f"id-{name}": solo_queue_gold for name in names},
+    )
+    teams = [
+        Team(f"Team{i}", [Player(name) for name in names[i * 4:(i + 1) * 4]])
+        for i in range(3)
+    ]
+    team_list_list = TeamListList([TeamList("A", teams[:2]), TeamList("B", teams[2:])])
+
+    await add_team_list_list_ranks(team_list_list, "token", RateLimiter(fake_session))
+
+    assert len(fake_session.requested) == 24
+    for team in teams:
+        assert team.average_rank.rank_int == 16
+        assert all(player.rank.rank_int == 16 for player in team.players)
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_requests_are_not_repeated_forever():
+    from PykeBot2.backend.stalker.riot_api_rank import (
+        RateLimiter,
+        riot_api_get,
+        stalk_player_riot_api,
+    )
+
+    fake_session = FakeSession(
+        {}, default=FakeResponse(429, {"status": {"status_code": 429}}, {"Retry-After": "0"})
+    )
+    session = RateLimiter(fake_session)
+
+    status, _ = await riot_api_get(session, "url", "league", "token", retries=2)
+    assert status == 429
+    assert fake_session.requests == 3
+
+    assert await stalk_player_riot_api("Player", "token", session) == ("", -1)
+
+
+@pytest.mark.asyncio
+async def test_unranked_players_are_stored():
+    from PykeBot2.backend.rank_store import RankStore
+    from PykeBot2.backend.stalker.riot_api_rank import RateLimiter, add_player_rank
+    from PykeBot2.models.data_models import Player
+
+    rank_store = RankStore(":memory:")
+    await rank_store.open()
+    fake_session = FakeRiotSession(
+        {"Unranked": "id-1", "Failing": "id-2"},
+        {"id-1": [{"queueType": "RANKED_FLEX_SR", "tier": "GOLD", "rank": "I", "leaguePoints": 1}]},
+    )
+    session = RateLimiter(fake_session)
+
+    player = Player("Unranked")
+    await add_player_rank(player, "token", session, rank_store)
+    assert player.rank.rank_int == 0
+    assert await rank_store.get_rank("Unranked") == ("unranked", -1)
+
+    # the league lookup of this player fails, so its rank is unknown and not stored
+    player = Player("Failing")
+    await add_player_rank(player, "token", session, rank_store)
+    assert player.rank.rank_int == -1
+    assert await rank_store.get_rank("Failing") is None
+
+    await rank_store.close()
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from PykeBot2.backend.stalker.riot_rate_limiter import (
+    RateLimiter,
+    SimulatedClock,
+    parse_rate_limit_header,
+    simulate_throughput,
+)
+from tests.fake_http import FakeResponse, FakeSession
+
+
+def test_parse_rate_limit_header():
+    assert parse_rate_limit_header("20:1,100:120") == [(20, 1.0), (100, 120.0)]
+    assert parse_rate_limit_header("") == []
+
+
+def test_app_and_method_windows_are_respected():
+    clock = SimulatedClock()
+    limiter = RateLimiter(
+        None,
+        clock,
+        app_limits=[(20, 1), (100, 120)],
+        method_limits={"summoner": [(1000, 10)], "league": [(30, 10)]},
+    )
+
+    # the short app window allows 20 requests per second and the long one 100 per 2 minutes
+    throughput = simulate_throughput(limiter, ["summoner"], 101)
+    assert clock.now() == pytest.approx(120)
+    assert throughput == pytest.approx(101 / 120)
+
+    # the league bucket is separate, 30 requests per 10 seconds
+    clock = SimulatedClock()
+    limiter = RateLimiter(
+        None, clock, app_limits=[(500, 10)], method_limits={"league": [(30, 10)]}
+    )
+    simulate_throughput(limiter, ["league"], 61)
+    assert clock.now() == pytest.approx(20)
+    assert limiter.reserve("summoner") == 0
+
+
+def test_sustained_rate_is_set_by_the_tightest_window():
+    limiter = RateLimiter(
+        None,
+        SimulatedClock(),
+        app_limits=[(20, 1), (100, 120)],
+        method_limits={"league": [(30, 60)]},
+    )
+
+    assert limiter.sustained_rate("league") == pytest.approx(0.5)
+    assert limiter.sustained_rate("summoner") == pytest.approx(100 / 120)
+
+
+def test_limits_and_counts_are_learned_from_headers():
+    clock = SimulatedClock()
+    limiter = RateLimiter(None, clock, app_limits=[(500, 10)], method_limits={})
+
+    limiter.update_from_headers(
+        "league",
+        200,
+        {
+            "X-App-Rate-Limit": "20:1,100:120",
+            "X-App-Rate-Limit-Count": "20:1,20:120",
+            "X-Method-Rate-Limit": "50:10",
+            "X-Method-Rate-Limit-Count": "3:10",
+        },
+    )
+
+    assert [(w.limit, w.seconds) for w in limiter.app_bucket.windows] == [(20, 1), (100, 120)]
+    assert limiter.method_bucket("league").windows[0].count == 3
+    # the api reported the short app window as full
+    assert limiter.reserve("league") == pytest.approx(1)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured():
+    clock = SimulatedClock()
+    session = FakeSession(
+        [
+            FakeResponse(429, headers={"Retry-After": "7", "X-Rate-Limit-Type": "method"}),
+            FakeResponse(200, {}),
+        ]
+    )
+    limiter = RateLimiter(session, clock)
+
+    async with await limiter.get("url", method="league") as r:
+        assert r.status == 429
+    async with await limiter.get("url", method="league") as r:
+        assert r.status == 200
+    assert clock.now() == pytest.approx(7)
+
+    # a method limit does not block other methods
+    assert limiter.reserve("summoner") == 0
+
+
+@pytest.mark.asyncio
+async def test_application_retry_after_blocks_every_method():
+    clock = SimulatedClock()
+    session = FakeSession([FakeResponse(429, headers={"Retry-After": "3", "X-Rate-Limit-Type": "application"})])
+    limiter = RateLimiter(session, clock)
+
+    async with await limiter.get("url", method="league"):
+        pass
+
+    assert limiter.reserve("summoner") == pytest.approx(3)
+    await asyncio.gather(limiter.acquire("summoner"), limiter.acquire("league"))
+    assert clock.now() >= 3
@@ -0,0 +1,40 @@
+import pytest
+
+
+def test_team_batcher_keeps_order_and_batches():
+    from PykeBot2.backend.stalker.streaming import TeamBatcher
+    from PykeBot2.models.data_models import Team
+
+    batcher = TeamBatcher("cup", 3, batch_size=2)
+
+    assert batcher.add(2, Team("c", [])) is None
+    # teams that could not be stalked are skipped
+    assert batcher.add(1, None) is None
+    update = batcher.add(0, Team("a", []))
+
+    assert [team.name for team in update.partial.teams] == ["c", "a"]
+    assert [team.name for team in update.result.teams] == ["a", "c"]
+    assert batcher.flush().partial.teams == []
+
+
+@pytest.mark.asyncio
+async def test_collect_stream_hands_out_partials_and_returns_last_result():
+    from PykeBot2.backend.stalker.streaming import StalkUpdate, collect_stream
+
+    async def stream():
+        yield StalkUpdate("a", ["a"])
+        yield StalkUpdate("b", ["a", "b"])
+
+    partials = []
+    result = await collect_stream(
+        stream(), lambda update: partials.append(update.partial)
+    )
+
+    assert partials == ["a", "b"]
+    assert result == ["a", "b"]
+    assert await collect_stream(stream_nothing(), default="empty") == "empty"
+
+
+async def stream_nothing():
+    return
+    yield
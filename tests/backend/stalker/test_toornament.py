@@ -1,7 +1,9 @@
+import asyncio
 import sys
 
 import pytest
 import os
+from tests.fake_http import FakeResponse, FakeSession
 
 recreate_test_data = False
 
@@ -120,3 +122,126 @@ async def test_broken_link_stalk_toornament_team():
 
     with pytest.raises(ClientConnectorError):
         team_list = await toornament.stalk_toornament_team(unreachable_url)
+
+
+participants_link = "https://www.toornament.com/en_GB/tournaments/1/participants"
+tournament_header = (
+    '<div id="main-container"><div class="layout-section header highlight"><div><section><div>'
+    '<div class="information"><h1>Cup</h1></div></div></section></div></div></div>'
+)
+
+
+def participants_page(page_number: int, pagination: str = "") -> str:
+    teams = "".join(
+        f'<div class="size-1-of-4"><a href="/team/{page_number}-{i}/">Team</a></div>'
+        for i in range(2)
+    )
+    return f"<html><body>{tournament_header}{teams}{pagination}</body></html>"
+
+
+@pytest.mark.asyncio
+async def test_participant_pages_are_fetched_from_pagination(monkeypatch):
+    from PykeBot2.backend.stalker import toornament
+
+    async def fake_stalk_team(link, session=None):
+        return link
+
+    monkeypatch.setattr(toornament, "stalk_toornament_team", fake_stalk_team)
+    pagination = '<nav class="pagination"><a href="?page=2">2</a><a href="?page=12">12</a></nav>'
+    pages = {participants_link: participants_page(1, pagination)}
+    for page_number in range(2, 13):
+        pages[f"{participants_link}?page={page_number}"] = participants_page(page_number)
+    session = FakeSession(pages, default="<html></html>")
+
+    team_list = await toornament.stalk_toornament_tournament(
+        participants_link.rsplit("/", 1)[0], session
+    )
+
+    assert len(team_list.teams) == 24
+    assert team_list.teams[-1] == "https://www.toornament.com/team/12-1/"
+    # the first page and the 11 further pages are requested once each, no page after the last
+    assert len(session.requested) == 12
+    assert f"{participants_link}?page=10" in session.requested
+
+
+@pytest.mark.asyncio
+async def test_participant_pages_are_probed_without_pagination():
+    from PykeBot2.backend.stalker.toornament import probe_participant_pages
+
+    pages = {
+        f"{participants_link}?page={page_number}": participants_page(page_number)
+        for page_number in range(2, 7)
+    }
+    session = FakeSession(pages, default="<html></html>")
+
+    containers = await probe_participant_pages(participants_link, session, window=4)
+
+    assert len(containers) == 10
+    # two windows of four pages, the second one finds the end
+    assert len(session.requested) == 8
+
+
+@pytest.mark.asyncio
+async def test_probe_raises_on_pages_that_could_not_be_loaded():
+    from PykeBot2.backend.stalker.toornament import probe_participant_pages
+    from PykeBot2.models.errors import ServerErrorResponseError
+
+    pages = {
+        f"{participants_link}?page={page_number}": participants_page(page_number)
+        for page_number in range(2, 7)
+    }
+    pages[f"{participants_link}?page=3"] = FakeResponse(403)
+    session = FakeSession(pages, default="<html></html>")
+    with pytest.raises(ServerErrorResponseError):
+        await probe_participant_pages(participants_link, session, window=4)
+
+
+@pytest.mark.asyncio
+async def test_missing_page_after_the_last_one_ends_the_probe():
+    from PykeBot2.backend.stalker.toornament import probe_participant_pages
+
+    pages = {
+        f"{participants_link}?page={page_number}": participants_page(page_number)
+        for page_number in range(2, 4)
+    }
+    for page_number in range(4, 10):
+        pages[f"{participants_link}?page={page_number}"] = FakeResponse(404)
+    session = FakeSession(pages)
+
+    containers = await probe_participant_pages(participants_link, session, window=4)
+
+    assert len(containers) == 4
+
+
+@pytest.mark.asyncio
+async def test_toornament_teams_are_stalked_with_bounded_concurrency(monkeypatch):
+    from PykeBot2.backend.stalker import toornament
+
+    running = 0
+    max_running = 0
+
+    async def fake_stalk_team(link, session=None):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0)
+        running -= 1
+        return link
+
+    monkeypatch.setattr(toornament, "stalk_toornament_team", fake_stalk_team)
+    pagination = '<nav class="pagination"><a href="?page=4">4</a></nav>'
+    pages = {participants_link: participants_page(1, pagination)}
+    for page_number in range(2, 5):
+        pages[f"{participants_link}?page={page_number}"] = participants_page(page_number)
+
+    session = FakeSession(pages, default="<html></html>")
+
+    updates = [
+        update
+        async for update in toornament.stream_toornament_tournament(
+            participants_link.rsplit("/", 1)[0], session, concurrency=3
+        )
+    ]
+
+    assert len(updates[-1].result.teams) == 8
+    assert max_running == 3
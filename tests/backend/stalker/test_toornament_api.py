@@ -0,0 +1,127 @@
+import pytest
+from tests.fake_http import FakeResponse, FakeSession
+
+
+class FakeApiSession(FakeSession):
+    """
+    Pages a list of items with Range headers like the toornament api.
+    """
+
+    def __init__(self, items: list, send_total: bool = True, failing: dict = None):
+        super().__init__()
+        self.items = items
+        self.send_total = send_total
+        self.failing = failing or {}
+        self.ranges = []
+
+    def respond(self, url: str, headers=None, **kwargs):
+        resource, window = headers["Range"].split("=")
+        range_from, range_to = (int(part) for part in window.split("-"))
+        self.ranges.append((range_from, range_to))
+        if range_from in self.failing:
+            return FakeResponse(self.failing[range_from], [])
+        if range_from >= len(self.items):
+            return FakeResponse(416, [])
+        window_items = self.items[range_from:range_to + 1]
+        headers = {}
+        if self.send_total:
+            headers["Content-Range"] = (
+                f"{resource} {range_from}-{range_from + len(window_items) - 1}/{len(self.items)}"
+            )
+        return FakeResponse(206, window_items, headers)
+
+
+def test_parse_content_range():
+    from PykeBot2.backend.stalker.toornament_api import parse_content_range
+
+    assert parse_content_range("participants 0-49/237") == 237
+    assert parse_content_range("participants */0") == 0
+    assert parse_content_range(None) is None
+
+
+@pytest.mark.asyncio
+async def test_remaining_windows_are_fetched_after_the_total_is_known():
+    from PykeBot2.backend.stalker.toornament_api import (
+        FixedWindowLimiter,
+        fetch_range_paginated,
+    )
+
+    session = FakeApiSession([{"id": i} for i in range(237)])
+
+    items = await fetch_range_paginated(
+        FixedWindowLimiter(session, 1000, 1), "url", "participants", "token", 50
+    )
+
+    assert items == session.items
+    assert session.ranges == [(0, 49), (50, 99), (100, 149), (150, 199), (200, 236)]
+
+
+@pytest.mark.asyncio
+async def test_windows_are_walked_without_total():
+    from PykeBot2.backend.stalker.toornament_api import (
+        FixedWindowLimiter,
+        fetch_range_paginated,
+    )
+
+    session = FakeApiSession([{"id": i} for i in range(100)], send_total=False)
+
+    items = await fetch_range_paginated(
+        FixedWindowLimiter(session, 1000, 1), "url", "matches", "token"
+    )
+
+    assert items == session.items
+    assert session.ranges == [(0, 127)]
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_windows_are_not_repeated_forever():
+    from PykeBot2.backend.stalker.toornament_api import FixedWindowLimiter, fetch_range
+    from PykeBot2.models.errors import ServerErrorResponseError
+
+    session = FakeSession({}, default=FakeResponse(429, [], {"Retry-After": "0"}))
+    limiter = FixedWindowLimiter(session, 1000, 1)
+
+    with pytest.raises(ServerErrorResponseError):
+        await fetch_range(limiter, "url", "participants", "token", 0, 49, retries=2)
+    assert session.requests == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_windows_are_not_dropped():
+    from PykeBot2.backend.stalker.toornament_api import (
+        FixedWindowLimiter,
+        fetch_range_paginated,
+    )
+    from PykeBot2.models.errors import NotFoundResponseError, ServerErrorResponseError
+
+    session = FakeApiSession([{"id": i} for i in range(237)], failing={100: 503})
+    with pytest.raises(ServerErrorResponseError):
+        await fetch_range_paginated(
+            FixedWindowLimiter(session, 1000, 1), "url", "participants", "token", 50
+        )
+
+    session = FakeApiSession([], failing={0: 404})
+    with pytest.raises(NotFoundResponseError):
+        await fetch_range_paginated(
+            FixedWindowLimiter(session, 1000, 1), "url", "participants", "token", 50
+        )
+
+
+def test_fixed_window_limiter():
+    from PykeBot2.backend.stalker.toornament_api import FixedWindowLimiter
+
+    now = [0.0]
+    limiter = FixedWindowLimiter(None, 2, 1, clock=lambda: now[0])
+
+    assert limiter.reserve() == 0
+    now[0] = 0.5
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0.5
+    now[0] = 1.0
+    assert limiter.reserve() == 0
+
+    # a 429 blocks the limiter for Retry-After seconds
+    limiter.block({"Retry-After": "3"})
+    assert limiter.reserve() == 3
+    now[0] = 4.0
+    assert limiter.reserve() == 0
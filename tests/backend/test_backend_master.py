@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_streaming_stalk_forwards_partials_before_the_result(monkeypatch):
+    from PykeBot2.backend import backend_master
+    from PykeBot2.backend.stalker import battlefy
+    from PykeBot2.backend.stalker.streaming import StalkUpdate
+    from PykeBot2.backend.worker_pool import WorkerPool
+    from PykeBot2.models.data_models import Team, TeamList
+    from PykeBot2.models.lookup_tables import partial_flag_lookup, streamed_flag_lookup
+    from PykeBot2.models.query import Query
+
+    async def fake_stream(url, session=None):
+        yield StalkUpdate(TeamList("cup", [Team("a", [])]), TeamList("cup", [Team("a", [])]))
+        yield StalkUpdate(
+            TeamList("cup", [Team("b", [])]),
+            TeamList("cup", [Team("a", []), Team("b", [])]),
+        )
+
+    monkeypatch.setitem(
+        backend_master.stalker_to_streaming_stalker,
+        battlefy.stalk_battlefy_tournament,
+        fake_stream,
+    )
+    resources = backend_master.BackendResources(WorkerPool(2, {"battlefy": 1}))
+    forward_queue = asyncio.Queue()
+    query = Query(
+        "discord",
+        "backend",
+        "stalk",
+        raw_command=".pb stalk",
+        data="https://battlefy.com/org/cup/123/info",
+    )
+
+    await backend_master.stalk_query(query, forward_queue, resources)
+
+    partials = [forward_queue.get_nowait() for _ in range(forward_queue.qsize())]
+    assert [partial.payload.teams[0].name for partial in partials] == ["a", "b"]
+    assert all(partial.flags == partial_flag_lookup for partial in partials)
+    assert len(query.payload.teams) == 2
+    assert streamed_flag_lookup.issubset(query.flags)
+    assert resources.running_stalks == {}
+    await resources.pool.shutdown()
+
+
+def make_stalk_query(channel: int = 1):
+    from PykeBot2.models.query import Query
+
+    return Query(
+        "discord",
+        "backend",
+        "stalk",
+        raw_command=".pb stalk",
+        data="https://battlefy.com/org/cup/123/info",
+        discord_channel=channel,
+    )
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_the_stalks_of_the_channel(monkeypatch):
+    from PykeBot2.backend import backend_master
+    from PykeBot2.models.data_models import Message
+    from PykeBot2.models.query import Query
+
+    started = asyncio.Event()
+
+    async def slow_stalk(query, forward_queue, resources):
+        started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(backend_master, "stalk_query", slow_stalk)
+    forward_queue = asyncio.Queue()
+    backend_queue = asyncio.Queue()
+    loop_task = asyncio.ensure_future(
+        backend_master.backend_loop(forward_queue, backend_queue)
+    )
+
+    backend_queue.put_nowait(make_stalk_query(channel=1))
+    await started.wait()
+    cancel = Query("discord", "backend", "cancel", raw_command=".pb cancel", discord_channel=2)
+    backend_queue.put_nowait(cancel)
+    reply = await asyncio.wait_for(forward_queue.get(), 1)
+    assert reply.payload == Message("There is no running stalk to cancel.")
+
+    cancel = Query("discord", "backend", "cancel", raw_command=".pb cancel", discord_channel=1)
+    backend_queue.put_nowait(cancel)
+    reply = await asyncio.wait_for(forward_queue.get(), 1)
+    assert reply.payload == Message("Cancelled 1 running stalk.")
+
+    # the cancelled query is not forwarded, but marked as done
+    await asyncio.wait_for(backend_queue.join(), 1)
+    assert forward_queue.empty()
+
+    loop_task.cancel()
+    await asyncio.gather(loop_task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_query_is_stopped_at_its_deadline(monkeypatch):
+    from PykeBot2.backend import backend_master
+    from PykeBot2.backend.worker_pool import WorkerPool
+    from PykeBot2.models.data_models import Error
+
+    async def slow_stalk(query, forward_queue, resources):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(backend_master, "stalk_query", slow_stalk)
+    resources = backend_master.BackendResources(WorkerPool(2, {}))
+    forward_queue = asyncio.Queue()
+    backend_queue = asyncio.Queue()
+    query = make_stalk_query()
+    query.deadline = asyncio.get_running_loop().time() + 0.01
+    backend_queue.put_nowait(query)
+    await backend_queue.get()
+
+    await backend_master.handle_query(query, forward_queue, backend_queue, resources)
+
+    assert forward_queue.get_nowait() is query
+    assert isinstance(query.payload, Error)
+    assert "did not finish" in query.payload.content
+    assert resources.active_queries == {}
+    await resources.pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_failed_stalk_marks_its_progress_failed(monkeypatch):
+    from PykeBot2.backend import backend_master, progress
+    from PykeBot2.backend.stalker import battlefy
+    from PykeBot2.backend.worker_pool import WorkerPool
+    from PykeBot2.models.data_models import Error, Progress
+
+    async def failing_stream(url, session=None):
+        await asyncio.sleep(0.05)
+        raise ValueError("broken page")
+        yield
+
+    def quick_report_progress(stalk_progress, report):
+        return progress.report_progress(stalk_progress, report, first_delay=0, interval=0.01)
+
+    monkeypatch.setitem(
+        backend_master.stalker_to_streaming_stalker,
+        battlefy.stalk_battlefy_tournament,
+        failing_stream,
+    )
+    monkeypatch.setattr(backend_master, "report_progress", quick_report_progress)
+    resources = backend_master.BackendResources(WorkerPool(2, {"battlefy": 1}))
+    forward_queue = asyncio.Queue()
+    query = make_stalk_query()
+
+    await backend_master.stalk_query(query, forward_queue, resources)
+
+    assert isinstance(query.payload, Error)
+    reports = [forward_queue.get_nowait().payload for _ in range(forward_queue.qsize())]
+    assert all(isinstance(report, Progress) for report in reports)
+    assert reports[-1].finished
+    assert reports[-1].content.startswith("Failed after")
+    await resources.pool.shutdown()
@@ -0,0 +1,28 @@
+import bs4
+
+
+page = """
+<html><head><title>Team « League Teams « Prime League</title></head>
+<body><div class="TierRank"> Gold 2 </div><a href="/teams/1">Team</a><p>text</p></body></html>
+"""
+
+
+def test_parsers_agree():
+    from PykeBot2.backend.html_parsing import parse_html, parser_features
+
+    fast = parse_html(page)
+    fallback = parse_html(page, features="html.parser")
+
+    assert parser_features in {"lxml", "html.parser"}
+    assert fast.title.text == fallback.title.text
+    assert fast.find("div", class_="TierRank").text == fallback.find("div", class_="TierRank").text
+
+
+def test_strainer_only_parses_matching_elements():
+    from PykeBot2.backend.html_parsing import links_only, parse_html
+
+    soup = parse_html(page, parse_only=links_only)
+
+    assert [link["href"] for link in soup.find_all("a", href=True)] == ["/teams/1"]
+    assert soup.find("p") is None
+    assert parse_html(page, parse_only=bs4.SoupStrainer("div", class_="TierRank")).find("div").text.strip() == "Gold 2"
@@ -0,0 +1,67 @@
+import asyncio
+import aiohttp
+import pytest
+from tests.fake_http import FakeResponse, FakeSession
+
+
+@pytest.mark.asyncio
+async def test_fetch_text_retries_temporary_failures():
+    from PykeBot2.backend.http_client import fetch_text
+
+    session = FakeSession(
+        [
+            aiohttp.ClientConnectionError(),
+            FakeResponse(503, "busy"),
+            FakeResponse(200, "page"),
+        ]
+    )
+
+    assert await fetch_text(session, "url", retries=3, backoff=0) == "page"
+    assert session.requests == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_text_gives_up_after_retries():
+    from PykeBot2.backend.http_client import fetch_text
+
+    session = FakeSession([asyncio.TimeoutError(), asyncio.TimeoutError()])
+    with pytest.raises(asyncio.TimeoutError):
+        await fetch_text(session, "url", retries=1, backoff=0)
+
+    # other status codes are not repeated
+    session = FakeSession([FakeResponse(404, "missing")])
+    assert await fetch_text(session, "url", retries=3, backoff=0) == "missing"
+
+
+@pytest.mark.asyncio
+async def test_fetch_text_raises_on_persistent_retryable_status():
+    from PykeBot2.backend.http_client import fetch_text
+    from PykeBot2.models.errors import ServerErrorResponseError
+
+    session = FakeSession([FakeResponse(503, "busy"), FakeResponse(502, "bad gateway")])
+    with pytest.raises(ServerErrorResponseError):
+        await fetch_text(session, "url", retries=1, backoff=0)
+    assert session.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_fetch_text_waits_for_retry_after(monkeypatch):
+    from PykeBot2.backend import http_client
+
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(http_client.asyncio, "sleep", fake_sleep)
+    session = FakeSession(
+        [
+            FakeResponse(429, "slow down", {"Retry-After": "7"}),
+            FakeResponse(429, "slow down", {"Retry-After": "soon"}),
+            FakeResponse(200, "page"),
+        ]
+    )
+
+    assert await http_client.fetch_text(session, "url", retries=3, backoff=0.5) == "page"
+    # an unreadable Retry-After falls back to the backoff
+    assert delays == [7.0, 1.0]
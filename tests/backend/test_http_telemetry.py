@@ -0,0 +1,73 @@
+import aiohttp
+import pytest
+from aiohttp import web
+
+
+async def start_server():
+    async def page(request):
+        return web.Response(text="x" * 1000)
+
+    async def missing(request):
+        return web.Response(status=404, text="missing")
+
+    app = web.Application()
+    app.router.add_get("/page", page)
+    app.router.add_get("/missing", missing)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+@pytest.mark.asyncio
+async def test_telemetry_records_phases_statuses_and_reuse():
+    from PykeBot2.backend.http_telemetry import HttpTelemetry
+
+    telemetry = HttpTelemetry()
+    runner, base_url = await start_server()
+    try:
+        trace_configs = [telemetry.trace_config()]
+        async with aiohttp.ClientSession(trace_configs=trace_configs) as session:
+            for _ in range(3):
+                async with session.get(f"{base_url}/page") as response:
+                    assert len(await response.text()) == 1000
+            async with session.get(f"{base_url}/missing") as response:
+                await response.read()
+            with pytest.raises(aiohttp.ClientError):
+                await session.get("http://127.0.0.1:1/refused")
+    finally:
+        await runner.cleanup()
+
+    stats = telemetry.snapshot()["127.0.0.1"]
+    assert stats["requests"] == 5
+    assert stats["errors"] == 1
+    assert stats["bytes"] == 3 * 1000 + len("missing")
+    # the first request opened the connection, the others reused it
+    assert stats["reuse_ratio"] == pytest.approx(3 / 4)
+    assert telemetry.responses.get(host="127.0.0.1", status="404") == 1
+    for phase in ("connect", "ttfb", "transfer", "total"):
+        assert f"{phase}_p95" in stats
+    assert telemetry.phase_seconds.count(host="127.0.0.1", phase="total") == 4
+    assert "127.0.0.1: 5 requests, 1 errors" in telemetry.summary()
+
+
+@pytest.mark.asyncio
+async def test_shared_sessions_report_to_the_telemetry():
+    from PykeBot2.backend import http_client
+    from PykeBot2.backend.http_telemetry import telemetry
+    from PykeBot2.query_metrics import registry
+
+    runner, base_url = await start_server()
+    before = telemetry.phase_seconds.count(host="127.0.0.1", phase="total")
+    try:
+        session = http_client.create_session()
+        assert len(await http_client.fetch_text(session, f"{base_url}/page")) == 1000
+        await http_client.close_session(session)
+    finally:
+        await runner.cleanup()
+
+    assert telemetry.phase_seconds.count(host="127.0.0.1", phase="total") == before + 1
+    # exported with the query metrics
+    assert 'pykebot_http_responses_total{host="127.0.0.1",status="200"}' in registry.render()
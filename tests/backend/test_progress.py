@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_progress_extrapolates_teams_and_estimates_time_left():
+    from PykeBot2.backend.progress import StalkProgress
+    from PykeBot2.backend.stalker.streaming import StalkUpdate
+    from PykeBot2.models.data_models import Team, TeamList, TeamListList
+
+    clock = FakeClock()
+    progress = StalkProgress(clock, rate_window=30)
+
+    clock.now = 10
+    group = TeamList("group 1", [Team(str(i), []) for i in range(8)])
+    progress.update_stalk(StalkUpdate(group, TeamListList([group]), 1, 4))
+
+    assert progress.teams_done == 8
+    assert progress.teams_total == 32
+    # one of four groups took 10 seconds
+    assert progress.eta() == pytest.approx(30)
+    assert str(progress) == (
+        "Stalking: teams 8/32, 0.8 requests/s, about 30s left"
+    )
+
+
+def test_progress_eta_respects_the_rate_limit():
+    from PykeBot2.backend.progress import StalkProgress
+
+    clock = FakeClock()
+    progress = StalkProgress(clock, rate_window=30)
+    requests = 0
+    progress.start_players(100, lambda: requests, player_rate_limit=1)
+
+    # the first players came from the rank store, far faster than the limit allows
+    for _ in range(10):
+        clock.now += 0.1
+        progress.player_finished()
+
+    assert progress.eta() == pytest.approx(90)
+    assert progress.render(finished=True) == "Finished in 1s: teams 0, players 10/100"
+    assert (
+        progress.render(finished=True, stopped=True)
+        == "Stopped after 1s: teams 0, players 10/100"
+    )
+    assert (
+        progress.render(finished=True, failed=True)
+        == "Failed after 1s: teams 0, players 10/100"
+    )
+
+
+@pytest.mark.asyncio
+async def test_report_progress_is_throttled_and_marks_the_last_report():
+    from PykeBot2.backend.progress import StalkProgress, report_progress
+
+    reports = []
+    reporter = asyncio.ensure_future(
+        report_progress(
+            StalkProgress(),
+            lambda content, finished: reports.append(finished),
+            first_delay=0.01,
+            interval=0.05,
+        )
+    )
+    await asyncio.sleep(0.08)
+    reporter.cancel()
+    await asyncio.gather(reporter, return_exceptions=True)
+
+    assert reports == [False, False, True]
+
+
+@pytest.mark.asyncio
+async def test_quick_stalks_are_not_reported():
+    from PykeBot2.backend.progress import StalkProgress, report_progress
+
+    reports = []
+    reporter = asyncio.ensure_future(
+        report_progress(StalkProgress(), lambda *report: reports.append(report), 1, 1)
+    )
+    await asyncio.sleep(0)
+    reporter.cancel()
+    await asyncio.gather(reporter, return_exceptions=True)
+
+    assert reports == []
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_rank_store_respects_max_age():
+    from PykeBot2.backend.rank_store import RankStore
+
+    now = 1000.0
+    rank_store = RankStore(":memory:", max_age=100, clock=lambda: now)
+    await rank_store.open()
+
+    assert await rank_store.get_rank("UFF NiceToMeetMe") is None
+    await rank_store.put_rank("UFF NiceToMeetMe", "gold 1", 20)
+
+    # names are normalized
+    assert await rank_store.get_rank("uffnicetomeetme") == ("gold 1", 20)
+
+    now = 1200.0
+    assert await rank_store.get_rank("UFF NiceToMeetMe") is None
+
+    await rank_store.close()
+
+
+@pytest.mark.asyncio
+async def test_stored_rank_is_used_before_stalking():
+    from PykeBot2.backend.rank_store import RankStore
+    from PykeBot2.backend.stalker import op_gg_rank, riot_api_rank
+    from PykeBot2.models.data_models import Player
+
+    rank_store = RankStore(":memory:")
+    await rank_store.open()
+    await rank_store.put_rank("UFF NiceToMeetMe", "platinum 1")
+
+    # both calls would fail without network access if the store was not consulted
+    player = Player("UFF NiceToMeetMe")
+    await op_gg_rank.add_player_rank(player, rank_store=rank_store)
+    assert str(player.rank) == "Platinum 1"
+
+    player = Player("UFF NiceToMeetMe")
+    await riot_api_rank.add_player_rank(player, "no token", rank_store=rank_store)
+    assert str(player.rank) == "Platinum 1"
+
+    await rank_store.close()
@@ -0,0 +1,46 @@
+def create_team_list(name: str, team_count: int):
+    from PykeBot2.models.data_models import TeamList, Team, Player
+
+    teams = [
+        Team(f"Team {i}", [Player(f"Player {i} {j}") for j in range(5)])
+        for i in range(team_count)
+    ]
+    return TeamList(name, teams)
+
+
+def test_result_cache_expires_per_platform():
+    from PykeBot2.backend.result_cache import ResultCache
+
+    now = 0.0
+    cache = ResultCache(10 ** 6, {"battlefy": 10}, 100, clock=lambda: now)
+    cache.put("battlefy", "battlefy", create_team_list("a", 1), set())
+    cache.put("toornament", "toornament", create_team_list("b", 1), {"flag"})
+
+    now = 5.0
+    assert cache.get("battlefy") is not None
+    assert cache.get("toornament")[1] == {"flag"}
+
+    now = 50.0
+    assert cache.get("battlefy") is None
+    assert cache.get("toornament") is not None
+
+
+def test_result_cache_evicts_least_recently_used():
+    from PykeBot2.backend.result_cache import ResultCache, estimate_payload_size
+
+    team_list_size = estimate_payload_size(create_team_list("a", 5))
+    cache = ResultCache(team_list_size * 2 + 1, {}, 100)
+    cache.put("a", "", create_team_list("a", 5), set())
+    cache.put("b", "", create_team_list("b", 5), set())
+    # a is now the most recently used entry
+    cache.get("a")
+    cache.put("c", "", create_team_list("c", 5), set())
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.size <= cache.max_bytes
+
+    # entries larger than the whole budget are skipped
+    cache.put("d", "", create_team_list("d", 50), set())
+    assert cache.get("d") is None
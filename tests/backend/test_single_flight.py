@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_single_flight_joins_running_work():
+    from PykeBot2.backend.single_flight import SingleFlight
+
+    in_flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    waiters = [
+        asyncio.ensure_future(in_flight.run("key", work)) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    assert in_flight.in_flight("key")
+
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert results == ["result"] * 3
+    assert calls == 1
+    assert not in_flight.in_flight("key")
+
+    # finished work is not reused
+    await in_flight.run("key", work)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    from PykeBot2.backend.single_flight import SingleFlight
+
+    in_flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0)
+        raise ValueError("broken")
+
+    results = await asyncio.gather(
+        in_flight.run("key", work), in_flight.run("key", work), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_canonicalize_url():
+    from PykeBot2.backend.backend_master import canonicalize_url
+
+    assert canonicalize_url(
+        "HTTPS://www.PrimeLeague.gg/de/leagues/prm/1457-spring-split-2020/#top"
+    ) == canonicalize_url("https://www.primeleague.gg/de/leagues/prm/1457-spring-split-2020")
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_work_without_waiters():
+    from PykeBot2.backend.single_flight import SingleFlight
+
+    in_flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    first = asyncio.ensure_future(in_flight.run("key", work))
+    second = asyncio.ensure_future(in_flight.run("key", work))
+    await started.wait()
+
+    # the work keeps running while another caller waits for it
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+    assert in_flight.in_flight("key")
+
+    second.cancel()
+    await asyncio.gather(second, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await asyncio.sleep(0)
+    assert not in_flight.in_flight("key")
+    assert in_flight.waiters == {}
@@ -0,0 +1,216 @@
+import asyncio
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_respects_limit():
+    from PykeBot2.backend.worker_pool import WorkerPool
+
+    pool = WorkerPool(2)
+    running = 0
+    max_running = 0
+
+    async def job():
+        nonlocal running, max_running
+        async with pool.slot():
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    tasks = [pool.submit(job()) for _ in range(6)]
+    await asyncio.gather(*tasks)
+
+    assert max_running == 2
+    assert pool.active == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_slow_task_does_not_block():
+    from PykeBot2.backend.worker_pool import WorkerPool
+
+    pool = WorkerPool(2)
+    slow_started = asyncio.Event()
+    finished = []
+
+    async def slow():
+        async with pool.slot():
+            slow_started.set()
+            await asyncio.sleep(10)
+
+    async def fast():
+        async with pool.slot():
+            finished.append("fast")
+
+    pool.submit(slow())
+    await slow_started.wait()
+    await pool.submit(fast())
+
+    assert finished == ["fast"]
+    await pool.shutdown()
+    assert pool.active == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_busy_lane_does_not_starve_other_lanes():
+    from PykeBot2.backend.worker_pool import WorkerPool
+
+    pool = WorkerPool(3, {"heavy": 1, "light": 2})
+    heavy_started = asyncio.Event()
+    finished = []
+
+    async def heavy():
+        async with pool.slot("heavy"):
+            heavy_started.set()
+            await asyncio.sleep(10)
+
+    async def light():
+        async with pool.slot("light"):
+            finished.append("light")
+
+    heavy_tasks = [pool.submit(heavy()) for _ in range(5)]
+    await heavy_started.wait()
+    await asyncio.wait_for(asyncio.gather(*(pool.submit(light()) for _ in range(4))), 1)
+
+    assert finished == ["light"] * 4
+    await pool.shutdown()
+    assert all(task.cancelled() for task in heavy_tasks)
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_serves_cheap_queries_first():
+    from PykeBot2.backend.worker_pool import WorkerPool
+
+    pool = WorkerPool(1)
+    release = asyncio.Event()
+    order = []
+
+    async def job(name, priority):
+        async with pool.slot(priority=priority):
+            order.append(name)
+            await release.wait()
+
+    blocker = pool.submit(job("blocker", 0))
+    await asyncio.sleep(0)
+    tasks = [
+        pool.submit(job("season", 4)),
+        pool.submit(job("group", 2)),
+        pool.submit(job("cancelled", 0)),
+        pool.submit(job("team", 1)),
+    ]
+    await asyncio.sleep(0)
+    tasks[2].cancel()
+    release.set()
+    await asyncio.gather(blocker, *tasks, return_exceptions=True)
+
+    assert order == ["blocker", "team", "group", "season"]
+    assert not pool.semaphore.locked()
+
+
+@pytest.mark.asyncio
+async def test_backend_loop_forwards_errors_and_marks_done(monkeypatch):
+    from PykeBot2.backend import backend_master
+    from PykeBot2.models.data_models import Error
+    from PykeBot2.models.query import Query
+
+    forward_queue = asyncio.Queue()
+    backend_queue = asyncio.Queue()
+
+    async def broken_stalk(query, forward_queue, resources):
+        raise ValueError("broken")
+
+    monkeypatch.setattr(backend_master, "stalk_query", broken_stalk)
+
+    backend = asyncio.ensure_future(
+        backend_master.backend_loop(forward_queue, backend_queue)
+    )
+    query = Query("discord", "backend", "stalk", raw_command=".pb stalk broken")
+    backend_queue.put_nowait(query)
+
+    forwarded = await asyncio.wait_for(forward_queue.get(), 1)
+    await asyncio.wait_for(backend_queue.join(), 1)
+
+    assert forwarded is query
+    assert isinstance(query.payload, Error)
+    assert query.forward_to == "frontend"
+
+    backend.cancel()
+    await asyncio.gather(backend, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_limits_concurrency_and_keeps_order():
+    from PykeBot2.backend.worker_pool import map_bounded
+
+    running = 0
+    max_running = 0
+
+    async def work(item):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # uneven durations, so workers pick up items out of order
+        for _ in range(item % 3):
+            await asyncio.sleep(0)
+        running -= 1
+        return item * 2
+
+    results = await map_bounded(work, range(20), 4)
+
+    assert results == [item * 2 for item in range(20)]
+    assert max_running == 4
+
+
+@pytest.mark.asyncio
+async def test_map_bounded_cancels_remaining_work_on_error():
+    from PykeBot2.backend.worker_pool import map_bounded
+
+    started = []
+
+    async def work(item):
+        started.append(item)
+        await asyncio.sleep(0)
+        if item == 1:
+            raise ValueError("broken")
+        await asyncio.sleep(1)
+
+    with pytest.raises(ValueError):
+        await map_bounded(work, range(10), 2)
+    assert len(started) < 10
+
+
+@pytest.mark.asyncio
+async def test_iter_bounded_yields_in_completion_order():
+    from PykeBot2.backend.worker_pool import iter_bounded
+
+    async def work(item):
+        # later items finish first
+        for _ in range(5 - item):
+            await asyncio.sleep(0)
+        return item * 2
+
+    finished = [pair async for pair in iter_bounded(work, range(5), 5)]
+
+    assert finished == [(index, index * 2) for index in reversed(range(5))]
+
+
+@pytest.mark.asyncio
+async def test_iter_bounded_cancels_remaining_work_when_stopped_early():
+    from PykeBot2.backend.worker_pool import iter_bounded
+
+    cancelled = []
+
+    async def work(item):
+        if item == 0:
+            return item
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+
+    results = iter_bounded(work, range(3), 3)
+    assert await results.__anext__() == (0, 0)
+    await results.aclose()
+
+    assert sorted(cancelled) == [1, 2]
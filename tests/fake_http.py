@@ -0,0 +1,73 @@
+"""
+Fake aiohttp responses and sessions shared by the tests of the stalkers and the http client.
+
+:author: Jonathan Decker
+"""
+
+import json
+
+
+class FakeResponse:
+    """
+    A response with the given status, body and headers, usable as "async with session.get(url) as response".
+    A str body is returned as text, any other body is served as json.
+    """
+
+    def __init__(self, status: int = 200, body="", headers: dict = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def text(self):
+        if isinstance(self.body, str):
+            return self.body
+        return json.dumps(self.body)
+
+    async def json(self):
+        if isinstance(self.body, str):
+            return json.loads(self.body)
+        return self.body
+
+    async def read(self):
+        return (await self.text()).encode()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """
+    Answers requests and records every requested url.
+    Outcomes are either a list answering the requests in order or a dict answering them by url,
+    urls missing from the dict are answered with default if given.
+    An outcome can be a FakeResponse, a body answered with status 200 or an exception that is raised instead.
+    Subclasses can answer by overriding respond.
+    """
+
+    def __init__(self, outcomes=None, default=None):
+        self.outcomes = outcomes if outcomes is not None else []
+        self.default = default
+        self.requested = []
+
+    @property
+    def requests(self) -> int:
+        return len(self.requested)
+
+    def respond(self, url: str, **kwargs):
+        if isinstance(self.outcomes, dict):
+            if url not in self.outcomes and self.default is not None:
+                return self.default
+            return self.outcomes[url]
+        return self.outcomes.pop(0)
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        outcome = self.respond(url, **kwargs)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if not isinstance(outcome, FakeResponse):
+            outcome = FakeResponse(200, outcome)
+        return outcome
@@ -0,0 +1,38 @@
+from PykeBot2.frontend.command_interpreter import determine_priority, interpret_command
+from PykeBot2.models.lookup_tables import (
+    group_priority,
+    interactive_priority,
+    large_priority,
+    team_priority,
+)
+from PykeBot2.models.query import Query
+
+season_url = "https://www.primeleague.gg/leagues/prm/1457-spring-split-2020"
+group_url = season_url + "/group/509-gruppenphase/participants"
+team_url = "https://www.primeleague.gg/leagues/teams/123-team"
+
+
+def test_determine_priority():
+    assert determine_priority(team_url, set()) == team_priority
+    assert determine_priority(group_url, set()) == group_priority
+    assert determine_priority(season_url, set()) == large_priority
+    assert determine_priority(team_url, {"rank"}) == team_priority + 1
+    assert determine_priority(season_url, {"ranks"}) == large_priority + 1
+
+
+def test_interpret_command_sets_priority():
+    query = Query("discord", "frontend", "interpret", raw_command=f".pb stalk rank {team_url}")
+    interpret_command(query)
+    assert query.next_step == "stalk"
+    assert query.priority == team_priority + 1
+
+    query = Query("discord", "frontend", "interpret", raw_command=".pb help")
+    interpret_command(query)
+    assert query.priority == interactive_priority
+
+
+def test_interpret_cancel_command():
+    query = Query("discord", "frontend", "interpret", raw_command=".pb cancel")
+    interpret_command(query)
+    assert query.forward_to == "backend"
+    assert query.next_step == "cancel"
@@ -0,0 +1,31 @@
+def test_partial_results_skip_ranks_and_streamed_results_are_summarized():
+    from PykeBot2.frontend.output_formatter import format_payload
+    from PykeBot2.models.data_models import Team, TeamList
+    from PykeBot2.models.lookup_tables import partial_flag_lookup, streamed_flag_lookup
+    from PykeBot2.models.query import Query
+
+    team_list = TeamList("cup", [Team("a", [])])
+
+    partial = Query(
+        "discord", "frontend", "format", flags=set(partial_flag_lookup), payload=team_list
+    )
+    format_payload(partial)
+    assert partial.output_message == team_list.discord_str()
+    assert partial.next_step == "display"
+
+    final = Query(
+        "discord", "frontend", "format", flags=set(streamed_flag_lookup), payload=team_list
+    )
+    format_payload(final)
+    assert final.output_message == "Finished stalking cup with 1 teams."
+
+    # ranked results differ from their parts and are sent in full
+    ranked = Query(
+        "discord",
+        "frontend",
+        "format",
+        flags={"rank", *streamed_flag_lookup},
+        payload=team_list,
+    )
+    format_payload(ranked)
+    assert ranked.output_message == team_list.discord_extended_str()
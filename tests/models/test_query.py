@@ -3,3 +3,14 @@ from PykeBot2.models.query import Query
 
 def test_query():
     query = Query("", "fronted", "display")
+
+
+def test_query_mark_keeps_stages_in_order():
+    query = Query("discord", "frontend", "interpret")
+    query.mark("received", 10.0)
+    query.mark("interpreted", 10.5)
+    # a stalk that was already running before the query joined it
+    query.mark("stalk_end", 3.0)
+    query.mark("unknown_stage", 20.0)
+
+    assert query.timestamps == {"received": 10.0, "interpreted": 10.5, "stalk_end": 10.5}
@@ -0,0 +1,156 @@
+import threading
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+        self.broken = False
+
+    @property
+    def current_url(self):
+        if self.broken:
+            raise WebDriverException("browser died")
+        return "about:blank"
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_pool_reuses_and_recycles_drivers():
+    from PykeBot2.gecko_manager import DriverPool
+
+    started = []
+
+    def factory():
+        started.append(FakeDriver())
+        return started[-1]
+
+    pool = DriverPool(max_size=2, max_pages=2, factory=factory)
+    pool.warm_up(1)
+    assert len(started) == 1
+
+    with pool.driver() as driver:
+        assert driver is started[0]
+    with pool.driver() as driver:
+        assert driver is started[0]
+
+    # the driver reached max_pages and was replaced
+    assert started[0].quit_called
+    with pool.driver() as driver:
+        assert driver is started[1]
+    assert len(started) == 2
+
+    pool.close()
+    assert started[1].quit_called
+
+
+def test_pool_replaces_broken_drivers():
+    from PykeBot2.gecko_manager import DriverPool
+
+    started = []
+
+    def factory():
+        started.append(FakeDriver())
+        return started[-1]
+
+    pool = DriverPool(max_size=1, max_pages=10, factory=factory)
+    pool.warm_up()
+    started[0].broken = True
+
+    driver = pool.acquire()
+    assert driver is started[1]
+    assert started[0].quit_called
+
+    # a driver failing during use is not given back
+    pool.release(driver)
+    with pytest.raises(WebDriverException):
+        with pool.driver() as driver:
+            raise WebDriverException("page crashed")
+    assert started[1].quit_called
+    assert pool.size == 0
+
+
+def test_pool_waits_when_full():
+    from PykeBot2.gecko_manager import DriverPool
+
+    pool = DriverPool(max_size=1, max_pages=10, factory=FakeDriver)
+    driver = pool.acquire()
+
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+
+    threading.Timer(0.01, pool.release, [driver]).start()
+    assert pool.acquire(timeout=5) is driver
+
+
+def test_pool_abort_frees_the_place_of_a_driver_in_use():
+    from PykeBot2.gecko_manager import DriverPool
+
+    pool = DriverPool(max_size=1, max_pages=10, factory=FakeDriver)
+    driver = pool.acquire()
+
+    pool.abort(driver)
+    assert driver.quit_called
+    assert pool.size == 0
+
+    # giving the aborted driver back does not return it to the pool
+    pool.release(driver)
+    replacement = pool.acquire(timeout=1)
+    assert replacement is not driver
+
+
+def test_driver_path_is_cached_on_disk(tmp_path, monkeypatch):
+    from PykeBot2 import gecko_manager
+
+    driver_file = tmp_path / "geckodriver"
+    driver_file.write_text("")
+    cache_file = tmp_path / "geckodriver_path.txt"
+    cache_file.write_text(str(driver_file))
+
+    class OfflineManager:
+        def install(self):
+            raise AssertionError("the driver mirror must not be contacted")
+
+    monkeypatch.setattr(gecko_manager, "_driver_path", None)
+    monkeypatch.setattr(gecko_manager, "GeckoDriverManager", OfflineManager)
+
+    assert gecko_manager.resolve_driver_path(cache_file) == str(driver_file)
+
+
+@pytest.mark.asyncio
+async def test_browser_work_does_not_block_the_loop(monkeypatch):
+    import asyncio
+    import time
+    from PykeBot2 import gecko_manager
+
+    monkeypatch.setattr(
+        gecko_manager, "_driver_pool", gecko_manager.DriverPool(factory=FakeDriver)
+    )
+
+    def slow_page_load(driver, link):
+        time.sleep(0.2)
+        return f"source of {link}"
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.ensure_future(ticker())
+    try:
+        result = await gecko_manager.run_in_browser(slow_page_load, "link")
+    finally:
+        ticker_task.cancel()
+        gecko_manager.close_driver_pool()
+
+    assert result == "source of link"
+    # the loop kept running while the browser worked
+    assert ticks >= 5
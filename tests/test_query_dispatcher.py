@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from PykeBot2.models.errors import InvalidForwardToError, InvalidNextStepError
+from PykeBot2.models.query import Query
+
+
+def make_dispatcher():
+    from PykeBot2.frontend.frontend_master import run_frontend_step
+    from PykeBot2.query_dispatcher import QueryDispatcher
+
+    dispatcher = QueryDispatcher()
+    backend_queue = asyncio.Queue()
+    discord_queue = asyncio.Queue()
+    dispatcher.register_handler(
+        "frontend", {"interpret", "format", "display"}, run_frontend_step
+    )
+    dispatcher.register_queue("backend", {"stalk", "cancel"}, backend_queue)
+    dispatcher.register_queue("discord", {"display"}, discord_queue)
+    return dispatcher, backend_queue, discord_queue
+
+
+def test_dispatcher_validates_routes_at_registration():
+    from PykeBot2.query_dispatcher import QueryDispatcher
+
+    dispatcher = QueryDispatcher()
+    with pytest.raises(InvalidForwardToError):
+        dispatcher.register_queue("nowhere", {"stalk"}, asyncio.Queue())
+    with pytest.raises(InvalidNextStepError):
+        dispatcher.register_queue("backend", {"jump"}, asyncio.Queue())
+
+    dispatcher.register_queue("backend", {"stalk"}, asyncio.Queue())
+    with pytest.raises(ValueError):
+        dispatcher.register_handler("backend", {"stalk"}, lambda query: True)
+
+
+def test_dispatcher_runs_handlers_until_a_queue():
+    dispatcher, backend_queue, discord_queue = make_dispatcher()
+
+    help_query = Query("discord", "frontend", "interpret", raw_command=".pb help")
+    dispatcher.put_nowait(help_query)
+
+    # interpreted, formatted and displayed without waiting in a queue
+    assert discord_queue.get_nowait() is help_query
+    assert "help" in help_query.output_message
+    assert backend_queue.empty()
+
+    stalk_query = Query(
+        "discord",
+        "frontend",
+        "interpret",
+        raw_command=".pb stalk https://battlefy.com/org/cup/123/info",
+    )
+    dispatcher.put_nowait(stalk_query)
+    assert backend_queue.get_nowait() is stalk_query
+    assert discord_queue.empty()
+
+
+def test_dispatcher_discards_unroutable_queries():
+    dispatcher, backend_queue, discord_queue = make_dispatcher()
+
+    # queries without a route or with a failing handler are dropped instead of stopping the caller
+    dispatcher.put_nowait(Query("discord", "backend", "query_db"))
+    dispatcher.put_nowait(Query("cli", "frontend", "display"))
+
+    broken = Query("discord", "frontend", "interpret", raw_command=None)
+    dispatcher.put_nowait(broken)
+
+    assert backend_queue.empty()
+    assert discord_queue.empty()
@@ -0,0 +1,44 @@
+from PykeBot2.models.data_models import Error
+from PykeBot2.models.query import Query
+
+
+def test_record_query_observes_every_stage():
+    from PykeBot2 import query_metrics
+
+    query = Query(
+        "discord",
+        "frontend",
+        "interpret",
+        raw_command=".pb scrape rank https://battlefy.com/org/cup/123/info",
+    )
+    for stage, at in [
+        ("received", 10.0),
+        ("interpreted", 10.1),
+        ("stalk_start", 10.2),
+        ("stalk_end", 14.2),
+        ("formatted", 14.3),
+        ("sent", 15.0),
+    ]:
+        query.mark(stage, at)
+    query.payload = Error("broken")
+    labels = {"command": "stalk", "platform": "battlefy"}
+    before = query_metrics.query_seconds.count(**labels)
+
+    query_metrics.record_query(query)
+
+    assert query_metrics.query_seconds.count(**labels) == before + 1
+    assert query_metrics.stage_seconds.count(stage="stalk_end", **labels) >= 1
+    assert query_metrics.stage_seconds.count(stage="received", **labels) == 0
+    assert query_metrics.queries_total.get(outcome="error", **labels) >= 1
+
+
+def test_record_query_skips_additional_messages():
+    from PykeBot2 import query_metrics
+
+    query = Query("discord", "frontend", "format")
+    query.mark("sent")
+    before = query_metrics.registry.render()
+
+    query_metrics.record_query(query)
+
+    assert query_metrics.registry.render() == before
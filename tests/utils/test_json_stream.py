@@ -0,0 +1,52 @@
+import json
+import pytest
+from PykeBot2.utils.json_stream import iter_json_array
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+teams = [
+    {"name": "Team Ä", "players": [{"inGameName": "Spieler Ö"}, {"inGameName": "B"}]},
+    {"name": "Team [2]", "players": []},
+    12345,
+    "text, with ] and }",
+    None,
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 100000])
+async def test_elements_are_decoded_for_any_chunk_size(size):
+    data = json.dumps(teams, ensure_ascii=False, indent=2).encode()
+
+    decoded = [element async for element in iter_json_array(chunked(data, size))]
+
+    assert decoded == teams
+
+
+@pytest.mark.asyncio
+async def test_elements_arrive_before_the_document_ends():
+    received = []
+
+    async def slow_chunks():
+        yield b'[{"name": "first"},'
+        # the first element is available before the rest of the document was read
+        assert received == [{"name": "first"}]
+        yield b' {"name": "second"}]'
+
+    async for element in iter_json_array(slow_chunks()):
+        received.append(element)
+
+    assert received == [{"name": "first"}, {"name": "second"}]
+
+
+@pytest.mark.asyncio
+async def test_invalid_documents_are_rejected():
+    with pytest.raises(ValueError):
+        [element async for element in iter_json_array(chunked(b'{"error": 1}', 4))]
+    with pytest.raises(ValueError):
+        [element async for element in iter_json_array(chunked(b'[{"name": 1}, {"na', 4))]
+    assert [element async for element in iter_json_array(chunked(b" [ ] ", 1))] == []
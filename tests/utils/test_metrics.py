@@ -0,0 +1,91 @@
+import aiohttp
+import pytest
+from PykeBot2.utils.metrics import Counter, Gauge, Histogram, MetricsRegistry, start_metrics_server
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("queries_total", "Queries.", ("command",)))
+    gauge = registry.register(Gauge("queue_depth", "Depth.", ("queue",)))
+    histogram = registry.register(
+        Histogram("query_seconds", "Latency.", ("command",), buckets=(0.1, 1))
+    )
+    return registry, counter, gauge, histogram
+
+
+def test_metrics_render_the_text_format():
+    registry, counter, gauge, histogram = make_registry()
+    counter.inc(command="stalk")
+    counter.inc(2, command='say "hi"')
+    depth = [3]
+    gauge.set_function(lambda: depth[0], queue="backend")
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, command="stalk")
+    depth[0] = 4
+
+    assert registry.render() == (
+        "# HELP queries_total Queries.\n"
+        "# TYPE queries_total counter\n"
+        'queries_total{command="stalk"} 1\n'
+        'queries_total{command="say \\"hi\\""} 2\n'
+        "# HELP queue_depth Depth.\n"
+        "# TYPE queue_depth gauge\n"
+        'queue_depth{queue="backend"} 4\n'
+        "# HELP query_seconds Latency.\n"
+        "# TYPE query_seconds histogram\n"
+        'query_seconds_bucket{command="stalk",le="0.1"} 1\n'
+        'query_seconds_bucket{command="stalk",le="1"} 2\n'
+        'query_seconds_bucket{command="stalk",le="+Inf"} 3\n'
+        'query_seconds_sum{command="stalk"} 5.55\n'
+        'query_seconds_count{command="stalk"} 3\n'
+    )
+    assert histogram.quantile(0.5, command="stalk") == 1
+    assert histogram.quantile(0.95, command="stalk") == float("inf")
+    assert histogram.quantile(0.5, command="help") is None
+
+
+def test_metrics_check_labels():
+    registry, counter, gauge, histogram = make_registry()
+    with pytest.raises(ValueError):
+        counter.inc(platform="battlefy")
+    with pytest.raises(ValueError):
+        registry.register(Counter("queries_total", "Again."))
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_the_registry():
+    registry, counter, gauge, histogram = make_registry()
+    counter.inc(command="help")
+    runner = await start_metrics_server(registry, "127.0.0.1", 0)
+    try:
+        host, port = runner.addresses[0][:2]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://{host}:{port}/metrics") as response:
+                assert response.status == 200
+                assert response.headers["Content-Type"].startswith("text/plain")
+                assert 'queries_total{command="help"} 1' in await response.text()
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_cleans_up_if_the_port_is_taken(monkeypatch):
+    from PykeBot2.utils import metrics
+
+    registry = make_registry()[0]
+    runner = await start_metrics_server(registry, "127.0.0.1", 0)
+    cleaned_up = []
+
+    class RecordingRunner(metrics.web.AppRunner):
+        async def cleanup(self):
+            cleaned_up.append(self)
+            await super().cleanup()
+
+    monkeypatch.setattr(metrics.web, "AppRunner", RecordingRunner)
+    try:
+        host, port = runner.addresses[0][:2]
+        with pytest.raises(OSError):
+            await start_metrics_server(registry, host, port)
+        assert len(cleaned_up) == 1
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from PykeBot2.models.query import Query
+from PykeBot2.utils.priority_queue import PriorityQueryQueue, aged_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_query(name: str, priority: int) -> Query:
+    return Query("discord", "backend", "stalk", raw_command=name, priority=priority)
+
+
+@pytest.mark.asyncio
+async def test_queue_serves_cheap_queries_first():
+    queue = PriorityQueryQueue(aging=10, clock=FakeClock())
+    for name, priority in [("season", 4), ("help", 0), ("group", 2), ("version", 0)]:
+        queue.put_nowait(make_query(name, priority))
+
+    served = [queue.get_nowait().raw_command for _ in range(queue.qsize())]
+
+    # queries of the same class keep their order
+    assert served == ["help", "version", "group", "season"]
+
+
+@pytest.mark.asyncio
+async def test_queue_ages_waiting_queries():
+    clock = FakeClock()
+    queue = PriorityQueryQueue(aging=10, clock=clock)
+    queue.put_nowait(make_query("season", 4))
+    clock.now = 25
+    queue.put_nowait(make_query("team", 1))
+    clock.now = 45
+    queue.put_nowait(make_query("help", 0))
+
+    served = [queue.get_nowait().raw_command for _ in range(queue.qsize())]
+
+    assert served == ["team", "season", "help"]
+
+
+@pytest.mark.asyncio
+async def test_queue_keeps_the_queue_interface():
+    queue = PriorityQueryQueue()
+    getter = asyncio.ensure_future(queue.get())
+    await asyncio.sleep(0)
+    queue.put_nowait(make_query("help", 0))
+
+    assert (await asyncio.wait_for(getter, 1)).raw_command == "help"
+    queue.task_done()
+    await asyncio.wait_for(queue.join(), 1)
+
+
+def test_aged_key():
+    # a season stalk waiting for three aging intervals is served before a new team stalk
+    assert aged_key(4, now=0, aging=10) < aged_key(1, now=31, aging=10)
+    assert aged_key(4, now=0, aging=10) > aged_key(1, now=29, aging=10)